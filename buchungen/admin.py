@@ -1,5 +1,11 @@
-from django.contrib import admin
-from .models import Kunde, Raumtyp, Raum, Buchung, Belegungsprotokoll, Rechnung, Rechnungsposten
+from django import forms
+from django.contrib import admin, messages
+from django.utils import timezone
+from .exporte import streaming_antwort
+from .rechnungslauf import offene_buchungen, rechnungslauf
+from .rechnungsexport import zip_stream
+from .models import ExportierteRechnung, ExportWasserzeichen, Nummernkreis, Kunde, Raumtyp, Raum, Buchung, Belegungsnacht, Belegungsprotokoll, Rechnung, Rechnungsposten
+from .verfuegbarkeit import BLOCKIERENDE_STATUS
 
 
 @admin.register(Kunde)
@@ -28,18 +34,80 @@ class BelegungsprotokollInline(admin.TabularInline):
     extra = 1
 
 
+class BuchungAdminForm(forms.ModelForm):
+    class Meta:
+        model = Buchung
+        fields = '__all__'
+
+    def clean(self):
+        # An overlap would otherwise only surface as an IntegrityError from
+        # the unique (raum, datum) constraint on Belegungsnacht
+        cleaned_data = super().clean()
+        anreise = cleaned_data.get('anreise_datum')
+        abreise = cleaned_data.get('abreise_datum')
+        raum = cleaned_data.get('raum')
+        if anreise and abreise and abreise <= anreise:
+            raise forms.ValidationError('Das Abreisedatum muss nach dem Anreisedatum liegen.')
+        if (raum and anreise and abreise and cleaned_data.get('status') in BLOCKIERENDE_STATUS
+                and not raum.ist_verfuegbar(anreise, abreise, ausser_buchung=self.instance.pk)):
+            raise forms.ValidationError(
+                f'Der Raum {raum.nummer} ist für den gewählten Zeitraum nicht verfügbar.'
+            )
+        return cleaned_data
+
+
 @admin.register(Buchung)
 class BuchungAdmin(admin.ModelAdmin):
+    form = BuchungAdminForm
     list_display = ['buchungsnummer', 'kunde', 'raum', 'anreise_datum', 'abreise_datum', 'status', 'erstellt_am']
     list_filter = ['status', 'anreise_datum', 'erstellt_am']
     search_fields = ['buchungsnummer', 'kunde__vorname', 'kunde__nachname', 'raum__nummer']
-    readonly_fields = ['buchungsnummer', 'erstellt_am', 'aktualisiert_am', 'anzahl_naechte']
+    readonly_fields = ['buchungsnummer', 'erstellt_am', 'aktualisiert_am', 'anzahl_naechte', 'zusatzkosten_summe']
     inlines = [BelegungsprotokollInline]
+    actions = ['rechnungen_erstellen']
+    raw_id_fields = ['kunde']
     
     def save_model(self, request, obj, form, change):
         if not obj.pk:
             obj.erstellt_von = request.user
         super().save_model(request, obj, form, change)
+    
+    @admin.action(description='Rechnungen für ausgewählte Buchungen erstellen', permissions=['add_rechnung'])
+    def rechnungen_erstellen(self, request, queryset):
+        uebersprungen = list(
+            queryset.exclude(pk__in=offene_buchungen(buchungen=queryset).values('pk'))
+            .order_by('buchungsnummer').values_list('buchungsnummer', flat=True)
+        )
+        ergebnis = rechnungslauf(buchungen=queryset, benutzer=request.user)
+        if ergebnis:
+            summe = sum(betrag for _, _, betrag, _ in ergebnis)
+            self.message_user(request, f'{len(ergebnis)} Rechnungen über {summe:.2f} € erstellt.', messages.SUCCESS)
+        if uebersprungen:
+            self.message_user(
+                request,
+                f'{len(uebersprungen)} Buchungen übersprungen (nicht bestätigt, noch nicht abgereist '
+                f'oder bereits abgerechnet): {", ".join(uebersprungen)}',
+                messages.WARNING
+            )
+    
+    def has_add_rechnung_permission(self, request):
+        return request.user.has_perm('buchungen.add_rechnung')
+
+
+@admin.register(Belegungsnacht)
+class BelegungsnachtAdmin(admin.ModelAdmin):
+    list_display = ['datum', 'raum', 'buchung']
+    list_filter = ['raum']
+    date_hierarchy = 'datum'
+    search_fields = ['buchung__buchungsnummer', 'raum__nummer']
+    list_select_related = ['raum', 'buchung']
+
+    # Maintained by Buchung.save(), never edited by hand
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(Belegungsprotokoll)
@@ -48,6 +116,7 @@ class BelegungsprotokollAdmin(admin.ModelAdmin):
     list_filter = ['datum']
     search_fields = ['leistung', 'buchung__buchungsnummer']
     readonly_fields = ['gesamtbetrag']
+    raw_id_fields = ['buchung']
 
 
 class RechnungspostenInline(admin.TabularInline):
@@ -60,13 +129,22 @@ class RechnungAdmin(admin.ModelAdmin):
     list_display = ['rechnungsnummer', 'buchung', 'rechnungsdatum', 'faelligkeitsdatum', 'gesamtbetrag', 'status']
     list_filter = ['status', 'rechnungsdatum']
     search_fields = ['rechnungsnummer', 'buchung__buchungsnummer', 'buchung__kunde__nachname']
-    readonly_fields = ['rechnungsnummer', 'erstellt_am', 'aktualisiert_am']
+    readonly_fields = ['rechnungsnummer', 'gesamtbetrag', 'erstellt_am', 'aktualisiert_am']
     inlines = [RechnungspostenInline]
+    date_hierarchy = 'rechnungsdatum'
+    raw_id_fields = ['buchung']
+    actions = ['pdfs_exportieren']
     
     def save_model(self, request, obj, form, change):
         if not obj.pk:
             obj.erstellt_von = request.user
         super().save_model(request, obj, form, change)
+    
+    @admin.action(description='Ausgewählte Rechnungen als PDF (ZIP) herunterladen')
+    def pdfs_exportieren(self, request, queryset):
+        return streaming_antwort(
+            request, zip_stream(queryset), 'application/zip', f'Rechnungen_{timezone.localdate():%Y%m%d}.zip'
+        )
 
 
 @admin.register(Rechnungsposten)
@@ -74,3 +152,26 @@ class RechnungspostenAdmin(admin.ModelAdmin):
     list_display = ['rechnung', 'beschreibung', 'menge', 'einzelpreis', 'gesamtpreis']
     search_fields = ['beschreibung', 'rechnung__rechnungsnummer']
     readonly_fields = ['gesamtpreis']
+
+
+@admin.register(Nummernkreis)
+class NummernkreisAdmin(admin.ModelAdmin):
+    list_display = ['praefix', 'periode', 'letzte_nummer']
+    list_filter = ['praefix']
+    readonly_fields = ['praefix', 'periode', 'letzte_nummer']
+
+
+@admin.register(ExportWasserzeichen)
+class ExportWasserzeichenAdmin(admin.ModelAdmin):
+    list_display = ['name', 'aktualisiert_bis', 'id_bis', 'laeufe', 'offen_datei', 'exportiert_am']
+    readonly_fields = [
+        'name', 'aktualisiert_bis', 'id_bis', 'laeufe', 'offen_aktualisiert_bis', 'offen_id_bis', 'offen_datei',
+        'exportiert_am',
+    ]
+
+
+@admin.register(ExportierteRechnung)
+class ExportierteRechnungAdmin(admin.ModelAdmin):
+    list_display = ['rechnung', 'datei']
+    search_fields = ['rechnung__rechnungsnummer', 'datei']
+    readonly_fields = ['rechnung', 'datei', 'zeilen', 'storno']
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class BuchungenConfig(AppConfig):
     name = 'buchungen'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,129 @@
+"""Occupancy and revenue analytics - Auswertung
+
+Occupancy, average daily rate (ADR) and revenue per available room (RevPAR)
+per room, Raumtyp or in total, by month or year.
+
+The bookings overlapping the report range are loaded in one query into
+NumPy arrays, with dates as day numbers computed by the database (Django's
+per-row date conversion would cost more than the rest of the report),
+expanded to one element per sold night with vectorized operations and
+summed per (group, period) with ``np.bincount``; nothing loops over
+bookings or nights in Python.
+
+- available nights: active rooms x days of the period inside the range
+- sold nights: nights of confirmed bookings in active rooms
+- room revenue: sold nights x the current price per night of the Raumtyp,
+  extras from the Belegungsprotokoll are not room revenue
+- occupancy = sold / available, ADR = revenue / sold,
+  RevPAR = revenue / available
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Func, IntegerField
+
+from .models import Buchung, Raum
+
+GRUPPIERUNGEN = {'raum': 'Raum', 'raumtyp': 'Raumtyp', 'gesamt': 'Gesamt'}
+PERIODEN = {'monat': 'Monat', 'jahr': 'Jahr'}
+
+# Bookings that count as sold
+UMSATZ_STATUS = ['bestaetigt']
+
+SPALTEN = ('gruppe', 'periode', 'verfuegbar', 'verkauft', 'umsatz', 'auslastung', 'adr', 'revpar')
+
+
+class Tagnummer(Func):
+    """Days since 1970-01-01, the day count of numpy's datetime64[D]"""
+    output_field = IntegerField()
+    template = "(%(expressions)s - DATE '1970-01-01')"
+
+    def as_sqlite(self, compiler, connection, **extra):
+        return self.as_sql(
+            compiler, connection, template='CAST(julianday(%(expressions)s) - 2440587.5 AS INTEGER)', **extra
+        )
+
+    def as_mysql(self, compiler, connection, **extra):
+        return self.as_sql(compiler, connection, template="DATEDIFF(%(expressions)s, '1970-01-01')", **extra)
+
+
+def _perioden(von, bis, periode):
+    """Period boundaries within [von, bis) as datetime64[D], and their labels"""
+    einheit = 'M' if periode == 'monat' else 'Y'
+    anfaenge = np.arange(np.datetime64(von, einheit), np.datetime64(bis - timedelta(days=1), einheit) + 1)
+    grenzen = np.append(anfaenge, anfaenge[-1] + 1).astype('datetime64[D]')
+    grenzen = np.clip(grenzen, np.datetime64(von, 'D'), np.datetime64(bis, 'D'))
+    return grenzen, [str(anfang) for anfang in anfaenge]
+
+
+def _gruppen(raeume, gruppierung):
+    """Group index per room and the group labels"""
+    if gruppierung == 'raum':
+        return np.arange(len(raeume)), [raum.nummer for raum in raeume]
+    if gruppierung == 'raumtyp':
+        namen = list(dict.fromkeys(raum.raumtyp.name for raum in raeume))
+        nummer = {name: i for i, name in enumerate(namen)}
+        return np.array([nummer[raum.raumtyp.name] for raum in raeume], dtype=np.intp), namen
+    return np.zeros(len(raeume), dtype=np.intp), ['Gesamt']
+
+
+def _buchungen(raeume, von, bis):
+    """Room index, first night and number of nights of the sold bookings, clipped to [von, bis)"""
+    index = {raum.pk: i for i, raum in enumerate(raeume)}
+    zeilen = np.array(Buchung.objects.filter(
+        status__in=UMSATZ_STATUS,
+        raum__in=list(index),
+        anreise_datum__lt=bis,
+        abreise_datum__gt=von
+    ).order_by().values_list('raum_id', Tagnummer('anreise_datum'), Tagnummer('abreise_datum')), dtype=np.int64)
+    if not len(zeilen):
+        zeilen = np.zeros((0, 3), dtype=np.int64)
+    raum_ids = np.array(list(index), dtype=np.int64)
+    reihenfolge = np.argsort(raum_ids)
+    raum = reihenfolge[np.searchsorted(raum_ids, zeilen[:, 0], sorter=reihenfolge)]
+    start = np.maximum(zeilen[:, 1], np.datetime64(von, 'D').astype(np.int64))
+    ende = np.minimum(zeilen[:, 2], np.datetime64(bis, 'D').astype(np.int64))
+    return raum, start.astype('datetime64[D]'), ende - start
+
+
+def kennzahlen(von, bis, gruppierung='raumtyp', periode='monat'):
+    """Report rows for [von, bis), one per group and period, groups in room order"""
+    if bis <= von:
+        return []
+    raeume = list(Raum.objects.filter(ist_aktiv=True).select_related('raumtyp').order_by('raumtyp__name', 'nummer'))
+    if not raeume:
+        return []
+    grenzen, perioden = _perioden(von, bis, periode)
+    gruppe_je_raum, gruppen = _gruppen(raeume, gruppierung)
+    preis_je_raum = np.array([r.raumtyp.preis_pro_nacht for r in raeume], dtype=float)
+    raum, start, naechte = _buchungen(raeume, von, bis)
+
+    # One element per sold night: booking index and date
+    buchung = np.repeat(np.arange(len(naechte)), naechte)
+    versatz = np.arange(len(buchung)) - np.repeat(np.cumsum(naechte) - naechte, naechte)
+    nacht = start[buchung] + versatz
+    schluessel = gruppe_je_raum[raum[buchung]] * len(perioden) + np.searchsorted(grenzen, nacht, side='right') - 1
+
+    groesse = len(gruppen) * len(perioden)
+    verkauft = np.bincount(schluessel, minlength=groesse)
+    umsatz = np.bincount(schluessel, weights=preis_je_raum[raum[buchung]], minlength=groesse)
+    verfuegbar = np.outer(np.bincount(gruppe_je_raum, minlength=len(gruppen)), np.diff(grenzen).astype(np.int64)).ravel()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        auslastung = np.where(verfuegbar > 0, verkauft * 100 / verfuegbar, 0)
+        adr = np.where(verkauft > 0, umsatz / verkauft, 0)
+        revpar = np.where(verfuegbar > 0, umsatz / verfuegbar, 0)
+
+    return [
+        {
+            'gruppe': gruppen[i // len(perioden)],
+            'periode': perioden[i % len(perioden)],
+            'verfuegbar': int(verfuegbar[i]),
+            'verkauft': int(verkauft[i]),
+            'umsatz': round(float(umsatz[i]), 2),
+            'auslastung': round(float(auslastung[i]), 1),
+            'adr': round(float(adr[i]), 2),
+            'revpar': round(float(revpar[i]), 2),
+        }
+        for i in range(groesse)
+    ]
@@ -0,0 +1,66 @@
+"""Occupancy table maintenance - Belegungsnächte
+
+``Belegungsnacht`` holds one row per room and occupied night. It is kept in
+step by ``Buchung.save()``; deletes cascade. The unique constraint on
+(raum, datum) turns a double booking into an IntegrityError instead of a race.
+Bulk writers that bypass ``save()`` must add the rows via ``naechte_fuer()``.
+"""
+from datetime import timedelta
+
+from .models import Belegungsnacht
+from .verfuegbarkeit import BLOCKIERENDE_STATUS
+
+
+def blockiert(buchung):
+    """True if the booking occupies its room"""
+    return (
+        buchung.status in BLOCKIERENDE_STATUS
+        and buchung.raum_id is not None
+        and buchung.anreise_datum is not None
+        and buchung.abreise_datum is not None
+    )
+
+
+def naechte(anreise_datum, abreise_datum):
+    """All nights of the half-open range [anreise, abreise)"""
+    return [anreise_datum + timedelta(days=i) for i in range((abreise_datum - anreise_datum).days)]
+
+
+def naechte_fuer(buchungen):
+    """Unsaved Belegungsnacht rows for already saved bookings, for bulk_create()"""
+    return [
+        Belegungsnacht(raum_id=buchung.raum_id, datum=datum, buchung_id=buchung.pk)
+        for buchung in buchungen if blockiert(buchung)
+        for datum in naechte(buchung.anreise_datum, buchung.abreise_datum)
+    ]
+
+
+def synchronisiere_naechte(buchung):
+    """Bring the rows of one booking in line with its room, dates and status.
+
+    Must run inside the transaction that saved the booking.
+    """
+    vorhanden = Belegungsnacht.objects.filter(buchung=buchung)
+    if not blockiert(buchung):
+        vorhanden.delete()
+        return
+
+    vorhanden.exclude(
+        raum_id=buchung.raum_id,
+        datum__gte=buchung.anreise_datum,
+        datum__lt=buchung.abreise_datum
+    ).delete()
+    behalten = set(vorhanden.values_list('datum', flat=True))
+    Belegungsnacht.objects.bulk_create([
+        nacht for nacht in naechte_fuer([buchung]) if nacht.datum not in behalten
+    ])
+
+
+def ist_belegt(raum, datum):
+    """Point read: is the room occupied during the night of ``datum``?"""
+    return Belegungsnacht.objects.filter(raum=raum, datum=datum).exists()
+
+
+def belegte_naechte(datum):
+    """Number of occupied rooms during the night of ``datum``"""
+    return Belegungsnacht.objects.filter(datum=datum).count()
@@ -0,0 +1,284 @@
+"""Accounting export - inkrementeller Rechnungsexport für die Buchhaltung
+
+Each run writes the invoices created or changed since the previous run as
+one DATEV-style ``Buchungsstapel`` file (EXTF header, ';'-separated,
+Windows-1252), one booking line per Rechnungsposten: debtor account
+against revenue account, invoice number in Belegfeld 1 and due date in
+Belegfeld 2. Drafts are not exported.
+
+The lines written for an invoice are kept in ``ExportierteRechnung``. An
+invoice whose lines are unchanged since its last export, e.g. one that was
+only marked as paid, is skipped. A changed invoice is reversed (its last
+exported lines with the opposite sign, "Storno ...") and written with its
+new lines in the same file; one that went back to draft is only reversed.
+
+Progress is kept in ``ExportWasserzeichen`` as the (``aktualisiert_am``,
+``id``) of the last exported invoice. Changing a Rechnungsposten updates
+``aktualisiert_am`` of its invoice (see ``summen.py``). A run first
+records its batch (upper bound, file name and the invoices' lines), then
+writes the file under a temporary name and renames it, and only then moves
+the watermark. After an interruption the next run repeats the batch under
+the same file name, or only moves the watermark if the file was complete,
+so a file is never half-written, lost or delivered twice under different
+names. A run holds a lock file in the export directory from start to end,
+so a second run, e.g. a manual one next to the nightly job, waits instead
+of writing the same file.
+"""
+import os
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ExportierteRechnung, ExportWasserzeichen, Rechnung, Rechnungsposten
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    import msvcrt
+    fcntl = None
+
+WASSERZEICHEN = 'buchhaltung'
+
+# Lock file in the export directory, see _sperre()
+SPERRDATEI = '.sperre'
+
+# Invoices that are booked; drafts follow once they are finished
+EXPORT_STATUS = ['fertig', 'bezahlt']
+
+# Invoices compared with their last export per query
+CHUNK_GROESSE = 2000
+
+SPALTEN = [
+    'Umsatz (ohne Soll/Haben-Kz)', 'Soll/Haben-Kennzeichen', 'WKZ Umsatz', 'Kurs', 'Basis-Umsatz',
+    'WKZ Basis-Umsatz', 'Konto', 'Gegenkonto (ohne BU-Schlüssel)', 'BU-Schlüssel', 'Belegdatum',
+    'Belegfeld 1', 'Belegfeld 2', 'Skonto', 'Buchungstext',
+]
+
+
+class _Roh(str):
+    """Field written without quotes, like DATEV's numbers and dates"""
+
+
+def _feld(wert):
+    if wert is None:
+        return ''
+    if isinstance(wert, (_Roh, int)):
+        return str(wert)
+    return '"' + str(wert).replace('"', '""') + '"'
+
+
+def _zeile(werte):
+    return ';'.join(_feld(wert) for wert in werte) + '\r\n'
+
+
+def _nach(zeitpunkt, pk, praefix=''):
+    """Invoices after (zeitpunkt, pk) in export order"""
+    if zeitpunkt is None:
+        return Q()
+    return Q(**{f'{praefix}aktualisiert_am__gt': zeitpunkt}) | Q(
+        **{f'{praefix}aktualisiert_am': zeitpunkt, f'{praefix}id__gt': pk}
+    )
+
+
+def _bis(zeitpunkt, pk, praefix=''):
+    """Invoices up to and including (zeitpunkt, pk)"""
+    return Q(**{f'{praefix}aktualisiert_am__lt': zeitpunkt}) | Q(
+        **{f'{praefix}aktualisiert_am': zeitpunkt, f'{praefix}id__lte': pk}
+    )
+
+
+def _bereich(wasserzeichen, praefix=''):
+    """The batch of ``wasserzeichen``: after the watermark, up to the open bound"""
+    return _nach(wasserzeichen.aktualisiert_bis, wasserzeichen.id_bis, praefix) & _bis(
+        wasserzeichen.offen_aktualisiert_bis, wasserzeichen.offen_id_bis, praefix
+    )
+
+
+def _aenderungen(wasserzeichen, datei):
+    """Yield lists of unsaved ExportierteRechnung in ``datei`` for the batch's changed invoices
+
+    An invoice is changed if its current lines differ from its last export.
+    """
+    rechnungen = Rechnung.objects.filter(_bereich(wasserzeichen)).order_by('aktualisiert_am', 'id')
+    ids = rechnungen.values_list('id', flat=True).iterator(chunk_size=CHUNK_GROESSE)
+    while teil := list(islice(ids, CHUNK_GROESSE)):
+        aktuell = {}
+        posten = Rechnungsposten.objects.filter(
+            rechnung_id__in=teil, rechnung__status__in=EXPORT_STATUS
+        ).exclude(gesamtpreis=0).order_by('rechnung_id', 'id').values_list(
+            'rechnung_id', 'gesamtpreis', 'beschreibung', 'rechnung__rechnungsnummer',
+            'rechnung__rechnungsdatum', 'rechnung__faelligkeitsdatum'
+        )
+        for rechnung_id, betrag, beschreibung, nummer, rechnungsdatum, faellig in posten:
+            aktuell.setdefault(rechnung_id, []).append(
+                [f'{betrag:.2f}', beschreibung, nummer, rechnungsdatum.isoformat(), faellig.isoformat()]
+            )
+        # The latest export of each invoice, later entries overwrite earlier ones
+        bisher = dict(ExportierteRechnung.objects.filter(rechnung_id__in=teil).order_by(
+            'rechnung_id', 'id'
+        ).values_list('rechnung_id', 'zeilen'))
+        yield [
+            ExportierteRechnung(rechnung_id=rechnung_id, datei=datei, zeilen=zeilen, storno=storno)
+            for rechnung_id in teil
+            if (zeilen := aktuell.get(rechnung_id, [])) != (storno := bisher.get(rechnung_id, []))
+        ]
+
+
+def _abschliessen(wasserzeichen):
+    ExportWasserzeichen.objects.filter(pk=wasserzeichen.pk, offen_datei=wasserzeichen.offen_datei).update(
+        aktualisiert_bis=wasserzeichen.offen_aktualisiert_bis,
+        id_bis=wasserzeichen.offen_id_bis,
+        offen_aktualisiert_bis=None,
+        offen_id_bis=None,
+        offen_datei='',
+        exportiert_am=timezone.now(),
+    )
+
+
+def naechster_lauf(verzeichnis, verzoegerung=None):
+    """Record the next batch and return the watermark, or None if there is nothing to write.
+
+    An open batch whose file exists was interrupted after the rename and is
+    returned as it is. One without a file was never delivered and is
+    recorded anew under the same file name. A batch without changed lines,
+    e.g. drafts or invoices marked as paid, only moves the watermark without
+    writing a file.
+    """
+    if verzoegerung is None:
+        verzoegerung = settings.BUCHHALTUNG_VERZOEGERUNG
+    ExportWasserzeichen.objects.get_or_create(name=WASSERZEICHEN)
+    with transaction.atomic():
+        wasserzeichen = ExportWasserzeichen.objects.select_for_update().get(name=WASSERZEICHEN)
+        if wasserzeichen.offen_datei and (Path(verzeichnis) / wasserzeichen.offen_datei).exists():
+            return wasserzeichen
+        letzte = Rechnung.objects.filter(
+            _nach(wasserzeichen.aktualisiert_bis, wasserzeichen.id_bis),
+            aktualisiert_am__lte=timezone.now() - timedelta(seconds=verzoegerung)
+        ).order_by('-aktualisiert_am', '-id').values_list('aktualisiert_am', 'id').first()
+        if wasserzeichen.offen_datei:
+            ExportierteRechnung.objects.filter(datei=wasserzeichen.offen_datei).delete()
+        if letzte is not None:
+            wasserzeichen.offen_aktualisiert_bis, wasserzeichen.offen_id_bis = letzte
+            datei = wasserzeichen.offen_datei or f'EXTF_Rechnungen_{wasserzeichen.laeufe + 1:06d}.csv'
+            anzahl = 0
+            for eintraege in _aenderungen(wasserzeichen, datei):
+                ExportierteRechnung.objects.bulk_create(eintraege)
+                anzahl += len(eintraege)
+            if anzahl:
+                if not wasserzeichen.offen_datei:
+                    wasserzeichen.laeufe += 1
+                    wasserzeichen.offen_datei = datei
+                wasserzeichen.save()
+                return wasserzeichen
+            wasserzeichen.aktualisiert_bis, wasserzeichen.id_bis = letzte
+            wasserzeichen.exportiert_am = timezone.now()
+        wasserzeichen.offen_aktualisiert_bis = wasserzeichen.offen_id_bis = None
+        wasserzeichen.offen_datei = ''
+        wasserzeichen.save()
+    return None
+
+
+def _kopf(wasserzeichen, von, bis):
+    return [
+        'EXTF', 700, 21, 'Buchungsstapel', 13, _Roh(timezone.localtime().strftime('%Y%m%d%H%M%S%f')[:17]),
+        None, 'RE', 'Passat', None,
+        _Roh(settings.BUCHHALTUNG_BERATER), _Roh(settings.BUCHHALTUNG_MANDANT),
+        _Roh(f'{von.year}0101'), 4, _Roh(f'{von:%Y%m%d}'), _Roh(f'{bis:%Y%m%d}'),
+        f'Rechnungen Lauf {wasserzeichen.laeufe}', None, 1, 0, 0, 'EUR',
+    ]
+
+
+def _buchungszeilen(eintraege):
+    """(amount, text, invoice number, invoice date, due date) per line, reversals first"""
+    for zeilen, storno in eintraege:
+        for betrag, beschreibung, nummer, rechnungsdatum, faellig in storno:
+            yield -Decimal(betrag), f'Storno {beschreibung}', nummer, rechnungsdatum, faellig
+        for betrag, beschreibung, nummer, rechnungsdatum, faellig in zeilen:
+            yield Decimal(betrag), beschreibung, nummer, rechnungsdatum, faellig
+
+
+def schreiben(wasserzeichen, verzeichnis):
+    """Write the open batch to ``verzeichnis``, return (path, number of lines)"""
+    verzeichnis = Path(verzeichnis)
+    verzeichnis.mkdir(parents=True, exist_ok=True)
+    ziel = verzeichnis / wasserzeichen.offen_datei
+    temporaer = ziel.with_name(ziel.name + '.tmp')
+    eintraege = ExportierteRechnung.objects.filter(datei=wasserzeichen.offen_datei).order_by('id').values_list(
+        'zeilen', 'storno'
+    )
+    # Header dates cover the reversed lines, which may carry an older invoice date
+    daten = {zeile[3] for zeile in _buchungszeilen(eintraege.iterator(chunk_size=CHUNK_GROESSE))}
+    konto = _Roh(settings.BUCHHALTUNG_DEBITORENKONTO)
+    gegenkonto = _Roh(settings.BUCHHALTUNG_ERLOESKONTO)
+    anzahl = 0
+    with open(temporaer, 'w', encoding='cp1252', errors='replace', newline='') as datei:
+        datei.write(_zeile(_kopf(wasserzeichen, date.fromisoformat(min(daten)), date.fromisoformat(max(daten)))))
+        datei.write(_zeile(SPALTEN))
+        zeilen = _buchungszeilen(eintraege.iterator(chunk_size=CHUNK_GROESSE))
+        for betrag, beschreibung, nummer, rechnungsdatum, faellig in zeilen:
+            rechnungsdatum, faellig = date.fromisoformat(rechnungsdatum), date.fromisoformat(faellig)
+            datei.write(_zeile([
+                _Roh(f'{abs(betrag):.2f}'.replace('.', ',')), 'S' if betrag > 0 else 'H', 'EUR', None, None, None,
+                konto, gegenkonto, None, _Roh(f'{rechnungsdatum:%d%m}'),
+                nummer, f'{faellig:%d%m%y}', None, beschreibung[:60],
+            ]))
+            anzahl += 1
+        datei.flush()
+        os.fsync(datei.fileno())
+    os.replace(temporaer, ziel)
+    return ziel, anzahl
+
+
+@contextmanager
+def _sperre(verzeichnis):
+    """Exclusive lock on the export directory, held across processes until the block ends.
+
+    The row lock of naechster_lauf() ends with its transaction, before the
+    file is written.
+    """
+    verzeichnis.mkdir(parents=True, exist_ok=True)
+    with open(verzeichnis / SPERRDATEI, 'a+b') as datei:
+        if fcntl is not None:
+            fcntl.flock(datei.fileno(), fcntl.LOCK_EX)
+        else:
+            datei.seek(0)
+            msvcrt.locking(datei.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(datei.fileno(), fcntl.LOCK_UN)
+            else:
+                datei.seek(0)
+                msvcrt.locking(datei.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def exportieren(verzeichnis=None, verzoegerung=None):
+    """Run one incremental export, return (path, number of lines) or None"""
+    verzeichnis = Path(verzeichnis or settings.BUCHHALTUNG_VERZEICHNIS)
+    with _sperre(verzeichnis):
+        wasserzeichen = naechster_lauf(verzeichnis, verzoegerung)
+        if wasserzeichen is None:
+            return None
+        ziel = verzeichnis / wasserzeichen.offen_datei
+        if ziel.exists():
+            # Interrupted after the rename: the file is complete
+            ergebnis = ziel, None
+        else:
+            ergebnis = schreiben(wasserzeichen, verzeichnis)
+        _abschliessen(wasserzeichen)
+    return ergebnis
+
+
+def zuruecksetzen():
+    """Forget the watermark and the exported lines, the next run exports all invoices again"""
+    with transaction.atomic():
+        ExportWasserzeichen.objects.filter(name=WASSERZEICHEN).delete()
+        ExportierteRechnung.objects.all().delete()
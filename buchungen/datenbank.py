@@ -0,0 +1,43 @@
+"""SQLite connection setup - PRAGMAs for concurrent readers and writers
+
+``settings.SQLITE_PRAGMAS`` are applied to every new SQLite connection from
+the ``connection_created`` signal. With the project settings the database
+runs in WAL mode: readers see the last committed state and neither block
+the writer nor each other, so a long report no longer makes bookings fail
+with "database is locked". Writes are still serialized; a transaction takes
+the write lock at ``BEGIN IMMEDIATE`` (``transaction_mode`` in DATABASES),
+where ``busy_timeout`` applies, instead of failing when a read lock cannot
+be upgraded later on.
+"""
+from django.conf import settings
+
+# SQLite's and Django's defaults, for comparison in sqlite_benchmark
+STANDARD_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'delete',
+    'synchronous': 'full',
+    'cache_size': -2000,
+    'mmap_size': 0,
+    'temp_store': 'default',
+}
+
+
+def pragmas_setzen(verbindung, pragmas=None):
+    """Apply ``pragmas`` (default: settings.SQLITE_PRAGMAS) to a new SQLite connection"""
+    if verbindung.vendor != 'sqlite':
+        return
+    if pragmas is None:
+        pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    # On the raw connection, so the PRAGMAs are not counted as queries
+    for name, wert in pragmas.items():
+        verbindung.connection.execute(f'PRAGMA {name} = {wert}')
+
+
+def pragmas_lesen(verbindung, namen):
+    """Current values of the PRAGMAs ``namen``"""
+    with verbindung.cursor() as cursor:
+        werte = {}
+        for name in namen:
+            cursor.execute(f'PRAGMA {name}')
+            werte[name] = cursor.fetchone()[0]
+        return werte
@@ -0,0 +1,222 @@
+"""List exports - Buchungen, Kunden und Rechnungen als CSV oder XLSX
+
+Exports take the same GET parameters as the lists (see ``listen.py``) and
+read the rows with ``values_list(...).iterator()``, so no model instances
+are built and only one chunk of rows is held at a time, whether an export
+has a thousand rows or millions.
+
+CSV is streamed while it is read from the database. XLSX is a ZIP archive
+and cannot be sent before it is complete; it is written with XlsxWriter's
+``constant_memory`` mode, which flushes every row to disk, into a temporary
+file that is then streamed. Exports over ``XLSX_ZEILEN`` rows continue on
+further worksheets.
+"""
+import contextvars
+import csv
+import tempfile
+from io import StringIO
+
+import xlsxwriter
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+from . import listen
+
+CHUNK_GROESSE = 2000
+
+# Data rows per worksheet, Excel's limit minus the header row
+XLSX_ZEILEN = 1048575
+
+FORMATE = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# A spreadsheet opening the CSV runs cells starting with these as formulas
+FORMEL_ANFAENGE = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _buchungen(params):
+    buchungen, _ = listen.buchungen_filtern(params)
+    return buchungen.with_gesamtpreis().order_by(*listen.BUCHUNG_SORTIERUNG)
+
+
+def _kunden(params):
+    kunden, _ = listen.kunden_filtern(params)
+    return kunden.order_by(*listen.KUNDE_SORTIERUNG)
+
+
+def _rechnungen(params):
+    rechnungen, _ = listen.rechnungen_filtern(params)
+    return rechnungen.order_by(*listen.RECHNUNG_SORTIERUNG)
+
+
+# Per export: queryset from GET parameters, (header, field) per column
+EXPORTE = {
+    'buchungen': (_buchungen, [
+        ('Buchungsnummer', 'buchungsnummer'),
+        ('Status', 'status'),
+        ('Vorname', 'kunde__vorname'),
+        ('Nachname', 'kunde__nachname'),
+        ('Raum', 'raum__nummer'),
+        ('Anreise', 'anreise_datum'),
+        ('Abreise', 'abreise_datum'),
+        ('Nächte', 'anzahl_naechte'),
+        ('Teilnehmer', 'anzahl_teilnehmer'),
+        ('Anlass', 'anlass'),
+        ('Art der Buchung', 'art_der_buchung'),
+        ('Zusatzkosten', 'zusatzkosten_summe'),
+        ('Gesamtpreis', 'gesamtpreis'),
+    ]),
+    'kunden': (_kunden, [
+        ('Kundennummer', 'id'),
+        ('Vorname', 'vorname'),
+        ('Nachname', 'nachname'),
+        ('E-Mail', 'email'),
+        ('Telefon', 'telefonnummer'),
+        ('Straße', 'strasse'),
+        ('PLZ', 'plz'),
+        ('Ort', 'ort'),
+        ('Land', 'land'),
+    ]),
+    'rechnungen': (_rechnungen, [
+        ('Rechnungsnummer', 'rechnungsnummer'),
+        ('Rechnungsdatum', 'rechnungsdatum'),
+        ('Fällig am', 'faelligkeitsdatum'),
+        ('Status', 'status'),
+        ('Buchungsnummer', 'buchung__buchungsnummer'),
+        ('Vorname', 'buchung__kunde__vorname'),
+        ('Nachname', 'buchung__kunde__nachname'),
+        ('Gesamtbetrag', 'gesamtbetrag'),
+    ]),
+}
+
+
+def ueberschriften(art):
+    return [ueberschrift for ueberschrift, _ in EXPORTE[art][1]]
+
+
+def abfrage(art, params):
+    """values_list queryset of the export columns"""
+    queryset, spalten = EXPORTE[art]
+    return queryset(params).values_list(*[feld for _, feld in spalten])
+
+
+def zeilen(art, params):
+    """Export rows as tuples, read one database chunk at a time"""
+    return abfrage(art, params).iterator(chunk_size=CHUNK_GROESSE)
+
+
+def _csv_text(wert):
+    """Text that a spreadsheet would take for a formula, prefixed with ' like the XLSX cells stay text"""
+    if isinstance(wert, str) and wert.startswith(FORMEL_ANFAENGE):
+        return "'" + wert
+    return wert
+
+
+def csv_teile(art, params):
+    """Yield the CSV as UTF-8 bytes, one part per database chunk"""
+    puffer = StringIO()
+    # The BOM makes Excel read the file as UTF-8
+    puffer.write('\ufeff')
+    writer = csv.writer(puffer)
+    writer.writerow(ueberschriften(art))
+    for nummer, zeile in enumerate(zeilen(art, params), 1):
+        writer.writerow([_csv_text(wert) for wert in zeile])
+        if nummer % CHUNK_GROESSE == 0:
+            yield puffer.getvalue().encode()
+            puffer.seek(0)
+            puffer.truncate()
+    yield puffer.getvalue().encode()
+
+
+def _blatt(arbeitsmappe, art, nummer, kopf):
+    blatt = arbeitsmappe.add_worksheet(art.capitalize() + (f' {nummer + 1}' if nummer else ''))
+    blatt.write_row(0, 0, ueberschriften(art), kopf)
+    return blatt
+
+
+def xlsx_schreiben(art, params, datei):
+    """Write the XLSX workbook to ``datei`` (path or binary file), return the row count"""
+    arbeitsmappe = xlsxwriter.Workbook(datei, {
+        'constant_memory': True,
+        'default_date_format': 'dd.mm.yyyy',
+        # Customer data is text, never a formula or link to follow
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+    })
+    fett = arbeitsmappe.add_format({'bold': True})
+    blatt = None
+    anzahl = 0
+    for anzahl, zeile in enumerate(zeilen(art, params), 1):
+        blatt_nummer, nummer = divmod(anzahl - 1, XLSX_ZEILEN)
+        if nummer == 0:
+            blatt = _blatt(arbeitsmappe, art, blatt_nummer, fett)
+        blatt.write_row(nummer + 1, 0, zeile)
+    if blatt is None:
+        _blatt(arbeitsmappe, art, 0, fett)
+    arbeitsmappe.close()
+    return anzahl
+
+
+def _datei_teile(datei, groesse=64 * 1024):
+    with datei:
+        datei.seek(0)
+        while teil := datei.read(groesse):
+            yield teil
+
+
+def _im_kontext(teile, kontext):
+    """Iterate ``teile`` in the view's context ``kontext``, e.g. its replica routing
+
+    The response is consumed after the middleware has returned.
+    """
+    ende = object()
+    try:
+        while (teil := kontext.run(next, teile, ende)) is not ende:
+            yield teil
+    finally:
+        if hasattr(teile, 'close'):
+            kontext.run(teile.close)
+
+
+async def _asynchron(teile):
+    """Pull ``teile`` part by part on the request's sync thread"""
+    ende = object()
+    naechster = sync_to_async(next, thread_sensitive=True)
+    try:
+        while (teil := await naechster(teile, ende)) is not ende:
+            yield teil
+    finally:
+        if hasattr(teile, 'close'):
+            await sync_to_async(teile.close, thread_sensitive=True)()
+
+
+def streaming_antwort(request, teile, content_type, dateiname=None):
+    """StreamingHttpResponse for a generator, constant memory under WSGI and ASGI
+
+    Under ASGI Django reads a synchronous iterator into a list before sending
+    it, so the generator is wrapped in an async one there.
+    """
+    teile = _im_kontext(teile, contextvars.copy_context())
+    if isinstance(request, ASGIRequest):
+        teile = _asynchron(teile)
+    response = StreamingHttpResponse(teile, content_type=content_type)
+    if dateiname:
+        response['Content-Disposition'] = f'attachment; filename="{dateiname}"'
+    return response
+
+
+def export_antwort(request, art, dateiname):
+    """Export ``art`` filtered by the request's GET parameters, as ``?format=csv`` (default) or xlsx"""
+    dateiformat = request.GET.get('format', 'csv')
+    if dateiformat not in FORMATE:
+        dateiformat = 'csv'
+    if dateiformat == 'csv':
+        teile = csv_teile(art, request.GET)
+    else:
+        datei = tempfile.TemporaryFile()
+        xlsx_schreiben(art, request.GET, datei)
+        teile = _datei_teile(datei)
+    return streaming_antwort(request, teile, FORMATE[dateiformat], f'{dateiname}.{dateiformat}')
@@ -1,5 +1,6 @@
 from django import forms
-from .models import Kunde, Buchung, Rechnung
+from .auswertung import GRUPPIERUNGEN, PERIODEN
+from .models import Kunde, Buchung, Rechnung, Raumtyp
 from datetime import timedelta
 
 
@@ -71,7 +72,7 @@ class BuchungForm(forms.ModelForm):
                 raise forms.ValidationError('Das Abreisedatum muss nach dem Anreisedatum liegen.')
             
             # Check room availability
-            if raum and not raum.ist_verfuegbar(anreise, abreise):
+            if raum and not raum.ist_verfuegbar(anreise, abreise, ausser_buchung=self.instance.pk):
                 raise forms.ValidationError(
                     f'Der Raum {raum.nummer} ist für den gewählten Zeitraum nicht verfügbar.'
                 )
@@ -97,3 +98,65 @@ class RechnungForm(forms.ModelForm):
         if not self.instance.pk and 'faelligkeitsdatum' not in self.initial:
             from django.utils import timezone
             self.initial['faelligkeitsdatum'] = timezone.now().date() + timedelta(days=14)
+
+
+class ZeitfensterForm(forms.Form):
+    """Search for the next free stays - Freie Zeitfenster"""
+    raumtyp = forms.ModelChoiceField(
+        queryset=Raumtyp.objects.all(), required=False, empty_label='Alle Raumtypen',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    kapazitaet = forms.IntegerField(
+        min_value=1, required=False, label='Mindestkapazität',
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Personen'})
+    )
+    naechte = forms.IntegerField(
+        min_value=1, max_value=90, initial=3, label='Nächte',
+        widget=forms.NumberInput(attrs={'class': 'form-control'})
+    )
+    von = forms.DateField(
+        required=False, label='Frühestens ab',
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    horizont = forms.IntegerField(
+        min_value=1, max_value=730, initial=180, label='Horizont (Tage)',
+        widget=forms.NumberInput(attrs={'class': 'form-control'})
+    )
+    anzahl = forms.IntegerField(
+        min_value=1, max_value=100, initial=10, required=False, label='Treffer',
+        widget=forms.NumberInput(attrs={'class': 'form-control'})
+    )
+
+
+class AuswertungForm(forms.Form):
+    """Occupancy and revenue report - Auswertung"""
+    von = forms.DateField(
+        required=False, label='Von',
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    bis = forms.DateField(
+        required=False, label='Bis einschließlich',
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    gruppierung = forms.ChoiceField(
+        choices=GRUPPIERUNGEN.items(), required=False, label='Je',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    periode = forms.ChoiceField(
+        choices=PERIODEN.items(), required=False, label='Periode',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+
+    # Keeps a report by room and month at a displayable size
+    MAX_JAHRE = 10
+
+    def clean(self):
+        cleaned_data = super().clean()
+        von = cleaned_data.get('von')
+        bis = cleaned_data.get('bis')
+        if von and bis:
+            if bis < von:
+                raise forms.ValidationError('Das Enddatum muss nach dem Startdatum liegen.')
+            if (bis - von).days > self.MAX_JAHRE * 366:
+                raise forms.ValidationError(f'Der Zeitraum darf höchstens {self.MAX_JAHRE} Jahre umfassen.')
+        return cleaned_data
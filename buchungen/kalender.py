@@ -0,0 +1,113 @@
+"""Calendar builder - Kalenderübersicht
+
+Fetches all bookings of a date range with one query and buckets them into a
+dense room x day grid in memory, so the cost of a calendar page does not
+depend on the number of rooms or days shown.
+"""
+import calendar
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+from .models import Buchung, Raum
+from .verfuegbarkeit import BLOCKIERENDE_STATUS
+
+ANSICHTEN = ('woche', 'monat', 'zeitraum')
+
+# Upper bound for custom ranges, keeps the grid at a sane size
+MAX_TAGE = 92
+
+
+def _parse_datum(wert):
+    try:
+        return datetime.strptime(wert, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def zeitraum(ansicht, bezugsdatum, ende=None):
+    """Return (start, ende) of the requested view"""
+    if ansicht == 'monat':
+        start = bezugsdatum.replace(day=1)
+        tage = calendar.monthrange(start.year, start.month)[1]
+        return start, start + timedelta(days=tage - 1)
+    if ansicht == 'zeitraum' and ende is not None and ende >= bezugsdatum:
+        return bezugsdatum, min(ende, bezugsdatum + timedelta(days=MAX_TAGE - 1))
+    start = bezugsdatum - timedelta(days=bezugsdatum.weekday())
+    return start, start + timedelta(days=6)
+
+
+def navigation(ansicht, start, ende):
+    """Query strings for the previous and next page of the same view"""
+    if ansicht == 'monat':
+        vorher = ((start - timedelta(days=1)).replace(day=1), None)
+        nachher = (ende + timedelta(days=1), None)
+    elif ansicht == 'zeitraum':
+        laenge = ende - start + timedelta(days=1)
+        vorher = (start - laenge, start - timedelta(days=1))
+        nachher = (ende + timedelta(days=1), ende + laenge)
+    else:
+        vorher = (start - timedelta(days=7), None)
+        nachher = (start + timedelta(days=7), None)
+
+    def query(datum, bis):
+        params = {'ansicht': ansicht, 'datum': datum.isoformat()}
+        if bis is not None:
+            params['ende'] = bis.isoformat()
+        return urlencode(params)
+
+    return {'zurueck': query(*vorher), 'weiter': query(*nachher)}
+
+
+def zeitraum_aus_request(params, heute):
+    """Read ansicht/datum/ende from GET parameters.
+
+    Returns (ansicht, start, ende); unknown or incomplete input falls back to
+    the current week.
+    """
+    ansicht = params.get('ansicht', 'woche')
+    bezugsdatum = _parse_datum(params.get('datum')) or heute
+    bis = _parse_datum(params.get('ende'))
+    if ansicht not in ANSICHTEN or (ansicht == 'zeitraum' and (bis is None or bis < bezugsdatum)):
+        ansicht = 'woche'
+    start, ende = zeitraum(ansicht, bezugsdatum, bis)
+    return ansicht, start, ende
+
+
+def baue_kalender(start, ende, heute, raeume=None):
+    """Build the room x day grid for the closed range [start, ende].
+
+    Returns a dict with ``tage`` (list of dates) and ``zeilen``: one entry per
+    room with one cell per day, each cell listing the bookings occupying the
+    room during that night.
+    """
+    if raeume is None:
+        raeume = Raum.objects.filter(ist_aktiv=True)
+    raeume = list(raeume)
+    anzahl_tage = (ende - start).days + 1
+    tage = [start + timedelta(days=i) for i in range(anzahl_tage)]
+
+    raster = {raum.pk: [[] for _ in range(anzahl_tage)] for raum in raeume}
+    buchungen = Buchung.objects.filter(
+        raum__in=raeume,
+        status__in=BLOCKIERENDE_STATUS,
+        abreise_datum__gt=start,
+        anreise_datum__lte=ende
+    ).select_related('kunde').order_by('anreise_datum')
+
+    for buchung in buchungen:
+        zeile = raster[buchung.raum_id]
+        von = max((buchung.anreise_datum - start).days, 0)
+        bis = min((buchung.abreise_datum - start).days, anzahl_tage)
+        for index in range(von, bis):
+            zeile[index].append(buchung)
+
+    zeilen = [{
+        'raum': raum,
+        'zellen': [{
+            'datum': tag,
+            'ist_heute': tag == heute,
+            'buchungen': zellen_buchungen,
+        } for tag, zellen_buchungen in zip(tage, raster[raum.pk])],
+    } for raum in raeume]
+
+    return {'tage': tage, 'zeilen': zeilen}
@@ -0,0 +1,84 @@
+"""Dashboard KPIs - Kennzahlen
+
+The figures are served from the cache and recomputed on a miss. The cache key
+contains the local date (TIME_ZONE, Europe/Berlin), so date-dependent figures
+such as the current bookings roll over at midnight. ``signals.py`` drops the
+entry whenever one of the underlying models changes. A miss is computed on
+the primary even in ``@nur_lesen`` views, otherwise the replica's lag would
+be cached after the invalidation.
+"""
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import replikat
+from .belegung import belegte_naechte
+from .models import Buchung, Kunde, Raum, Rechnung
+
+CACHE_PREFIX = 'dashboard:kennzahlen'
+
+# Safety net only - invalidation normally happens through the signals
+CACHE_TIMEOUT = 300
+
+ZAEHLER = ('treffer', 'fehlschlaege')
+
+
+def _cache_key(datum):
+    return f'{CACHE_PREFIX}:{datum.isoformat()}'
+
+
+def _zaehle(name):
+    key = f'{CACHE_PREFIX}:{name}'
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, 1, timeout=None)
+
+
+def berechne_kennzahlen(heute):
+    """Compute all dashboard figures from the database"""
+    aktive_raeume = Raum.objects.filter(ist_aktiv=True).count()
+    umsatz = Rechnung.objects.exclude(status='entwurf').aggregate(
+        summe=Sum('gesamtbetrag')
+    )['summe'] or 0
+    auslastung = round(belegte_naechte(heute) * 100 / aktive_raeume) if aktive_raeume else 0
+    return {
+        'total_kunden': Kunde.objects.count(),
+        'total_buchungen': Buchung.objects.count(),
+        'aktuelle_buchungen': Buchung.objects.filter(
+            anreise_datum__lte=heute,
+            abreise_datum__gte=heute,
+            status='bestaetigt'
+        ).count(),
+        'verfuegbare_raeume': aktive_raeume,
+        'umsatz': umsatz,
+        'auslastung': auslastung,
+    }
+
+
+def dashboard_kennzahlen():
+    """Cached dashboard figures for today, recomputed on a cache miss"""
+    heute = timezone.localdate()
+    key = _cache_key(heute)
+    kennzahlen = cache.get(key)
+    if kennzahlen is None:
+        _zaehle('fehlschlaege')
+        with replikat.primaer():
+            kennzahlen = berechne_kennzahlen(heute)
+        cache.set(key, kennzahlen, CACHE_TIMEOUT)
+    else:
+        _zaehle('treffer')
+    return kennzahlen
+
+
+def invalidieren():
+    """Drop today's cached figures"""
+    cache.delete(_cache_key(timezone.localdate()))
+
+
+def statistik():
+    """Cache hit and miss counters"""
+    werte = cache.get_many([f'{CACHE_PREFIX}:{name}' for name in ZAEHLER])
+    return {name: werte.get(f'{CACHE_PREFIX}:{name}', 0) for name in ZAEHLER}
@@ -0,0 +1,79 @@
+"""List filters shared by the HTML lists, their JSON variants and exports"""
+from django.utils.dateparse import parse_date
+
+from . import suche
+from .models import Buchung, Kunde, Rechnung
+
+# Keyset sort orders, each backed by an index ending in the primary key
+BUCHUNG_SORTIERUNG = ['-erstellt_am', '-id']
+KUNDE_SORTIERUNG = ['nachname', 'vorname', 'id']
+RECHNUNG_SORTIERUNG = ['-rechnungsdatum', '-id']
+
+# Most search hits a filtered customer export contains
+SUCHE_LIMIT = 1000
+
+
+def _datum(params, name):
+    try:
+        return parse_date(params.get(name) or '')
+    except ValueError:
+        return None
+
+
+def _zahl(params, name):
+    wert = params.get(name, '')
+    return int(wert) if wert.isdigit() else None
+
+
+def buchungen_filtern(params):
+    """Apply status/raum/von/bis from GET parameters.
+
+    Returns the filtered queryset and the cleaned filter values. ``von``/``bis``
+    select bookings whose stay overlaps the range.
+    """
+    buchungen = Buchung.objects.select_related('kunde', 'raum')
+    filter_werte = {
+        'status': params.get('status', ''),
+        'raum': _zahl(params, 'raum'),
+        'von': _datum(params, 'von'),
+        'bis': _datum(params, 'bis'),
+    }
+    if filter_werte['status']:
+        buchungen = buchungen.filter(status=filter_werte['status'])
+    if filter_werte['raum']:
+        buchungen = buchungen.filter(raum_id=filter_werte['raum'])
+    if filter_werte['von']:
+        buchungen = buchungen.filter(abreise_datum__gt=filter_werte['von'])
+    if filter_werte['bis']:
+        buchungen = buchungen.filter(anreise_datum__lte=filter_werte['bis'])
+    return buchungen, filter_werte
+
+
+def kunden_filtern(params):
+    """Customers matching the ``search`` parameter, or all customers"""
+    kunden = Kunde.objects.all()
+    begriff = params.get('search', '').strip()
+    if begriff:
+        kunden = kunden.filter(pk__in=suche.backend().suche(begriff, SUCHE_LIMIT))
+    return kunden, {'search': begriff}
+
+
+def rechnungen_filtern(params):
+    """Apply status/von/bis from GET parameters, ``von``/``bis`` on the invoice date"""
+    rechnungen = Rechnung.objects.all()
+    filter_werte = {
+        'status': params.get('status', ''),
+        'von': _datum(params, 'von'),
+        'bis': _datum(params, 'bis'),
+    }
+    if filter_werte['status']:
+        rechnungen = rechnungen.filter(status=filter_werte['status'])
+    if filter_werte['von']:
+        rechnungen = rechnungen.filter(rechnungsdatum__gte=filter_werte['von'])
+    if filter_werte['bis']:
+        rechnungen = rechnungen.filter(rechnungsdatum__lte=filter_werte['bis'])
+    return rechnungen, filter_werte
+
+
+def seitengroesse(params, standard=50):
+    return _zahl(params, 'seitengroesse') or standard
@@ -0,0 +1,143 @@
+import asyncio
+import random
+import statistics
+import time
+from datetime import timedelta
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+
+def _pfade():
+    heute = timezone.localdate()
+    verfuegbarkeit = urlencode({'start_datum': heute, 'end_datum': heute + timedelta(days=7)})
+    return [
+        f'{reverse("kunde_suche_ajax")}?q=m',
+        f'{reverse("kunde_suche_ajax")}?q=mue',
+        f'{reverse("kunde_suche_ajax")}?q=schmi',
+        f'{reverse("raum_suche_ajax")}?q=1',
+        f'{reverse("raum_verfuegbarkeit")}?{verfuegbarkeit}',
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Lasttest der AJAX-Endpunkte gegen einen laufenden Server (WSGI oder ASGI), mit abgebrochenen Anfragen'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Basis-URL des Servers')
+        parser.add_argument('--parallel', type=int, default=100, help='Gleichzeitige Verbindungen (Standard: 100)')
+        parser.add_argument('--dauer', type=float, default=10, help='Laufzeit in Sekunden (Standard: 10)')
+        parser.add_argument('--abbrechen', type=float, default=0.2,
+                            help='Anteil Anfragen, die der Client wie ein überholter Tastendruck abbricht '
+                                 '(Standard: 0.2)')
+        parser.add_argument('--timeout', type=float, default=5, help='Zeitlimit je Anfrage in Sekunden (Standard: 5)')
+        parser.add_argument('--benutzer', help='Angemeldeter Benutzer (Standard: erster Superuser)')
+
+    def handle(self, *args, **options):
+        adresse = urlsplit(options['url'])
+        if adresse.scheme != 'http' or not adresse.hostname:
+            raise CommandError('--url muss eine http-URL sein, z. B. http://127.0.0.1:8000')
+        if options['benutzer']:
+            benutzer = User.objects.filter(username=options['benutzer']).first()
+        else:
+            benutzer = User.objects.filter(is_superuser=True).order_by('pk').first()
+        if benutzer is None:
+            raise CommandError('Kein Benutzer für die Anmeldung gefunden')
+        # The server shares this database, so the session is valid there too
+        client = Client()
+        client.force_login(benutzer)
+        self.cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+        self.host = adresse.hostname
+        self.port = adresse.port or 80
+        self.pfade = _pfade()
+        self.optionen = options
+
+        self.stdout.write(
+            f'{options["parallel"]} Verbindungen, {options["dauer"]:.0f} s gegen {options["url"]}, '
+            f'{options["abbrechen"]:.0%} Abbrüche'
+        )
+        ergebnisse, dauer = asyncio.run(self.lauf())
+        self.bericht(ergebnisse, dauer)
+
+    async def lauf(self):
+        ergebnisse = []
+        ende = time.perf_counter() + self.optionen['dauer']
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            self.verbindung(random.Random(i), ende, ergebnisse) for i in range(self.optionen['parallel'])
+        ))
+        return ergebnisse, time.perf_counter() - start
+
+    async def verbindung(self, zufall, ende, ergebnisse):
+        """One keep-alive client; an aborted request closes the connection like a browser does"""
+        leser = schreiber = None
+        while time.perf_counter() < ende:
+            pfad = zufall.choice(self.pfade)
+            abbrechen = zufall.random() < self.optionen['abbrechen']
+            start = time.perf_counter()
+            try:
+                if schreiber is None:
+                    leser, schreiber = await asyncio.open_connection(self.host, self.port)
+                schreiber.write(
+                    f'GET {pfad} HTTP/1.1\r\nHost: {self.host}\r\nCookie: {self.cookie}\r\n'
+                    f'X-Requested-With: XMLHttpRequest\r\n\r\n'.encode()
+                )
+                await schreiber.drain()
+                if abbrechen:
+                    await asyncio.sleep(zufall.uniform(0, 0.005))
+                    schreiber.close()
+                    leser = schreiber = None
+                    ergebnisse.append(('abgebrochen', time.perf_counter() - start))
+                    continue
+                status, schliessen = await asyncio.wait_for(self.antwort(leser), self.optionen['timeout'])
+                ergebnisse.append((status, time.perf_counter() - start))
+                if schliessen:
+                    # WSGI sync workers answer every request with Connection: close
+                    schreiber.close()
+                    leser = schreiber = None
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as fehler:
+                ergebnisse.append((type(fehler).__name__, time.perf_counter() - start))
+                if schreiber is not None:
+                    schreiber.close()
+                leser = schreiber = None
+        if schreiber is not None:
+            schreiber.close()
+
+    @staticmethod
+    async def antwort(leser):
+        """Read one response, return (status, whether the server closes the connection)"""
+        kopf = (await leser.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+        status = int(kopf[0].split()[1])
+        felder = dict(zeile.lower().split(': ', 1) for zeile in kopf[1:] if ': ' in zeile)
+        if felder.get('transfer-encoding') == 'chunked':
+            while True:
+                groesse = int((await leser.readuntil(b'\r\n')).split(b';')[0], 16)
+                await leser.readexactly(groesse + 2)
+                if not groesse:
+                    break
+        else:
+            await leser.readexactly(int(felder.get('content-length', 0)))
+        return status, felder.get('connection') == 'close'
+
+    def bericht(self, ergebnisse, dauer):
+        beantwortet = sorted(sekunden * 1000 for art, sekunden in ergebnisse if art == 200)
+        arten = {}
+        for art, _ in ergebnisse:
+            arten[art] = arten.get(art, 0) + 1
+        self.stdout.write('  ' + ', '.join(f'{art}: {anzahl}' for art, anzahl in sorted(arten.items(), key=str)))
+        if not beantwortet:
+            raise CommandError('Keine erfolgreiche Antwort')
+        perzentil = lambda p: beantwortet[min(len(beantwortet) - 1, int(len(beantwortet) * p))]
+        self.stdout.write(
+            f'{len(beantwortet)} Antworten in {dauer:.1f} s ({len(beantwortet) / dauer:.0f}/s), '
+            f'Latenz ms: Median {statistics.median(beantwortet):.1f}, p95 {perzentil(0.95):.1f}, '
+            f'p99 {perzentil(0.99):.1f}, max {beantwortet[-1]:.1f}'
+        )
+        fehler = len(ergebnisse) - len(beantwortet) - arten.get('abgebrochen', 0)
+        if fehler:
+            self.stdout.write(self.style.WARNING(f'{fehler} Anfragen ohne 200-Antwort'))
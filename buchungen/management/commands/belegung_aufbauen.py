@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from buchungen.belegung import naechte
+from buchungen.models import Belegungsnacht, Buchung
+from buchungen.verfuegbarkeit import BLOCKIERENDE_STATUS
+
+
+class Command(BaseCommand):
+    help = 'Baut die Tabelle der Belegungsnächte aus allen Buchungen neu auf'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Anzahl Nächte pro INSERT (Standard: 5000)'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        self.stdout.write('Baue Belegungsnächte neu auf...')
+
+        buchungen = Buchung.objects.filter(
+            status__in=BLOCKIERENDE_STATUS
+        ).order_by('raum_id', 'anreise_datum', 'id').values_list(
+            'id', 'raum_id', 'anreise_datum', 'abreise_datum'
+        )
+
+        anzahl = 0
+        konflikte = []
+        batch = []
+        aktueller_raum = None
+        belegt_bis = None
+
+        # Sweep per room over bookings sorted by arrival: everything before
+        # belegt_bis is already taken, the earlier booking keeps the night.
+        with transaction.atomic():
+            Belegungsnacht.objects.all().delete()
+            for buchung_id, raum_id, anreise, abreise in buchungen.iterator(chunk_size=2000):
+                if raum_id != aktueller_raum:
+                    aktueller_raum = raum_id
+                    belegt_bis = None
+                start = anreise
+                if belegt_bis is not None and anreise < belegt_bis:
+                    konflikte.append(buchung_id)
+                    start = belegt_bis
+                for datum in naechte(start, abreise):
+                    batch.append(Belegungsnacht(raum_id=raum_id, datum=datum, buchung_id=buchung_id))
+                if belegt_bis is None or abreise > belegt_bis:
+                    belegt_bis = abreise
+                if len(batch) >= batch_size:
+                    Belegungsnacht.objects.bulk_create(batch)
+                    anzahl += len(batch)
+                    batch = []
+            Belegungsnacht.objects.bulk_create(batch)
+            anzahl += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'{anzahl} Belegungsnächte angelegt'))
+        if konflikte:
+            nummern = Buchung.objects.filter(pk__in=konflikte).values_list('buchungsnummer', flat=True)
+            self.stdout.write(self.style.WARNING(
+                f'{len(konflikte)} Buchungen überschneiden sich mit früheren Buchungen: {", ".join(nummern)}'
+            ))
@@ -0,0 +1,172 @@
+import json
+import statistics
+import time
+from contextlib import ExitStack
+from datetime import timedelta
+from pathlib import Path
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+from buchungen import urls
+from buchungen.models import Buchung, Kunde, Rechnung
+
+# Query strings for views that need parameters to do real work
+PARAMETER = {
+    'kunde_liste': {'search': 'müller'},
+    'raum_verfuegbarkeit': lambda heute: {'start_datum': heute, 'end_datum': heute + timedelta(days=7)},
+    'kunde_suche_ajax': {'q': 'schm'},
+    'raum_suche_ajax': {'q': '1'},
+    'freie_zeitfenster': {'naechte': 3, 'horizont': 180},
+    'freie_zeitfenster_json': {'naechte': 3, 'horizont': 180, 'kapazitaet': 2},
+    'auswertung_csv': lambda heute: {'von': heute.replace(year=heute.year - 3, month=1, day=1), 'bis': heute},
+    'auswertung_json': lambda heute: {
+        'von': heute.replace(year=heute.year - 3, month=1, day=1), 'bis': heute, 'gruppierung': 'raum'
+    },
+    'buchung_export': lambda heute: {'von': heute - timedelta(days=30), 'bis': heute},
+    'kunde_export': {'search': 'müller'},
+    'rechnung_export': lambda heute: {'von': heute - timedelta(days=30), 'bis': heute},
+}
+
+# URL keyword -> model whose sample object fills it in
+OBJEKTE = {'kunde': Kunde, 'buchung': Buchung, 'rechnung': Rechnung}
+
+
+def _beispiel(model):
+    """An object from the middle of the table, stable between runs"""
+    anzahl = model.objects.count()
+    if model is Rechnung:
+        mit_posten = model.objects.filter(posten__isnull=False).order_by('pk').distinct()
+        return mit_posten[anzahl // 2:].first() or mit_posten.first() or model.objects.order_by('pk').first()
+    return model.objects.order_by('pk')[anzahl // 2:].first()
+
+
+class Command(BaseCommand):
+    help = 'Misst alle Seiten aus buchungen/urls.py (Latenz-Perzentile, SQL-Abfragen) gegen eine JSON-Baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wiederholungen', type=int, default=20, help='Messungen je URL (Standard: 20)')
+        parser.add_argument('--baseline',
+                            help='Baseline-Datei (Standard: benchmark_baseline_<Datenbank>.json, z.B. _sqlite oder _postgresql)')
+        parser.add_argument('--speichern', action='store_true', help='Ergebnis als neue Baseline speichern')
+        parser.add_argument('--schwelle', type=float, default=0.25,
+                            help='Erlaubte Verschlechterung des p95 gegenüber der Baseline (Standard: 0.25 = 25 %%)')
+        parser.add_argument('--mindest-ms', type=float, default=5,
+                            help='Abweichungen unter diesem Wert in ms gelten nicht als Regression (Standard: 5)')
+        parser.add_argument('--benutzer', help='Angemeldeter Benutzer (Standard: erster Superuser)')
+        parser.add_argument('--nur', action='append', help='Nur diese URL-Namen messen (mehrfach möglich)')
+
+    def handle(self, *args, **options):
+        if options['benutzer']:
+            benutzer = User.objects.filter(username=options['benutzer']).first()
+        else:
+            benutzer = User.objects.filter(is_superuser=True).order_by('pk').first()
+        if benutzer is None:
+            raise CommandError('Kein Benutzer für die Anmeldung gefunden')
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(benutzer)
+
+        ergebnisse = {}
+        for name, url in self.urls(options['nur']):
+            self.abrufen(client, name, url)  # warm-up: caches, stored PDFs, compiled templates
+            zeiten = []
+            abfragen = []
+            # Counted by a wrapper, unlike connection.queries this works with DEBUG off;
+            # on every alias, reads may go to the replica
+            with ExitStack() as stack:
+                for verbindung in connections.all():
+                    stack.enter_context(verbindung.execute_wrapper(
+                        lambda execute, sql, *args: abfragen.append(sql) or execute(sql, *args)
+                    ))
+                # Streaming exports run their queries while the body is consumed
+                self.abrufen(client, name, url)
+            for _ in range(options['wiederholungen']):
+                start = time.perf_counter()
+                self.abrufen(client, name, url)
+                zeiten.append((time.perf_counter() - start) * 1000)
+            zeiten.sort()
+            ergebnisse[name] = {
+                'url': url,
+                'p50_ms': round(statistics.median(zeiten), 2),
+                'p95_ms': round(zeiten[min(len(zeiten) - 1, int(len(zeiten) * 0.95))], 2),
+                'max_ms': round(zeiten[-1], 2),
+                'abfragen': len(abfragen),
+            }
+            self.stdout.write(
+                f'{name:<26} p50 {ergebnisse[name]["p50_ms"]:>8.1f} ms  p95 {ergebnisse[name]["p95_ms"]:>8.1f} ms  '
+                f'{ergebnisse[name]["abfragen"]:>4} Abfragen'
+            )
+
+        # Timings of different database backends are not comparable
+        pfad = Path(options['baseline'] or Path(settings.BASE_DIR) / f'benchmark_baseline_{connection.vendor}.json')
+        if options['speichern']:
+            pfad.write_text(json.dumps({
+                'erstellt': timezone.now().isoformat(timespec='seconds'),
+                'datenbank': connection.vendor,
+                'daten': {model.__name__: model.objects.count() for model in OBJEKTE.values()},
+                'urls': ergebnisse,
+            }, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(f'Baseline gespeichert: {pfad}'))
+        elif pfad.exists():
+            baseline = json.loads(pfad.read_text(encoding='utf-8'))
+            if baseline.get('datenbank', connection.vendor) != connection.vendor:
+                raise CommandError(
+                    f'Baseline {pfad} wurde mit {baseline["datenbank"]} gemessen, nicht mit {connection.vendor}'
+                )
+            self.vergleiche(baseline['urls'], ergebnisse, options)
+        else:
+            self.stdout.write(self.style.WARNING(f'Keine Baseline unter {pfad}, mit --speichern anlegen'))
+
+    def abrufen(self, client, name, url):
+        """GET ``url`` including the whole streamed body, fail on any status but 200"""
+        response = client.get(url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        if response.status_code != 200:
+            raise CommandError(f'{name} ({url}) antwortet mit {response.status_code}')
+        return response
+
+    def urls(self, nur):
+        """(name, url) for every named pattern, with sample objects and parameters filled in"""
+        heute = timezone.localdate()
+        beispiele = {}
+        for muster in urls.urlpatterns:
+            if not isinstance(muster, URLPattern) or not muster.name or (nur and muster.name not in nur):
+                continue
+            kwargs = {}
+            for schluessel in muster.pattern.converters:
+                art = muster.name.split('_')[0] if schluessel == 'pk' else schluessel.removesuffix('_pk')
+                if art not in OBJEKTE:
+                    raise CommandError(f'Kein Beispielobjekt für <{schluessel}> in {muster.name}')
+                if art not in beispiele:
+                    beispiele[art] = _beispiel(OBJEKTE[art])
+                if beispiele[art] is None:
+                    raise CommandError(f'Keine {OBJEKTE[art]._meta.verbose_name_plural} vorhanden')
+                kwargs[schluessel] = beispiele[art].pk
+            url = reverse(muster.name, kwargs=kwargs)
+            parameter = PARAMETER.get(muster.name)
+            if callable(parameter):
+                parameter = parameter(heute)
+            if parameter:
+                url += '?' + urlencode(parameter)
+            yield muster.name, url
+
+    def vergleiche(self, baseline, ergebnisse, options):
+        regressionen = []
+        for name, werte in ergebnisse.items():
+            alt = baseline.get(name)
+            if alt is None:
+                continue
+            if werte['abfragen'] > alt['abfragen']:
+                regressionen.append(f'{name}: {werte["abfragen"]} statt {alt["abfragen"]} Abfragen')
+            grenze = max(alt['p95_ms'] * (1 + options['schwelle']), alt['p95_ms'] + options['mindest_ms'])
+            if werte['p95_ms'] > grenze:
+                regressionen.append(f'{name}: p95 {werte["p95_ms"]:.1f} ms statt {alt["p95_ms"]:.1f} ms')
+        if regressionen:
+            raise CommandError('Regressionen gegenüber der Baseline:\n  ' + '\n  '.join(regressionen))
+        self.stdout.write(self.style.SUCCESS('Keine Regressionen gegenüber der Baseline'))
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from buchungen import buchhaltung
+
+
+class Command(BaseCommand):
+    help = 'Exportiert neue und geänderte Rechnungen seit dem letzten Lauf als DATEV-Buchungsstapel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verzeichnis', default=settings.BUCHHALTUNG_VERZEICHNIS,
+                            help='Zielverzeichnis (Standard: BUCHHALTUNG_VERZEICHNIS)')
+        parser.add_argument('--verzoegerung', type=int,
+                            help='Rechnungen erst so viele Sekunden nach der letzten Änderung exportieren '
+                                 '(Standard: BUCHHALTUNG_VERZOEGERUNG)')
+        parser.add_argument('--von-vorne', action='store_true',
+                            help='Wasserzeichen zurücksetzen und alle Rechnungen erneut exportieren')
+
+    def handle(self, *args, **options):
+        if options['von_vorne']:
+            buchhaltung.zuruecksetzen()
+        start = time.perf_counter()
+        ergebnis = buchhaltung.exportieren(options['verzeichnis'], options['verzoegerung'])
+        dauer = time.perf_counter() - start
+        if ergebnis is None:
+            self.stdout.write('Keine neuen oder geänderten Rechnungen')
+        elif ergebnis[1] is None:
+            self.stdout.write(self.style.SUCCESS(f'Unterbrochenen Lauf abgeschlossen: {ergebnis[0]}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{ergebnis[1]} Buchungszeilen in {dauer:.1f} s nach {ergebnis[0]}'))
@@ -0,0 +1,272 @@
+import csv
+import json
+import time
+from collections import defaultdict
+from datetime import date
+from itertools import islice
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from buchungen import kennzahlen, metriken, suche
+from buchungen.belegung import naechte_fuer
+from buchungen.models import Belegungsnacht, Buchung, Kunde, Raum
+from buchungen.nummern import reserviere_nummern
+from buchungen.verfuegbarkeit import BLOCKIERENDE_STATUS
+
+PFLICHTFELDER = ['email', 'vorname', 'nachname', 'raum', 'anreise_datum', 'abreise_datum']
+KUNDENFELDER = ['vorname', 'nachname', 'telefonnummer', 'strasse', 'plz', 'ort', 'land']
+STATUS_WERTE = {wert for wert, _ in Buchung.STATUS_CHOICES}
+
+
+class Abgelehnt(Exception):
+    pass
+
+
+def text(daten, feld):
+    wert = daten.get(feld)
+    return '' if wert is None else str(wert).strip()
+
+
+def lese_zeilen(pfad, dateiformat):
+    """Yield (zeilennummer, dict) from a CSV or JSONL file without loading it"""
+    with open(pfad, newline='', encoding='utf-8-sig') as datei:
+        if dateiformat == 'csv':
+            for nummer, zeile in enumerate(csv.DictReader(datei), start=2):
+                yield nummer, zeile
+        else:
+            for nummer, inhalt in enumerate(datei, start=1):
+                if inhalt.strip():
+                    try:
+                        yield nummer, json.loads(inhalt)
+                    except json.JSONDecodeError:
+                        yield nummer, {'_roh': inhalt.rstrip('\n')}
+
+
+def finde_konflikte(kandidaten, bestehende):
+    """One sweep per room over intervals sorted by arrival.
+
+    ``kandidaten`` are (anreise, abreise, index) of the batch, ``bestehende``
+    (anreise, abreise) already in the database, both for a single room.
+    Returns the indexes to reject: overlaps with existing bookings, and with
+    other rows of the batch, where the row with the earlier arrival wins
+    (on equal arrival the one further up in the file).
+    """
+    bestehende = sorted(bestehende)
+    abgelehnt = set()
+    j = 0
+    bestehend_bis = None
+    kandidat_bis = None
+    for anreise, abreise, index in sorted(kandidaten, key=lambda k: (k[0], k[2])):
+        # Existing bookings starting before this row
+        while j < len(bestehende) and bestehende[j][0] < anreise:
+            if bestehend_bis is None or bestehende[j][1] > bestehend_bis:
+                bestehend_bis = bestehende[j][1]
+            j += 1
+        if (
+            (bestehend_bis is not None and anreise < bestehend_bis)
+            or (j < len(bestehende) and bestehende[j][0] < abreise)
+            or (kandidat_bis is not None and anreise < kandidat_bis)
+        ):
+            abgelehnt.add(index)
+            continue
+        kandidat_bis = abreise
+    return abgelehnt
+
+
+class Command(BaseCommand):
+    help = 'Importiert Buchungen (und fehlende Kunden) aus einer CSV- oder JSONL-Datei'
+
+    def add_arguments(self, parser):
+        parser.add_argument('datei', help='CSV-Datei mit Kopfzeile oder JSONL-Datei')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Standard: anhand der Dateiendung')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Zeilen pro Batch (Standard: 5000)')
+        parser.add_argument('--fehler-datei', help='Abgelehnte Zeilen (JSONL), Standard: <datei>.abgelehnt.jsonl')
+        parser.add_argument('--benutzer', help='Benutzername für "Erstellt von"')
+        parser.add_argument('--probelauf', action='store_true', help='Nur prüfen, nichts speichern')
+
+    def handle(self, *args, **options):
+        pfad = Path(options['datei'])
+        if not pfad.exists():
+            raise CommandError(f'Datei {pfad} nicht gefunden')
+        dateiformat = options['format'] or ('jsonl' if pfad.suffix in ('.jsonl', '.json') else 'csv')
+        fehler_pfad = Path(options['fehler_datei'] or f'{pfad}.abgelehnt.jsonl')
+
+        self.benutzer = None
+        if options['benutzer']:
+            self.benutzer = User.objects.filter(username=options['benutzer']).first()
+            if self.benutzer is None:
+                raise CommandError(f'Benutzer {options["benutzer"]} nicht gefunden')
+        self.raeume = dict(Raum.objects.values_list('nummer', 'id'))
+        self.probelauf = options['probelauf']
+
+        start = time.perf_counter()
+        importiert = abgelehnt = 0
+        zeilen = lese_zeilen(pfad, dateiformat)
+        with open(fehler_pfad, 'w', encoding='utf-8') as fehler_datei:
+            while True:
+                batch = list(islice(zeilen, options['batch_size']))
+                if not batch:
+                    break
+                ok, fehler = self.importiere_batch(batch)
+                importiert += ok
+                abgelehnt += len(fehler)
+                for nummer, grund, daten in fehler:
+                    fehler_datei.write(json.dumps(
+                        {'zeile': nummer, 'grund': grund, 'daten': daten}, ensure_ascii=False, default=str
+                    ) + '\n')
+                self.stdout.write(f'  {importiert} importiert, {abgelehnt} abgelehnt')
+
+        if importiert and not self.probelauf:
+            kennzahlen.invalidieren()
+            metriken.erstellt('buchung', importiert)
+        dauer = time.perf_counter() - start
+        rate = (importiert + abgelehnt) / dauer if dauer else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'{importiert} Buchungen {"geprüft" if self.probelauf else "importiert"} '
+            f'in {dauer:.1f} s ({rate:.0f} Zeilen/s)'
+        ))
+        if abgelehnt:
+            self.stdout.write(self.style.WARNING(f'{abgelehnt} Zeilen abgelehnt, siehe {fehler_pfad}'))
+        elif fehler_pfad.exists():
+            fehler_pfad.unlink()
+
+    def pruefe(self, daten):
+        """Validate one row and return the cleaned values"""
+        if '_roh' in daten:
+            raise Abgelehnt('Kein gültiges JSON')
+        fehlend = [feld for feld in PFLICHTFELDER if not text(daten, feld)]
+        if fehlend:
+            raise Abgelehnt(f'Pflichtfelder fehlen: {", ".join(fehlend)}')
+        try:
+            anreise = date.fromisoformat(text(daten, 'anreise_datum'))
+            abreise = date.fromisoformat(text(daten, 'abreise_datum'))
+        except ValueError:
+            raise Abgelehnt('Ungültiges Datum (erwartet JJJJ-MM-TT)')
+        if abreise <= anreise:
+            raise Abgelehnt('Das Abreisedatum muss nach dem Anreisedatum liegen')
+        raum_id = self.raeume.get(text(daten, 'raum'))
+        if raum_id is None:
+            raise Abgelehnt(f'Unbekannter Raum {daten["raum"]}')
+        status = text(daten, 'status') or 'bestaetigt'
+        if status not in STATUS_WERTE:
+            raise Abgelehnt(f'Unbekannter Status {status}')
+        email = text(daten, 'email').lower()
+        if '@' not in email:
+            raise Abgelehnt(f'Ungültige E-Mail {email}')
+        try:
+            teilnehmer = int(daten.get('anzahl_teilnehmer') or 1)
+        except (TypeError, ValueError):
+            raise Abgelehnt('Ungültige Anzahl Teilnehmer')
+        return {
+            'email': email,
+            'raum_id': raum_id,
+            'anreise_datum': anreise,
+            'abreise_datum': abreise,
+            'status': status,
+            'anzahl_teilnehmer': teilnehmer,
+        }
+
+    def importiere_batch(self, batch):
+        fehler = []
+        gueltig = []
+        for nummer, daten in batch:
+            try:
+                gueltig.append((nummer, daten, self.pruefe(daten)))
+            except Abgelehnt as grund:
+                fehler.append((nummer, str(grund), daten))
+        if not gueltig:
+            return 0, fehler
+
+        with transaction.atomic():
+            gueltig = self.ohne_konflikte(gueltig, fehler)
+            try:
+                with transaction.atomic():
+                    importiert = self.speichere(gueltig)
+            except IntegrityError:
+                # A concurrent writer booked one of the rooms after the sweep
+                # (unique night or exclusion constraint). Retry row by row, so
+                # only the affected rows are rejected.
+                importiert = 0
+                for zeile in gueltig:
+                    try:
+                        with transaction.atomic():
+                            importiert += self.speichere([zeile])
+                    except IntegrityError:
+                        fehler.append((zeile[0], 'Raum im Zeitraum bereits belegt', zeile[1]))
+
+            if self.probelauf:
+                transaction.set_rollback(True)
+        return importiert, fehler
+
+    def ohne_konflikte(self, gueltig, fehler):
+        """Drop rows whose room is taken, one query for existing bookings and one sweep per room"""
+        kandidaten = defaultdict(list)
+        for index, (_, _, werte) in enumerate(gueltig):
+            if werte['status'] in BLOCKIERENDE_STATUS:
+                kandidaten[werte['raum_id']].append((werte['anreise_datum'], werte['abreise_datum'], index))
+        bestehende = defaultdict(list)
+        if kandidaten:
+            von = min(k[0] for liste in kandidaten.values() for k in liste)
+            bis = max(k[1] for liste in kandidaten.values() for k in liste)
+            for raum_id, anreise, abreise in Buchung.objects.filter(
+                raum_id__in=kandidaten.keys(),
+                status__in=BLOCKIERENDE_STATUS,
+                abreise_datum__gt=von,
+                anreise_datum__lt=bis
+            ).values_list('raum_id', 'anreise_datum', 'abreise_datum'):
+                bestehende[raum_id].append((anreise, abreise))
+        konflikte = set()
+        for raum_id, liste in kandidaten.items():
+            konflikte |= finde_konflikte(liste, bestehende[raum_id])
+        for index in sorted(konflikte):
+            nummer, daten, _ = gueltig[index]
+            fehler.append((nummer, 'Raum im Zeitraum bereits belegt', daten))
+        return [zeile for index, zeile in enumerate(gueltig) if index not in konflikte]
+
+    def speichere(self, gueltig):
+        """Create the missing customers and the bookings with their nights"""
+        if not gueltig:
+            return 0
+        # Customers: match by e-mail, create the missing ones in one go
+        emails = {werte['email'] for _, _, werte in gueltig}
+        kunden = {}
+        for pk, email in Kunde.objects.filter(email__in=emails).order_by('-pk').values_list('pk', 'email'):
+            kunden[email] = pk
+        neue_kunden = {}
+        for _, daten, werte in gueltig:
+            if werte['email'] not in kunden and werte['email'] not in neue_kunden:
+                neue_kunden[werte['email']] = Kunde(
+                    email=werte['email'],
+                    datenschutz_akzeptiert=text(daten, 'datenschutz_akzeptiert').lower() in ('1', 'true', 'ja'),
+                    **{feld: text(daten, feld) for feld in KUNDENFELDER if text(daten, feld)}
+                )
+        if neue_kunden:
+            Kunde.objects.bulk_create(neue_kunden.values())
+            suche.indexiere_kunden(neue_kunden.values())
+            kunden.update({email: kunde.pk for email, kunde in neue_kunden.items()})
+
+        nummern = iter(reserviere_nummern('BU', len(gueltig)))
+        buchungen = [
+            Buchung(
+                kunde_id=kunden[werte['email']],
+                raum_id=werte['raum_id'],
+                anreise_datum=werte['anreise_datum'],
+                abreise_datum=werte['abreise_datum'],
+                anzahl_naechte=(werte['abreise_datum'] - werte['anreise_datum']).days,
+                status=werte['status'],
+                anzahl_teilnehmer=werte['anzahl_teilnehmer'],
+                anlass=text(daten, 'anlass'),
+                art_der_buchung=text(daten, 'art_der_buchung') or 'Import',
+                veranstalter_name=text(daten, 'veranstalter_name'),
+                veranstalter_kontakt=text(daten, 'veranstalter_kontakt'),
+                notizen=text(daten, 'notizen'),
+                buchungsnummer=next(nummern),
+                erstellt_von=self.benutzer,
+            )
+            for _, daten, werte in gueltig
+        ]
+        Buchung.objects.bulk_create(buchungen, batch_size=1000)
+        Belegungsnacht.objects.bulk_create(naechte_fuer(buchungen), batch_size=5000)
+        return len(buchungen)
@@ -0,0 +1,44 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.http import QueryDict
+from django.utils import timezone
+
+from buchungen import exporte, replikat
+
+
+class Command(BaseCommand):
+    help = 'Exportiert Buchungen, Kunden oder Rechnungen als CSV- oder XLSX-Datei, mit denselben Filtern wie die Listen'
+
+    def add_arguments(self, parser):
+        parser.add_argument('art', choices=list(exporte.EXPORTE), help='Was exportiert wird')
+        parser.add_argument('--format', choices=list(exporte.FORMATE), default='csv', help='Dateiformat (Standard: csv)')
+        parser.add_argument('--ausgabe', help='Ziel-Datei (Standard: <Art>_<Datum>.<Format>)')
+        parser.add_argument('--status', help='Nur Buchungen bzw. Rechnungen mit diesem Status')
+        parser.add_argument('--raum', help='Nur Buchungen dieses Raums (ID)')
+        parser.add_argument('--von', help='Buchungen: Abreise nach, Rechnungen: Rechnungsdatum ab (JJJJ-MM-TT)')
+        parser.add_argument('--bis', help='Buchungen: Anreise bis, Rechnungen: Rechnungsdatum bis (JJJJ-MM-TT)')
+        parser.add_argument('--suche', help='Nur Kunden, die die Kundensuche zu diesem Begriff findet')
+
+    def handle(self, *args, **options):
+        art = options['art']
+        params = QueryDict(mutable=True)
+        for name, parameter in [('status', 'status'), ('raum', 'raum'), ('von', 'von'), ('bis', 'bis'), ('suche', 'search')]:
+            if options[name]:
+                params[parameter] = options[name]
+        ausgabe = Path(options['ausgabe'] or f'{art.capitalize()}_{timezone.localdate():%Y%m%d}.{options["format"]}')
+
+        start = time.perf_counter()
+        with replikat.lesen():
+            if options['format'] == 'xlsx':
+                anzahl = exporte.xlsx_schreiben(art, params, str(ausgabe))
+            else:
+                anzahl = exporte.abfrage(art, params).count()
+                with open(ausgabe, 'wb') as datei:
+                    for teil in exporte.csv_teile(art, params):
+                        datei.write(teil)
+        dauer = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'{anzahl} Zeilen in {dauer:.1f} s nach {ausgabe} exportiert ({ausgabe.stat().st_size / 1024:.0f} KB)'
+        ))
@@ -0,0 +1,34 @@
+import time
+from datetime import date
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from buchungen import replikat
+from buchungen.models import Rechnung
+from buchungen.rechnungsexport import rechnungen_auswahl, zip_stream
+
+
+class Command(BaseCommand):
+    help = 'Exportiert die Rechnungs-PDFs eines Zeitraums als ZIP-Datei'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--von', type=date.fromisoformat, help='Rechnungsdatum ab (JJJJ-MM-TT)')
+        parser.add_argument('--bis', type=date.fromisoformat, help='Rechnungsdatum bis einschließlich (JJJJ-MM-TT)')
+        parser.add_argument('--status', action='append', choices=[wert for wert, _ in Rechnung.STATUS_CHOICES],
+                            help='Nur Rechnungen mit diesem Status (mehrfach möglich, Standard: alle)')
+        parser.add_argument('--ausgabe', default='rechnungen.zip', help='Ziel-Datei (Standard: rechnungen.zip)')
+        parser.add_argument('--prozesse', type=int, help='Anzahl Render-Prozesse (Standard: Anzahl CPU-Kerne)')
+
+    def handle(self, *args, **options):
+        ausgabe = Path(options['ausgabe'])
+        start = time.perf_counter()
+        with replikat.lesen():
+            rechnungen = rechnungen_auswahl(options['von'], options['bis'], options['status'])
+            anzahl = rechnungen.count()
+            with open(ausgabe, 'wb') as datei:
+                for teil in zip_stream(rechnungen, options['prozesse']):
+                    datei.write(teil)
+        dauer = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'{anzahl} Rechnungen in {dauer:.1f} s nach {ausgabe} exportiert ({ausgabe.stat().st_size / 1024:.0f} KB)'
+        ))
@@ -0,0 +1,44 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from buchungen.models import Rechnung
+from buchungen.rechnungslauf import rechnungslauf
+
+
+class Command(BaseCommand):
+    help = 'Erstellt Rechnungen für alle bestätigten, abgeschlossenen Buchungen ohne Rechnung'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stichtag', type=date.fromisoformat,
+                            help='Nur Buchungen mit Abreise bis zu diesem Tag (JJJJ-MM-TT, Standard: heute)')
+        parser.add_argument('--status', choices=[wert for wert, _ in Rechnung.STATUS_CHOICES], default='entwurf',
+                            help='Status der neuen Rechnungen (Standard: entwurf)')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Buchungen pro Transaktion (Standard: 500)')
+        parser.add_argument('--benutzer', help='Benutzername für "Erstellt von"')
+        parser.add_argument('--probelauf', action='store_true', help='Nur Beträge anzeigen, nichts speichern')
+
+    def handle(self, *args, **options):
+        benutzer = None
+        if options['benutzer']:
+            benutzer = User.objects.filter(username=options['benutzer']).first()
+            if benutzer is None:
+                raise CommandError(f'Benutzer {options["benutzer"]} nicht gefunden')
+
+        ergebnis = rechnungslauf(
+            stichtag=options['stichtag'],
+            status=options['status'],
+            benutzer=benutzer,
+            chunk_size=options['chunk_size'],
+            probelauf=options['probelauf']
+        )
+        for buchungsnummer, kunde, betrag, rechnungsnummer in ergebnis:
+            self.stdout.write(f'{buchungsnummer:<20} {kunde:<40} {betrag:>12.2f} € {rechnungsnummer or ""}')
+
+        summe = sum(betrag for _, _, betrag, _ in ergebnis)
+        if options['probelauf']:
+            self.stdout.write(self.style.WARNING(
+                f'Probelauf: {len(ergebnis)} Rechnungen über {summe:.2f} € würden erstellt'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{len(ergebnis)} Rechnungen über {summe:.2f} € erstellt'))
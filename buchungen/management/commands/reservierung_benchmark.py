@@ -0,0 +1,134 @@
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.utils import timezone
+from buchungen.models import Belegungsnacht, Buchung, Kunde, Raum, Raumtyp
+from buchungen.reservierung import RaumBelegt, reserviere
+
+
+class Command(BaseCommand):
+    help = ('Lasttest: parallele Buchungen derselben Räume über reserviere(), mit Prüfung auf Doppelbelegung. '
+            'Läuft in einer eigenen Testdatenbank, damit keine Buchungsnummern verbraucht werden')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='Parallele Schreiber (Standard: 16)')
+        parser.add_argument('--versuche', type=int, default=50, help='Buchungsversuche pro Thread (Standard: 50)')
+        parser.add_argument('--raeume', type=int, default=2, help='Anzahl umkämpfter Räume (Standard: 2)')
+        parser.add_argument('--tage', type=int, default=120, help='Zeitfenster in Tagen (Standard: 120)')
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive',
+                            help='Eine vorhandene Testdatenbank ohne Rückfrage ersetzen')
+
+    def handle(self, *args, **options):
+        # reserviere() draws booking numbers from the Nummernkreis; in the real
+        # database every attempt would use one up and leave gaps
+        name = connection.settings_dict['NAME']
+        test = connection.settings_dict['TEST']
+        test_name = test['NAME']
+        with tempfile.TemporaryDirectory() as verzeichnis:
+            if connection.vendor == 'sqlite' and not test_name:
+                # The threads need a database file, not an in-memory database
+                test['NAME'] = f'{verzeichnis}/lasttest.sqlite3'
+            connection.creation.create_test_db(verbosity=0, autoclobber=not options['interactive'], serialize=False)
+            try:
+                self.lasttest(options)
+            finally:
+                connections.close_all()
+                connection.creation.destroy_test_db(name, verbosity=0)
+                test['NAME'] = test_name
+
+    def lasttest(self, options):
+        kunde = Kunde.objects.create(
+            vorname='Last', nachname='Test', email='lasttest@example.com', telefonnummer='+49301234567',
+            strasse='Teststraße 1', plz='10115', ort='Berlin', datenschutz_akzeptiert=True,
+        )
+        raumtyp = Raumtyp.objects.create(name='Lasttest', preis_pro_nacht=Decimal('100.00'))
+        raeume = [
+            Raum.objects.create(nummer=f'LT-{i}', name='Lasttest', raumtyp=raumtyp, kapazitaet=2)
+            for i in range(options['raeume'])
+        ]
+        beginn = timezone.localdate() + timedelta(days=3650)
+        ergebnisse = []
+        sperre = threading.Lock()
+
+        def schreiber(nummer):
+            zufall = random.Random(nummer)
+            eigene = []
+            try:
+                for _ in range(options['versuche']):
+                    anreise = beginn + timedelta(days=zufall.randrange(options['tage']))
+                    buchung = Buchung(
+                        kunde=kunde,
+                        raum=zufall.choice(raeume),
+                        anreise_datum=anreise,
+                        abreise_datum=anreise + timedelta(days=zufall.randint(1, 5)),
+                        anlass='Lasttest',
+                        art_der_buchung='Lasttest',
+                        status='bestaetigt'
+                    )
+                    start = time.perf_counter()
+                    try:
+                        reserviere(buchung)
+                        ergebnis = 'gebucht'
+                    except RaumBelegt:
+                        ergebnis = 'belegt'
+                    except OperationalError:
+                        ergebnis = 'fehler'
+                    eigene.append((ergebnis, time.perf_counter() - start))
+            finally:
+                connections.close_all()
+                with sperre:
+                    ergebnisse.extend(eigene)
+
+        self.stdout.write(
+            f'{options["threads"]} Threads x {options["versuche"]} Versuche auf {len(raeume)} Räume '
+            f'({connection.vendor})'
+        )
+        threads = [threading.Thread(target=schreiber, args=(i,)) for i in range(options['threads'])]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        dauer = time.perf_counter() - start
+        self.bericht(ergebnisse, dauer, raeume)
+
+    def bericht(self, ergebnisse, dauer, raeume):
+        anzahl = {art: sum(1 for e, _ in ergebnisse if e == art) for art in ('gebucht', 'belegt', 'fehler')}
+        zeiten = sorted(sekunden * 1000 for _, sekunden in ergebnisse)
+        perzentil = lambda p: zeiten[min(len(zeiten) - 1, int(len(zeiten) * p))]
+        self.stdout.write(
+            f'{len(ergebnisse)} Versuche in {dauer:.2f} s ({len(ergebnisse) / dauer:.0f}/s): '
+            f'{anzahl["gebucht"]} gebucht, {anzahl["belegt"]} abgewiesen, {anzahl["fehler"]} Fehler'
+        )
+        self.stdout.write(
+            f'Latenz ms: Median {statistics.median(zeiten):.1f}, p95 {perzentil(0.95):.1f}, '
+            f'p99 {perzentil(0.99):.1f}, max {zeiten[-1]:.1f}'
+        )
+
+        # Correctness: no two blocking bookings of one room overlap, and the
+        # occupancy table matches the bookings
+        ueberschneidungen = 0
+        for raum in raeume:
+            letzte_abreise = None
+            for anreise, abreise in Buchung.objects.filter(raum=raum).order_by('anreise_datum').values_list(
+                'anreise_datum', 'abreise_datum'
+            ):
+                if letzte_abreise and anreise < letzte_abreise:
+                    ueberschneidungen += 1
+                letzte_abreise = max(letzte_abreise or abreise, abreise)
+        gebucht = Buchung.objects.filter(raum__in=raeume).count()
+        naechte = Belegungsnacht.objects.filter(raum__in=raeume).count()
+        soll_naechte = sum(b.anzahl_naechte for b in Buchung.objects.filter(raum__in=raeume).only('anzahl_naechte'))
+        if ueberschneidungen or gebucht != anzahl['gebucht'] or naechte != soll_naechte:
+            raise CommandError(
+                f'Inkonsistent: {ueberschneidungen} Überschneidungen, {gebucht} Buchungen gespeichert '
+                f'(erwartet {anzahl["gebucht"]}), {naechte} Belegungsnächte (erwartet {soll_naechte})'
+            )
+        self.stdout.write(self.style.SUCCESS('Keine Doppelbelegung, Belegungsnächte vollständig'))
@@ -0,0 +1,148 @@
+import random
+import statistics
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.test import override_settings
+from django.utils import timezone
+from buchungen import auswertung, datenbank
+from buchungen.models import Buchung, Kunde, Raum, Raumtyp
+from buchungen.reservierung import RaumBelegt, reserviere
+
+
+class Command(BaseCommand):
+    help = ('Lasttest für SQLite: lange Auswertungen parallel zu Buchungen, '
+            'mit Standard-Einstellungen und mit SQLITE_PRAGMAS (WAL) im Vergleich')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--leser', type=int, default=4, help='Parallele Auswertungen (Standard: 4)')
+        parser.add_argument('--schreiber', type=int, default=4, help='Parallele Buchende (Standard: 4)')
+        parser.add_argument('--sekunden', type=float, default=10, help='Dauer je Durchlauf (Standard: 10)')
+        parser.add_argument('--jahre', type=int, default=3, help='Zeitraum der Auswertung in Jahren (Standard: 3)')
+        parser.add_argument('--nur', choices=['standard', 'abgestimmt'], help='Nur diesen Durchlauf messen')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError(f'Der Lasttest ist für SQLite, konfiguriert ist {connection.vendor}')
+        if connection.settings_dict['NAME'] == ':memory:':
+            raise CommandError('Der Lasttest braucht eine Datenbankdatei, keine In-Memory-Datenbank')
+        kunde = Kunde.objects.order_by('pk').first()
+        raumtyp = Raumtyp.objects.order_by('pk').first()
+        if kunde is None or raumtyp is None:
+            raise CommandError('Bitte zuerst Beispieldaten laden (load_sample_data)')
+
+        optionen = connection.settings_dict['OPTIONS']
+        durchlaeufe = {
+            'standard': (datenbank.STANDARD_PRAGMAS, None),
+            'abgestimmt': (settings.SQLITE_PRAGMAS, optionen.get('transaction_mode')),
+        }
+        if options['nur']:
+            durchlaeufe = {options['nur']: durchlaeufe[options['nur']]}
+
+        praefix = f'SB{int(time.time()) % 100000}'
+        raeume = [
+            Raum.objects.create(nummer=f'{praefix}-{i}', name='Lasttest', raumtyp=raumtyp, kapazitaet=2, ist_aktiv=False)
+            for i in range(max(options['schreiber'], 1))
+        ]
+        self.stdout.write(
+            f'{options["leser"]} Leser (Auswertung über {options["jahre"]} Jahre) und {options["schreiber"]} Schreiber, '
+            f'je {options["sekunden"]:.0f} s'
+        )
+        ergebnisse = {}
+        transaction_mode = optionen.get('transaction_mode')
+        try:
+            for name, (pragmas, modus) in durchlaeufe.items():
+                # Journal mode can only change while no other connection is open
+                connections.close_all()
+                optionen['transaction_mode'] = modus
+                with override_settings(SQLITE_PRAGMAS=pragmas):
+                    journal = datenbank.pragmas_lesen(connection, ['journal_mode'])['journal_mode']
+                    ergebnisse[name] = self.durchlauf(kunde, raeume, options)
+                    connections.close_all()
+                self.bericht(name, journal, modus, ergebnisse[name], options['sekunden'])
+        finally:
+            optionen['transaction_mode'] = transaction_mode
+            connections.close_all()
+            Buchung.objects.filter(raum__in=raeume).delete()
+            Raum.objects.filter(pk__in=[raum.pk for raum in raeume]).delete()
+
+        if len(ergebnisse) == 2:
+            vorher, nachher = ergebnisse['standard'], ergebnisse['abgestimmt']
+            faktor = lambda art: len(nachher[art]['ok']) / max(len(vorher[art]['ok']), 1)
+            self.stdout.write(self.style.SUCCESS(
+                f'Mit SQLITE_PRAGMAS: {faktor("lesen"):.1f}x Lesedurchsatz, {faktor("schreiben"):.1f}x Schreibdurchsatz, '
+                f'Fehler {vorher["lesen"]["fehler"] + vorher["schreiben"]["fehler"]} -> '
+                f'{nachher["lesen"]["fehler"] + nachher["schreiben"]["fehler"]}'
+            ))
+
+    def durchlauf(self, kunde, raeume, options):
+        """Run readers and writers for the configured time, return latencies and errors per kind"""
+        heute = timezone.localdate()
+        von = heute.replace(year=heute.year - options['jahre'], month=1, day=1)
+        beginn = heute + timedelta(days=3650)
+        ende = time.perf_counter() + options['sekunden']
+        ergebnisse = {art: {'ok': [], 'fehler': 0} for art in ('lesen', 'schreiben')}
+        sperre = threading.Lock()
+
+        def lesen(nummer):
+            auswertung.kennzahlen(von, heute, 'raum', 'monat')
+
+        def schreiben(nummer):
+            anreise = beginn + timedelta(days=random.randrange(365))
+            try:
+                reserviere(Buchung(
+                    kunde=kunde,
+                    raum=raeume[nummer % len(raeume)],
+                    anreise_datum=anreise,
+                    abreise_datum=anreise + timedelta(days=random.randint(1, 5)),
+                    anlass='Lasttest',
+                    art_der_buchung='Lasttest',
+                    status='bestaetigt'
+                ))
+            except RaumBelegt:
+                pass
+
+        def arbeiter(art, aufgabe, nummer):
+            eigene = {'ok': [], 'fehler': 0}
+            try:
+                while time.perf_counter() < ende:
+                    start = time.perf_counter()
+                    try:
+                        aufgabe(nummer)
+                    except OperationalError:
+                        # "database is locked" after the busy timeout
+                        eigene['fehler'] += 1
+                        continue
+                    eigene['ok'].append((time.perf_counter() - start) * 1000)
+            finally:
+                connections.close_all()
+                with sperre:
+                    ergebnisse[art]['ok'].extend(eigene['ok'])
+                    ergebnisse[art]['fehler'] += eigene['fehler']
+
+        threads = [threading.Thread(target=arbeiter, args=('lesen', lesen, i)) for i in range(options['leser'])]
+        threads += [threading.Thread(target=arbeiter, args=('schreiben', schreiben, i)) for i in range(options['schreiber'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return ergebnisse
+
+    def bericht(self, name, journal, modus, ergebnisse, sekunden):
+        self.stdout.write(f'{name} (journal_mode={journal}, BEGIN {modus or "DEFERRED"}):')
+        for art, werte in ergebnisse.items():
+            zeiten = sorted(werte['ok'])
+            if zeiten:
+                latenz = (
+                    f'Median {statistics.median(zeiten):.1f} ms, '
+                    f'p95 {zeiten[min(len(zeiten) - 1, int(len(zeiten) * 0.95))]:.1f} ms, max {zeiten[-1]:.1f} ms'
+                )
+            else:
+                latenz = 'keine erfolgreich'
+            self.stdout.write(
+                f'  {art:<10} {len(zeiten) / sekunden:>8.1f}/s  {latenz}  {werte["fehler"]} Fehler'
+            )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from buchungen import suche
+
+
+class Command(BaseCommand):
+    help = 'Baut den Suchindex der Kunden neu auf'
+
+    def handle(self, *args, **options):
+        backend = suche.backend()
+        self.stdout.write(f'Baue Suchindex neu auf ({type(backend).__name__})...')
+        with transaction.atomic():
+            backend.neu_aufbauen()
+        self.stdout.write(self.style.SUCCESS('Suchindex aufgebaut'))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from buchungen import kennzahlen, summen
+from buchungen.models import Buchung, Rechnung
+
+BEISPIELE = 20
+
+
+class Command(BaseCommand):
+    help = 'Prüft die mitgeführten Summen von Buchungen und Rechnungen und repariert Abweichungen'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reparieren', action='store_true', help='Abweichende Summen neu berechnen')
+
+    def handle(self, *args, **options):
+        gesamt = 0
+        for model, nummer in ((Buchung, 'buchungsnummer'), (Rechnung, 'rechnungsnummer')):
+            feld = summen.SUMMEN[model.__name__][0]
+            with transaction.atomic():
+                abweichend = list(summen.drift(model).values_list('pk', nummer, feld, 'soll'))
+                if abweichend and options['reparieren']:
+                    summen.reparieren(model, [pk for pk, _, _, _ in abweichend])
+            gesamt += len(abweichend)
+
+            name = model._meta.verbose_name_plural
+            if not abweichend:
+                self.stdout.write(self.style.SUCCESS(f'{name}: keine Abweichungen'))
+                continue
+            self.stdout.write(self.style.WARNING(f'{name}: {len(abweichend)} Abweichungen'))
+            for _, bezeichnung, ist, soll in abweichend[:BEISPIELE]:
+                self.stdout.write(f'  {bezeichnung:<20} gespeichert {ist:>12.2f} €  Summe der Posten {soll:>12.2f} €')
+            if len(abweichend) > BEISPIELE:
+                self.stdout.write(f'  ... und {len(abweichend) - BEISPIELE} weitere')
+
+        if gesamt and options['reparieren']:
+            kennzahlen.invalidieren()
+            self.stdout.write(self.style.SUCCESS(f'{gesamt} Summen neu berechnet'))
+        elif gesamt:
+            self.stdout.write('Mit --reparieren neu berechnen')
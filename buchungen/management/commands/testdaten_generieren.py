@@ -0,0 +1,219 @@
+import math
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from buchungen import kennzahlen, suche
+from buchungen.belegung import naechte_fuer
+from buchungen.models import Belegungsnacht, Belegungsprotokoll, Buchung, Kunde, Raum, Raumtyp, Rechnung, Rechnungsposten
+from buchungen.nummern import reserviere_nummern
+from buchungen.rechnungslauf import ZAHLUNGSZIEL_TAGE, rechnungsposten_fuer
+
+VORNAMEN = [
+    'Anna', 'Ben', 'Clara', 'David', 'Emma', 'Felix', 'Greta', 'Hannes', 'Ida', 'Jonas', 'Karla', 'Lukas',
+    'Mia', 'Noah', 'Olga', 'Paul', 'Rosa', 'Simon', 'Thea', 'Uwe', 'Vera', 'Willi', 'Yvonne', 'Zoe',
+]
+NACHNAMEN = [
+    'Müller', 'Schmidt', 'Schneider', 'Fischer', 'Weber', 'Meyer', 'Wagner', 'Becker', 'Schulz', 'Hoffmann',
+    'Schäfer', 'Koch', 'Bauer', 'Richter', 'Klein', 'Wolf', 'Schröder', 'Neumann', 'Schwarz', 'Zimmermann',
+    'Braun', 'Krüger', 'Hofmann', 'Hartmann', 'Lange', 'Schmitt', 'Werner', 'Krause', 'Meier', 'Lehmann',
+]
+ORTE = [
+    ('20095', 'Hamburg'), ('10115', 'Berlin'), ('80331', 'München'), ('50667', 'Köln'), ('60311', 'Frankfurt'),
+    ('18055', 'Rostock'), ('24103', 'Kiel'), ('28195', 'Bremen'), ('01067', 'Dresden'), ('04109', 'Leipzig'),
+]
+LEISTUNGEN = [
+    ('Frühstück', Decimal('14.50')), ('Minibar', Decimal('8.00')), ('Parkplatz', Decimal('12.00')),
+    ('Sauna', Decimal('18.00')), ('Wäscheservice', Decimal('9.50')), ('Kapitänsdinner', Decimal('49.00')),
+]
+ANLAESSE = ['Urlaub', 'Geschäftsreise', 'Hochzeit', 'Klassenfahrt', 'Seminar', 'Familienfeier']
+RAUMTYPEN = [
+    ('Einzelzimmer', 'EZ', Decimal('89.00'), 1),
+    ('Doppelzimmer', 'DZ', Decimal('129.00'), 2),
+    ('Kapitäns-Suite', 'SU', Decimal('199.00'), 2),
+]
+
+
+class Command(BaseCommand):
+    help = 'Erzeugt große Mengen synthetischer Testdaten (Räume, Kunden, Buchungen, Posten, Rechnungen)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--raeume', type=int, default=50, help='Anzahl Räume (Standard: 50)')
+        parser.add_argument('--kunden', type=int, default=20000, help='Anzahl Kunden (Standard: 20000)')
+        parser.add_argument('--jahre', type=float, default=3, help='Jahre Buchungshistorie (Standard: 3)')
+        parser.add_argument('--auslastung', type=float, default=0.7,
+                            help='Anteil belegter Nächte je Raum, 0 bis 1 (Standard: 0.7)')
+        parser.add_argument('--posten', type=float, default=2,
+                            help='Durchschnittliche Zusatzleistungen je Buchung (Standard: 2)')
+        parser.add_argument('--rechnungen', type=float, default=0.8,
+                            help='Anteil abgerechneter abgeschlossener Buchungen (Standard: 0.8)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Buchungen pro Transaktion (Standard: 5000)')
+        parser.add_argument('--seed', type=int, default=1, help='Startwert des Zufallsgenerators (Standard: 1)')
+
+    def handle(self, *args, **options):
+        if not 0 < options['auslastung'] < 1:
+            raise CommandError('--auslastung muss zwischen 0 und 1 liegen')
+        self.zufall = random.Random(options['seed'])
+        self.optionen = options
+        self.heute = timezone.localdate()
+        start = time.perf_counter()
+
+        raeume = self.erzeuge_raeume(options['raeume'])
+        kunden_ids = self.erzeuge_kunden(options['kunden'])
+        if not raeume or not kunden_ids:
+            raise CommandError('Mindestens ein Raum und ein Kunde werden benötigt')
+
+        anzahl = {'buchungen': 0, 'protokolle': 0, 'rechnungen': 0}
+        buchungen = self.buchungen(raeume, kunden_ids)
+        while True:
+            batch = list(islice(buchungen, options['batch_size']))
+            if not batch:
+                break
+            for art, menge in self.speichere_batch(batch).items():
+                anzahl[art] += menge
+            self.stdout.write(f'  {anzahl["buchungen"]} Buchungen')
+
+        kennzahlen.invalidieren()
+        dauer = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(raeume)} Räume, {len(kunden_ids)} Kunden, {anzahl["buchungen"]} Buchungen, '
+            f'{anzahl["protokolle"]} Zusatzleistungen und {anzahl["rechnungen"]} Rechnungen in {dauer:.1f} s erzeugt'
+        ))
+
+    def erzeuge_raeume(self, anzahl):
+        raumtypen = [
+            (Raumtyp.objects.get_or_create(name=name, typ=typ, defaults={'preis_pro_nacht': preis})[0], kapazitaet)
+            for name, typ, preis, kapazitaet in RAUMTYPEN
+        ]
+        # Always new rooms, numbered after earlier runs, so their calendars are empty
+        vorhanden = [
+            int(nummer[1:]) for nummer in Raum.objects.filter(nummer__regex=r'^T[0-9]+$').values_list('nummer', flat=True)
+        ]
+        erste = max(vorhanden, default=0) + 1
+        neue = []
+        for i in range(erste, erste + anzahl):
+            raumtyp, kapazitaet = raumtypen[i % len(raumtypen)]
+            neue.append(Raum(nummer=f'T{i:04d}', name=f'Testkabine {i}', raumtyp=raumtyp, kapazitaet=kapazitaet))
+        return Raum.objects.bulk_create(neue, batch_size=1000)
+
+    def erzeuge_kunden(self, anzahl):
+        lauf = int(time.time())
+        for start in range(0, anzahl, self.optionen['batch_size']):
+            kunden = []
+            for i in range(start, min(anzahl, start + self.optionen['batch_size'])):
+                vorname, nachname = self.zufall.choice(VORNAMEN), self.zufall.choice(NACHNAMEN)
+                plz, ort = self.zufall.choice(ORTE)
+                kunden.append(Kunde(
+                    vorname=vorname,
+                    nachname=nachname,
+                    email=f'{vorname}.{nachname}.{lauf}.{i}@example.com'.lower(),
+                    telefonnummer=f'+4917{self.zufall.randrange(10 ** 8):08d}',
+                    strasse=f'{self.zufall.choice(NACHNAMEN)}straße {self.zufall.randint(1, 200)}',
+                    plz=plz,
+                    ort=ort,
+                    datenschutz_akzeptiert=True
+                ))
+            with transaction.atomic():
+                Kunde.objects.bulk_create(kunden)
+                suche.indexiere_kunden(kunden)
+        return list(Kunde.objects.values_list('pk', flat=True))
+
+    def buchungen(self, raeume, kunden_ids):
+        """Yield (buchung, protokolle) room by room, chronologically without overlaps"""
+        auslastung = self.optionen['auslastung']
+        beginn = self.heute - timedelta(days=int(self.optionen['jahre'] * 365))
+        ende = self.heute + timedelta(days=180)
+        for raum in raeume:
+            tag = beginn + timedelta(days=self.zufall.randrange(7))
+            while tag < ende:
+                naechte = self.zufall.randint(1, 7)
+                # Mean gap chosen so that nights / (nights + gap) ~ auslastung
+                tag += timedelta(days=round(self.zufall.expovariate(auslastung / (4 * (1 - auslastung)))))
+                anreise, abreise = tag, tag + timedelta(days=naechte)
+                tag = abreise
+                if abreise >= ende:
+                    break
+                if anreise > self.heute:
+                    status = self.zufall.choice(['optimierung', 'bestaetigt', 'bestaetigt'])
+                else:
+                    status = 'storniert' if self.zufall.random() < 0.05 else 'bestaetigt'
+                buchung = Buchung(
+                    kunde_id=self.zufall.choice(kunden_ids),
+                    raum=raum,
+                    anreise_datum=anreise,
+                    abreise_datum=abreise,
+                    anzahl_naechte=naechte,
+                    anlass=self.zufall.choice(ANLAESSE),
+                    art_der_buchung='Standard',
+                    status=status,
+                    anzahl_teilnehmer=raum.kapazitaet,
+                )
+                protokolle = []
+                if status == 'bestaetigt' and anreise <= self.heute:
+                    for _ in range(self._poisson(self.optionen['posten'])):
+                        leistung, preis = self.zufall.choice(LEISTUNGEN)
+                        menge = self.zufall.randint(1, naechte)
+                        protokolle.append(Belegungsprotokoll(
+                            leistung=leistung,
+                            datum=anreise + timedelta(days=self.zufall.randrange(naechte)),
+                            anzahl=menge,
+                            einzelpreis=preis,
+                            gesamtbetrag=preis * menge
+                        ))
+                buchung.zusatzkosten_summe = sum((p.gesamtbetrag for p in protokolle), Decimal('0'))
+                yield buchung, protokolle
+
+    def _poisson(self, mittel):
+        # Knuth; the means used here are small
+        grenze, k, p = math.exp(-mittel), 0, 1.0
+        while True:
+            p *= self.zufall.random()
+            if p <= grenze:
+                return k
+            k += 1
+
+    @transaction.atomic
+    def speichere_batch(self, batch):
+        buchungen = [buchung for buchung, _ in batch]
+        for buchung, nummer in zip(buchungen, reserviere_nummern('BU', len(buchungen))):
+            buchung.buchungsnummer = nummer
+        Buchung.objects.bulk_create(buchungen, batch_size=1000)
+        Belegungsnacht.objects.bulk_create(naechte_fuer(buchungen), batch_size=5000)
+
+        protokolle = []
+        for buchung, eigene in batch:
+            for protokoll in eigene:
+                protokoll.buchung = buchung
+            protokolle.extend(eigene)
+        Belegungsprotokoll.objects.bulk_create(protokolle, batch_size=5000)
+
+        # Invoices for a share of the finished, confirmed bookings
+        abgerechnet = [
+            (buchung, eigene) for buchung, eigene in batch
+            if buchung.status == 'bestaetigt' and buchung.abreise_datum <= self.heute
+            and self.zufall.random() < self.optionen['rechnungen']
+        ]
+        rechnungen, alle_posten = [], []
+        for (buchung, eigene), nummer in zip(abgerechnet, reserviere_nummern('RE', len(abgerechnet))):
+            posten, summe = rechnungsposten_fuer(buchung, eigene)
+            rechnungsdatum = buchung.abreise_datum + timedelta(days=1)
+            rechnung = Rechnung(
+                buchung=buchung,
+                rechnungsnummer=nummer,
+                rechnungsdatum=rechnungsdatum,
+                faelligkeitsdatum=rechnungsdatum + timedelta(days=ZAHLUNGSZIEL_TAGE),
+                status='bezahlt' if rechnungsdatum < self.heute - timedelta(days=30) else 'fertig',
+                gesamtbetrag=summe
+            )
+            for eintrag in posten:
+                eintrag.rechnung = rechnung
+            rechnungen.append(rechnung)
+            alle_posten.extend(posten)
+        Rechnung.objects.bulk_create(rechnungen, batch_size=1000)
+        Rechnungsposten.objects.bulk_create(alle_posten, batch_size=5000)
+        return {'buchungen': len(buchungen), 'protokolle': len(protokolle), 'rechnungen': len(rechnungen)}
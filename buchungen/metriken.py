@@ -0,0 +1,72 @@
+"""Prometheus metrics - Metriken
+
+Request counts and latency histograms per URL name, SQL figures per URL
+name, requests aborted by the client, database connections opened and
+created bookings/invoices. The ``/metrics`` view renders them in the
+Prometheus text format.
+
+Under gunicorn every worker is its own process with its own counters. Set
+``PROMETHEUS_MULTIPROC_DIR`` to an empty, writable directory before the
+workers start: prometheus_client then keeps the values in memory-mapped
+files there and the view aggregates all workers (see ``gunicorn.conf.py``,
+which also cleans up after exited workers).
+"""
+import hmac
+import os
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+ANFRAGEN = Counter(
+    'passat_http_anfragen_total', 'HTTP-Anfragen nach URL-Name, Methode und Status',
+    ['view', 'methode', 'status']
+)
+DAUER = Histogram(
+    'passat_http_anfrage_dauer_sekunden', 'Antwortzeit nach URL-Name',
+    ['view'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+DB_ABFRAGEN = Counter('passat_db_abfragen_total', 'SQL-Abfragen nach URL-Name', ['view'])
+DB_DAUER = Counter('passat_db_dauer_sekunden_total', 'SQL-Zeit nach URL-Name', ['view'])
+DB_VERBINDUNGEN = Counter(
+    'passat_db_verbindungen_total', 'Geöffnete Datenbankverbindungen', ['alias', 'vendor']
+)
+ABGEBROCHEN = Counter(
+    'passat_http_abgebrochen_total', 'Vom Client abgebrochene Anfragen nach URL-Name', ['view']
+)
+ERSTELLT = Counter('passat_erstellt_total', 'Neu angelegte Buchungen und Rechnungen', ['art'])
+
+
+def view_name(request):
+    """Label for the request: the (namespaced) URL name, never the raw path"""
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match and match.url_name else 'unbekannt'
+
+
+def erstellt(art, anzahl=1):
+    """Count created objects; bulk paths that skip post_save call this directly"""
+    if anzahl:
+        ERSTELLT.labels(art=art).inc(anzahl)
+
+
+def _registry():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics(request):
+    """Prometheus scrape endpoint, protected by METRIKEN_TOKEN outside DEBUG"""
+    token = getattr(settings, 'METRIKEN_TOKEN', '')
+    if not token:
+        # Without a token the metrics (URL names, volumes) are only served
+        # to the development server, never to the public
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,231 @@
+"""Request instrumentation - SQL- und Zeitmessung pro Request
+
+``SQLInstrumentierungMiddleware`` counts the queries of each request and
+their total time, measures template rendering and reports everything as a
+``Server-Timing`` header, which the browser dev tools show next to the
+request. Requests over ``SQL_ABFRAGE_BUDGET`` queries, or repeating one
+statement more than ``SQL_WIEDERHOLUNGEN`` times (the N+1 pattern), are
+logged as warnings on the ``buchungen.performance`` logger.
+
+Template time comes from the template backend
+``buchungen.vorlagen.MessendeDjangoTemplates`` (TEMPLATES in settings),
+which reports each rendered template to ``template_zeit_messen()``.
+With ``SQL_INSTRUMENTIERUNG = False`` the middleware removes itself at
+startup, and the backend only looks up an empty ContextVar per template.
+Queries run while a streaming response is consumed are not counted.
+
+``MetrikenMiddleware`` feeds the Prometheus metrics of ``metriken.py`` and
+is switched off the same way with ``METRIKEN = False``.
+
+Both middlewares are sync and async capable. Under ASGI a sync-only
+middleware would push every request, async views included, through
+Django's single thread for sync code. Queries are seen by one permanent
+``execute_wrapper`` installed on each connection as it opens (see
+``signals.py``), which reports to the measurements of the current context:
+database connections are thread-local, and the async ORM runs its queries
+on a worker thread that inherits the request's context but not its
+connection objects.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger('buchungen.performance')
+
+_messung = ContextVar('sql_messung', default=None)
+_zaehler = ContextVar('sql_zaehler', default=None)
+
+
+class Messung:
+    """Figures of one request"""
+
+    def __init__(self):
+        self.abfragen = Counter()
+        self.sql_zeit = 0.0
+        self.template_zeit = 0.0
+        self.template_tiefe = 0
+
+    @property
+    def anzahl(self):
+        return sum(self.abfragen.values())
+
+    def erfasse(self, sql, dauer):
+        self.sql_zeit += dauer
+        self.abfragen[sql] += 1
+
+
+def template_zeit_messen(render, *args):
+    """Call ``render`` and add its time to the request being measured (outermost template only)"""
+    messung = _messung.get()
+    if messung is None or messung.template_tiefe:
+        return render(*args)
+    messung.template_tiefe += 1
+    start = time.perf_counter()
+    try:
+        return render(*args)
+    finally:
+        messung.template_zeit += time.perf_counter() - start
+        messung.template_tiefe -= 1
+
+
+def _sql_wrapper(execute, sql, params, many, context):
+    """Time the query for whatever the current context is measuring"""
+    messung, zaehler = _messung.get(), _zaehler.get()
+    if messung is None and zaehler is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        dauer = time.perf_counter() - start
+        if messung is not None:
+            messung.erfasse(sql, dauer)
+        if zaehler is not None:
+            zaehler.erfasse(sql, dauer)
+
+
+def sql_wrapper_installieren(verbindung):
+    """Called for every new connection, see signals.sql_messen()"""
+    if _sql_wrapper not in verbindung.execute_wrappers:
+        verbindung.execute_wrappers.append(_sql_wrapper)
+
+
+class SQLInstrumentierungMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SQL_INSTRUMENTIERUNG', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.budget = getattr(settings, 'SQL_ABFRAGE_BUDGET', 50)
+        self.wiederholungen = getattr(settings, 'SQL_WIEDERHOLUNGEN', 10)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        messung = Messung()
+        token = _messung.set(messung)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _messung.reset(token)
+        return self.auswerten(request, response, messung, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        messung = Messung()
+        token = _messung.set(messung)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _messung.reset(token)
+        return self.auswerten(request, response, messung, time.perf_counter() - start)
+
+    def auswerten(self, request, response, messung, gesamt):
+        response['Server-Timing'] = ', '.join([
+            f'sql;dur={messung.sql_zeit * 1000:.1f};desc="{messung.anzahl} Abfragen"',
+            f'tpl;dur={messung.template_zeit * 1000:.1f};desc="Templates"',
+            f'view;dur={(gesamt - messung.template_zeit) * 1000:.1f};desc="View ohne Templates"',
+            f'total;dur={gesamt * 1000:.1f}',
+        ])
+        self.pruefe(request, messung)
+        return response
+
+    def pruefe(self, request, messung):
+        if messung.anzahl > self.budget:
+            logger.warning(
+                '%s %s: %d Abfragen (Budget %d), %.1f ms SQL',
+                request.method, request.path, messung.anzahl, self.budget, messung.sql_zeit * 1000
+            )
+        if messung.abfragen:
+            sql, anzahl = messung.abfragen.most_common(1)[0]
+            if anzahl > self.wiederholungen:
+                logger.warning(
+                    '%s %s: dieselbe Abfrage %d-mal (N+1?): %s',
+                    request.method, request.path, anzahl, sql[:300]
+                )
+
+
+class _SQLZaehler:
+    """Query count and time only, cheap enough to run on every request"""
+
+    def __init__(self):
+        self.anzahl = 0
+        self.zeit = 0.0
+
+    def erfasse(self, sql, dauer):
+        self.zeit += dauer
+        self.anzahl += 1
+
+
+class MetrikenMiddleware:
+    METHODEN = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRIKEN', False):
+            raise MiddlewareNotUsed
+        from . import metriken
+        self.metriken = metriken
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        zaehler = _SQLZaehler()
+        token = _zaehler.set(zaehler)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _zaehler.reset(token)
+        self.erfassen(request, response, zaehler, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        zaehler = _SQLZaehler()
+        token = _zaehler.set(zaehler)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        except asyncio.CancelledError:
+            # The client disconnected, e.g. an autocomplete request superseded
+            # by the next keystroke, and Django cancelled the request task
+            self.abgebrochen(request)
+            raise
+        finally:
+            _zaehler.reset(token)
+        self.erfassen(request, response, zaehler, time.perf_counter() - start)
+        return response
+
+    def abgebrochen(self, request):
+        if getattr(request, 'resolver_match', None) is None:
+            # Cancelled before URL resolution, e.g. while loading the session
+            try:
+                request.resolver_match = resolve(request.path_info)
+            except Resolver404:
+                pass
+        self.metriken.ABGEBROCHEN.labels(self.metriken.view_name(request)).inc()
+
+    def erfassen(self, request, response, zaehler, dauer):
+        name = self.metriken.view_name(request)
+        methode = request.method if request.method in self.METHODEN else 'andere'
+        self.metriken.ANFRAGEN.labels(name, methode, response.status_code).inc()
+        self.metriken.DAUER.labels(name).observe(dauer)
+        if zaehler.anzahl:
+            self.metriken.DB_ABFRAGEN.labels(name).inc(zaehler.anzahl)
+            self.metriken.DB_DAUER.labels(name).inc(zaehler.zeit)
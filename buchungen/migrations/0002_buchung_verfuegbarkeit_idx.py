@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buchungen', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='buchung',
+            index=models.Index(fields=['raum', 'status', 'anreise_datum', 'abreise_datum'], name='buchung_verfuegbarkeit_idx'),
+        ),
+    ]
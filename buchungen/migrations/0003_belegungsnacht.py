@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buchungen', '0002_buchung_verfuegbarkeit_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Belegungsnacht',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('datum', models.DateField(verbose_name='Datum')),
+                ('buchung', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='belegungsnaechte', to='buchungen.buchung', verbose_name='Buchung')),
+                ('raum', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='belegungsnaechte', to='buchungen.raum', verbose_name='Raum')),
+            ],
+            options={
+                'verbose_name': 'Belegungsnacht',
+                'verbose_name_plural': 'Belegungsnächte',
+                'ordering': ['datum', 'raum'],
+                'indexes': [models.Index(fields=['datum'], name='belegungsnacht_datum_idx')],
+                'constraints': [models.UniqueConstraint(fields=('raum', 'datum'), name='belegungsnacht_raum_datum_uniq')],
+            },
+        ),
+    ]
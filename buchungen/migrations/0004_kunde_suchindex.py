@@ -0,0 +1,78 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:02
+
+import re
+import unicodedata
+
+from django.db import migrations
+
+# Index layout and normalization as of this migration, see buchungen.suche.
+# Copied on purpose: later changes to suche.py must not change this migration.
+FTS_TABELLE = 'buchungen_kunde_suche'
+
+UMLAUTE = str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'})
+
+
+def _ohne_akzente(text):
+    return ''.join(
+        zeichen for zeichen in unicodedata.normalize('NFKD', text)
+        if not unicodedata.combining(zeichen)
+    )
+
+
+def normalisiere_text(text):
+    return _ohne_akzente((text or '').lower().translate(UMLAUTE))
+
+
+def text_varianten(text):
+    varianten = [normalisiere_text(text), _ohne_akzente((text or '').lower())]
+    return ' '.join(dict.fromkeys(varianten))
+
+
+def normalisiere_telefon(nummer):
+    ziffern = re.sub(r'\D', '', nummer or '')
+    if ziffern.startswith('00'):
+        ziffern = ziffern[2:]
+    varianten = [ziffern]
+    if ziffern.startswith('49'):
+        varianten.append('0' + ziffern[2:])
+    elif ziffern.startswith('0'):
+        varianten.append('49' + ziffern[1:])
+    return [v for v in varianten if v]
+
+
+def suchindex_anlegen(apps, schema_editor):
+    # PostgreSQL gets its trigram index in 0010
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABELLE} USING fts5("
+        f"name, email, telefon, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4')"
+    )
+    Kunde = apps.get_model('buchungen', 'Kunde')
+    zeilen = [
+        (pk, text_varianten(f'{vorname} {nachname}'), normalisiere_text(email), ' '.join(normalisiere_telefon(telefon)))
+        for pk, vorname, nachname, email, telefon
+        in Kunde.objects.values_list('pk', 'vorname', 'nachname', 'email', 'telefonnummer')
+    ]
+    if zeilen:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABELLE} (rowid, name, email, telefon) VALUES (%s, %s, %s, %s)',
+                zeilen
+            )
+
+
+def suchindex_entfernen(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABELLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buchungen', '0003_belegungsnacht'),
+    ]
+
+    operations = [
+        migrations.RunPython(suchindex_anlegen, suchindex_entfernen),
+    ]
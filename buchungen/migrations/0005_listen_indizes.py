@@ -0,0 +1,35 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buchungen', '0004_kunde_suchindex'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='buchung',
+            index=models.Index(fields=['erstellt_am', 'id'], name='buchung_erstellt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='buchung',
+            index=models.Index(fields=['status', 'erstellt_am', 'id'], name='buchung_status_erstellt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='buchung',
+            index=models.Index(fields=['raum', 'erstellt_am', 'id'], name='buchung_raum_erstellt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='buchung',
+            index=models.Index(fields=['anreise_datum', 'abreise_datum'], name='buchung_zeitraum_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='kunde',
+            index=models.Index(fields=['nachname', 'vorname', 'id'], name='kunde_name_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buchungen', '0005_listen_indizes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Nummernkreis',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('praefix', models.CharField(max_length=10, verbose_name='Präfix')),
+                ('periode', models.CharField(max_length=8, verbose_name='Periode')),
+                ('letzte_nummer', models.PositiveIntegerField(default=0, verbose_name='Letzte Nummer')),
+            ],
+            options={
+                'verbose_name': 'Nummernkreis',
+                'verbose_name_plural': 'Nummernkreise',
+                'constraints': [models.UniqueConstraint(fields=('praefix', 'periode'), name='nummernkreis_praefix_periode_uniq')],
+            },
+        ),
+    ]
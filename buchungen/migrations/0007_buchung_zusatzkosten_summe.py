@@ -0,0 +1,36 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:39
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def zusatzkosten_berechnen(apps, schema_editor):
+    Buchung = apps.get_model('buchungen', 'Buchung')
+    Belegungsprotokoll = apps.get_model('buchungen', 'Belegungsprotokoll')
+    summe = Belegungsprotokoll.objects.filter(
+        buchung=OuterRef('pk')
+    ).order_by().values('buchung').annotate(summe=Sum('gesamtbetrag')).values('summe')
+    Buchung.objects.filter(belegungsprotokoll__isnull=False).distinct().update(
+        zusatzkosten_summe=Coalesce(
+            Subquery(summe), Value(Decimal('0')), output_field=DecimalField(max_digits=10, decimal_places=2)
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buchungen', '0006_nummernkreis'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='buchung',
+            name='zusatzkosten_summe',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10, verbose_name='Zusatzkosten'),
+        ),
+        migrations.RunPython(zusatzkosten_berechnen, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 6.0.1 on 2026-10-18 15:10
+
+from django.core.management.base import CommandError
+from django.db import migrations
+
+# verfuegbarkeit.BLOCKIERENDE_STATUS as of this migration
+BLOCKIERENDE_STATUS = ['optimierung', 'bestaetigt']
+
+# Conflicts listed when existing bookings overlap
+ANZEIGE_LIMIT = 50
+
+
+def ueberschneidungen_pruefen(schema_editor, status):
+    """Abort with a list of overlapping blocking bookings, which the constraint would reject"""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT r.nummer, a.buchungsnummer, a.anreise_datum, a.abreise_datum, '
+            'b.buchungsnummer, b.anreise_datum, b.abreise_datum '
+            'FROM buchungen_buchung a '
+            'JOIN buchungen_buchung b ON b.raum_id = a.raum_id AND b.id > a.id '
+            'AND b.anreise_datum < a.abreise_datum AND a.anreise_datum < b.abreise_datum '
+            'JOIN buchungen_raum r ON r.id = a.raum_id '
+            f'WHERE a.status IN ({status}) AND b.status IN ({status}) '
+            'ORDER BY r.nummer, a.anreise_datum, a.id, b.id'
+        )
+        konflikte = cursor.fetchall()
+    if not konflikte:
+        return
+    zeilen = [
+        f'  Raum {raum}: {nummer_a} ({anreise_a} bis {abreise_a}) und {nummer_b} ({anreise_b} bis {abreise_b})'
+        for raum, nummer_a, anreise_a, abreise_a, nummer_b, anreise_b, abreise_b in konflikte[:ANZEIGE_LIMIT]
+    ]
+    if len(konflikte) > ANZEIGE_LIMIT:
+        zeilen.append(f'  ... und {len(konflikte) - ANZEIGE_LIMIT} weitere')
+    # CommandError, so migrate prints the list instead of a traceback
+    raise CommandError(
+        f'{len(konflikte)} Überschneidungen bestehender Buchungen, die Doppelbuchungssperre kann nicht '
+        'angelegt werden. Bitte eine Buchung je Paar stornieren oder verlegen und erneut migrieren:\n'
+        + '\n'.join(zeilen)
+    )
+
+
+def constraint_anlegen(apps, schema_editor):
+    # Range exclusion needs PostgreSQL; other backends rely on the unique
+    # (raum, datum) constraint of Belegungsnacht
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    status = ', '.join(f"'{wert}'" for wert in BLOCKIERENDE_STATUS)
+    ueberschneidungen_pruefen(schema_editor, status)
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute(
+        'ALTER TABLE buchungen_buchung ADD CONSTRAINT buchung_keine_ueberschneidung '
+        'EXCLUDE USING gist (raum_id WITH =, daterange(anreise_datum, abreise_datum) WITH &&) '
+        f'WHERE (status IN ({status}))'
+    )
+
+
+def constraint_entfernen(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'ALTER TABLE buchungen_buchung DROP CONSTRAINT IF EXISTS buchung_keine_ueberschneidung'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buchungen', '0007_buchung_zusatzkosten_summe'),
+    ]
+
+    operations = [
+        migrations.RunPython(constraint_anlegen, constraint_entfernen),
+    ]
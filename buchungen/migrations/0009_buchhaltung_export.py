@@ -0,0 +1,35 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buchungen', '0008_buchung_keine_ueberschneidung'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportWasserzeichen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Name')),
+                ('aktualisiert_bis', models.DateTimeField(blank=True, null=True, verbose_name='Exportiert bis')),
+                ('id_bis', models.PositiveIntegerField(default=0, verbose_name='Exportiert bis ID')),
+                ('laeufe', models.PositiveIntegerField(default=0, verbose_name='Läufe')),
+                ('offen_aktualisiert_bis', models.DateTimeField(blank=True, null=True, verbose_name='Offener Lauf bis')),
+                ('offen_id_bis', models.PositiveIntegerField(blank=True, null=True, verbose_name='Offener Lauf bis ID')),
+                ('offen_datei', models.CharField(blank=True, max_length=100, verbose_name='Offene Datei')),
+                ('exportiert_am', models.DateTimeField(blank=True, null=True, verbose_name='Letzter Export')),
+            ],
+            options={
+                'verbose_name': 'Export-Wasserzeichen',
+                'verbose_name_plural': 'Export-Wasserzeichen',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='rechnung',
+            index=models.Index(fields=['aktualisiert_am', 'id'], name='rechnung_aktualisiert_idx'),
+        ),
+    ]
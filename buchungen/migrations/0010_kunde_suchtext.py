@@ -0,0 +1,45 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:40
+
+from django.db import migrations
+
+# Search expression as of this migration, see suche.PostgresTrigrammSuche
+AUSDRUCK = (
+    "replace(replace(replace(replace(lower(vorname || ' ' || nachname), 'ä', 'ae'), 'ö', 'oe'), 'ü', 'ue'), "
+    "'ß', 'ss') || ' ' || "
+    "translate(lower(vorname || ' ' || nachname), 'äöüàáâãåçèéêëìíîïñòóôõøùúûýÿ', "
+    "'aouaaaaaceeeeiiiinooooouuuyy') || ' ' || "
+    "lower(email) || ' ' || regexp_replace(telefonnummer, '[^0-9]', '', 'g')"
+)
+
+
+def suchtext_anlegen(apps, schema_editor):
+    # A stored column is computed once per write instead of once per
+    # candidate row of every search, and holds the transliterated names
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # Expression index of databases migrated while 0004 still created one
+    schema_editor.execute('DROP INDEX IF EXISTS kunde_suche_trgm_idx')
+    schema_editor.execute(
+        f'ALTER TABLE buchungen_kunde ADD COLUMN suchtext text GENERATED ALWAYS AS ({AUSDRUCK}) STORED'
+    )
+    schema_editor.execute(
+        'CREATE INDEX kunde_suchtext_trgm_idx ON buchungen_kunde USING gin (suchtext gin_trgm_ops)'
+    )
+
+
+def suchtext_entfernen(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('ALTER TABLE buchungen_kunde DROP COLUMN IF EXISTS suchtext')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buchungen', '0009_buchhaltung_export'),
+    ]
+
+    operations = [
+        migrations.RunPython(suchtext_anlegen, suchtext_entfernen),
+    ]
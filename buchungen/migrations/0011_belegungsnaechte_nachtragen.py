@@ -0,0 +1,49 @@
+# Generated by Django 6.0.1 on 2026-10-18 18:40
+
+from datetime import timedelta
+
+from django.db import migrations
+from django.db.models import Exists, OuterRef
+
+
+def naechte_nachtragen(apps, schema_editor):
+    """Occupancy nights for blocking bookings that have none yet.
+
+    0003 only created the table, so bookings saved before it had no rows.
+    Ordered per room by arrival: on overlaps the earlier booking keeps the
+    night (same rule as ``belegung_aufbauen``). Safe to run again.
+    """
+    Buchung = apps.get_model('buchungen', 'Buchung')
+    Belegungsnacht = apps.get_model('buchungen', 'Belegungsnacht')
+    datenbank = schema_editor.connection.alias
+
+    buchungen = Buchung.objects.using(datenbank).filter(
+        status__in=['optimierung', 'bestaetigt'],
+        raum__isnull=False,
+        anreise_datum__isnull=False,
+        abreise_datum__isnull=False
+    ).filter(
+        ~Exists(Belegungsnacht.objects.using(datenbank).filter(buchung=OuterRef('pk')))
+    ).order_by('raum_id', 'anreise_datum', 'id').values_list('id', 'raum_id', 'anreise_datum', 'abreise_datum')
+
+    batch = []
+    for buchung_id, raum_id, anreise, abreise in buchungen.iterator(chunk_size=2000):
+        batch.extend(
+            Belegungsnacht(raum_id=raum_id, datum=anreise + timedelta(days=i), buchung_id=buchung_id)
+            for i in range((abreise - anreise).days)
+        )
+        if len(batch) >= 5000:
+            Belegungsnacht.objects.using(datenbank).bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    Belegungsnacht.objects.using(datenbank).bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buchungen', '0010_kunde_suchtext'),
+    ]
+
+    operations = [
+        migrations.RunPython(naechte_nachtragen, migrations.RunPython.noop),
+    ]
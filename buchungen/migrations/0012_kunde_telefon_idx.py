@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-18 19:20
+
+from django.db import migrations
+
+# Phone digits as of this migration, see suche.PostgresTrigrammSuche.TELEFON
+TELEFON = "regexp_replace(telefonnummer, '[^0-9]', '', 'g')"
+
+
+def index_anlegen(apps, schema_editor):
+    # Prefix search on the digits (LIKE '0170%'); SQLite uses its FTS table
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS kunde_telefon_ziffern_idx ON buchungen_kunde (({TELEFON}) text_pattern_ops)'
+    )
+
+
+def index_entfernen(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS kunde_telefon_ziffern_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buchungen', '0011_belegungsnaechte_nachtragen'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_anlegen, index_entfernen),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-18 20:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buchungen', '0012_kunde_telefon_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportierteRechnung',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('datei', models.CharField(max_length=100, verbose_name='Datei')),
+                ('zeilen', models.JSONField(default=list, verbose_name='Buchungszeilen')),
+                ('storno', models.JSONField(default=list, verbose_name='Stornierte Buchungszeilen')),
+                ('rechnung', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exporte', to='buchungen.rechnung', verbose_name='Rechnung')),
+            ],
+            options={
+                'verbose_name': 'Exportierte Rechnung',
+                'verbose_name_plural': 'Exportierte Rechnungen',
+                'indexes': [models.Index(fields=['rechnung', 'id'], name='export_rechnung_idx'), models.Index(fields=['datei'], name='export_datei_idx')],
+            },
+        ),
+    ]
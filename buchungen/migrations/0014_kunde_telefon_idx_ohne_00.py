@@ -0,0 +1,36 @@
+# Generated by Django 6.0.1 on 2026-10-18 20:40
+
+from django.db import migrations
+
+INDEX = 'kunde_telefon_ziffern_idx'
+
+# Phone digits of 0012 and as of this migration, see suche.PostgresTrigrammSuche.TELEFON
+TELEFON_ALT = "regexp_replace(telefonnummer, '[^0-9]', '', 'g')"
+TELEFON = f"regexp_replace({TELEFON_ALT}, '^00', '')"
+
+
+def _index(schema_editor, ausdruck):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX}')
+    schema_editor.execute(f'CREATE INDEX {INDEX} ON buchungen_kunde (({ausdruck}) text_pattern_ops)')
+
+
+def index_anlegen(apps, schema_editor):
+    # Numbers entered as 0049... are matched like +49...
+    _index(schema_editor, TELEFON)
+
+
+def index_zuruecksetzen(apps, schema_editor):
+    _index(schema_editor, TELEFON_ALT)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buchungen', '0013_exportierte_rechnung'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_anlegen, index_zuruecksetzen),
+    ]
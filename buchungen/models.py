@@ -1,9 +1,83 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Case, DecimalField, F, Value, When
 from django.contrib.auth.models import User
 from django.core.validators import RegexValidator
 from django.utils import timezone
 
 
+class Nummernkreis(models.Model):
+    """Number sequence per prefix and period - Nummernkreise"""
+    praefix = models.CharField(max_length=10, verbose_name="Präfix")
+    periode = models.CharField(max_length=8, verbose_name="Periode")
+    letzte_nummer = models.PositiveIntegerField(default=0, verbose_name="Letzte Nummer")
+
+    class Meta:
+        verbose_name = "Nummernkreis"
+        verbose_name_plural = "Nummernkreise"
+        constraints = [
+            models.UniqueConstraint(fields=['praefix', 'periode'], name='nummernkreis_praefix_periode_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.praefix}-{self.periode}: {self.letzte_nummer}"
+
+
+class ExportWasserzeichen(models.Model):
+    """Progress of an incremental export - Export-Wasserzeichen
+
+    Rows up to (``aktualisiert_bis``, ``id_bis``) have been exported. The
+    ``offen_*`` fields describe the batch being written; they are set before
+    the file is written and cleared when it is complete, so an interrupted run
+    writes the same batch again.
+    """
+    name = models.CharField(max_length=50, unique=True, verbose_name="Name")
+    aktualisiert_bis = models.DateTimeField(null=True, blank=True, verbose_name="Exportiert bis")
+    id_bis = models.PositiveIntegerField(default=0, verbose_name="Exportiert bis ID")
+    laeufe = models.PositiveIntegerField(default=0, verbose_name="Läufe")
+    offen_aktualisiert_bis = models.DateTimeField(null=True, blank=True, verbose_name="Offener Lauf bis")
+    offen_id_bis = models.PositiveIntegerField(null=True, blank=True, verbose_name="Offener Lauf bis ID")
+    offen_datei = models.CharField(max_length=100, blank=True, verbose_name="Offene Datei")
+    exportiert_am = models.DateTimeField(null=True, blank=True, verbose_name="Letzter Export")
+
+    class Meta:
+        verbose_name = "Export-Wasserzeichen"
+        verbose_name_plural = "Export-Wasserzeichen"
+
+    def __str__(self):
+        return f"{self.name}: {self.aktualisiert_bis or '-'} / {self.id_bis}"
+
+
+class ExportierteRechnung(models.Model):
+    """Invoice lines written to an accounting export file - exportierte Rechnung
+
+    ``zeilen`` are the invoice's booking lines as written to ``datei``,
+    ``storno`` the previously exported lines reversed in the same file. The
+    latest entry of an invoice is what the bookkeeping currently holds.
+    """
+    rechnung = models.ForeignKey(
+        'Rechnung',
+        on_delete=models.CASCADE,
+        related_name='exporte',
+        verbose_name="Rechnung"
+    )
+    datei = models.CharField(max_length=100, verbose_name="Datei")
+    zeilen = models.JSONField(default=list, verbose_name="Buchungszeilen")
+    storno = models.JSONField(default=list, verbose_name="Stornierte Buchungszeilen")
+
+    class Meta:
+        verbose_name = "Exportierte Rechnung"
+        verbose_name_plural = "Exportierte Rechnungen"
+        indexes = [
+            models.Index(fields=['rechnung', 'id'], name='export_rechnung_idx'),
+            models.Index(fields=['datei'], name='export_datei_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.rechnung_id} in {self.datei}"
+
+
 class Kunde(models.Model):
     """Customer model - Kundenverwaltung"""
     vorname = models.CharField(max_length=100, verbose_name="Vorname")
@@ -33,6 +107,10 @@ class Kunde(models.Model):
         verbose_name = "Kunde"
         verbose_name_plural = "Kunden"
         ordering = ['nachname', 'vorname']
+        indexes = [
+            # Keyset pagination of kunde_liste
+            models.Index(fields=['nachname', 'vorname', 'id'], name='kunde_name_idx'),
+        ]
 
     def __str__(self):
         return f"{self.vorname} {self.nachname}"
@@ -97,15 +175,25 @@ class Raum(models.Model):
     def __str__(self):
         return f"Raum {self.nummer} - {self.name}"
 
-    def ist_verfuegbar(self, start_datum, end_datum):
+    def ist_verfuegbar(self, start_datum, end_datum, ausser_buchung=None):
         """Check if room is available for the given date range"""
-        konflikte = Buchung.objects.filter(
-            raum=self,
-            status__in=['optimierung', 'bestaetigt'],
-            abreise_datum__gt=start_datum,
-            anreise_datum__lt=end_datum
-        )
-        return not konflikte.exists()
+        from .verfuegbarkeit import ist_verfuegbar
+        return ist_verfuegbar(self, start_datum, end_datum, ausser_buchung)
+
+
+class BuchungQuerySet(models.QuerySet):
+    def with_gesamtpreis(self):
+        """Annotate ``gesamtpreis``: nights x room price plus additional charges"""
+        betrag = DecimalField(max_digits=12, decimal_places=2)
+        return self.annotate(gesamtpreis=Case(
+            When(
+                anzahl_naechte__gt=0,
+                then=F('anzahl_naechte') * F('raum__raumtyp__preis_pro_nacht')
+                + F('zusatzkosten_summe')
+            ),
+            default=Value(Decimal('0')),
+            output_field=betrag
+        ))
 
 
 class Buchung(models.Model):
@@ -160,43 +248,99 @@ class Buchung(models.Model):
     erstellt_am = models.DateTimeField(auto_now_add=True, verbose_name="Erstellt am")
     aktualisiert_am = models.DateTimeField(auto_now=True, verbose_name="Aktualisiert am")
     notizen = models.TextField(blank=True, verbose_name="Notizen")
+    # Sum of Belegungsprotokoll.gesamtbetrag, maintained by Belegungsprotokoll
+    zusatzkosten_summe = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        verbose_name="Zusatzkosten"
+    )
+
+    objects = BuchungQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Buchung"
         verbose_name_plural = "Buchungen"
         ordering = ['-erstellt_am']
+        indexes = [
+            # Covers the overlap predicate of the availability engine
+            models.Index(
+                fields=['raum', 'status', 'anreise_datum', 'abreise_datum'],
+                name='buchung_verfuegbarkeit_idx'
+            ),
+            # Keyset pagination of buchung_liste, unfiltered and per filter
+            models.Index(fields=['erstellt_am', 'id'], name='buchung_erstellt_idx'),
+            models.Index(fields=['status', 'erstellt_am', 'id'], name='buchung_status_erstellt_idx'),
+            models.Index(fields=['raum', 'erstellt_am', 'id'], name='buchung_raum_erstellt_idx'),
+            models.Index(fields=['anreise_datum', 'abreise_datum'], name='buchung_zeitraum_idx'),
+        ]
 
     def __str__(self):
         return f"Buchung {self.buchungsnummer} - {self.kunde}"
 
     def save(self, *args, **kwargs):
-        if not self.buchungsnummer:
-            # Generate booking number: BU-YYYYMMDD-XXX
-            import random
-            today = timezone.now().strftime('%Y%m%d')
-            random_num = random.randint(100, 999)
-            self.buchungsnummer = f"BU-{today}-{random_num}"
+        from .belegung import synchronisiere_naechte
+        from .nummern import reserviere_nummern
+        from .summen import ohne_summenfeld
         
         # Calculate number of nights
         if self.anreise_datum and self.abreise_datum:
             delta = self.abreise_datum - self.anreise_datum
             self.anzahl_naechte = delta.days
         
-        super().save(*args, **kwargs)
+        # Number, booking and occupancy commit together; a taken night rolls
+        # back the whole save including the allocated number
+        with transaction.atomic():
+            if not self.buchungsnummer:
+                # Generate booking number: BU-YYYYMMDD-NNNN
+                self.buchungsnummer = reserviere_nummern('BU')[0]
+            super().save(*args, **ohne_summenfeld(self, 'zusatzkosten_summe', kwargs))
+            synchronisiere_naechte(self)
 
     def get_gesamtpreis(self):
         """Calculate total price for booking"""
+        # Computed by the database when loaded via with_gesamtpreis()
+        if hasattr(self, 'gesamtpreis'):
+            return self.gesamtpreis.quantize(Decimal('0.01'))
         if self.anzahl_naechte and self.raum:
             raumpreis = self.raum.raumtyp.preis_pro_nacht * self.anzahl_naechte
             # Add additional charges from Belegungsprotokoll
-            zusatzkosten = sum(
-                posten.gesamtbetrag 
-                for posten in self.belegungsprotokoll_set.all()
-            )
-            return raumpreis + zusatzkosten
+            return raumpreis + self.zusatzkosten_summe
         return 0
 
 
+class Belegungsnacht(models.Model):
+    """Materialized occupancy per room and night - Belegungsnächte"""
+    raum = models.ForeignKey(
+        Raum,
+        on_delete=models.CASCADE,
+        related_name='belegungsnaechte',
+        verbose_name="Raum"
+    )
+    datum = models.DateField(verbose_name="Datum")
+    buchung = models.ForeignKey(
+        Buchung,
+        on_delete=models.CASCADE,
+        related_name='belegungsnaechte',
+        verbose_name="Buchung"
+    )
+
+    class Meta:
+        verbose_name = "Belegungsnacht"
+        verbose_name_plural = "Belegungsnächte"
+        ordering = ['datum', 'raum']
+        constraints = [
+            models.UniqueConstraint(fields=['raum', 'datum'], name='belegungsnacht_raum_datum_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['datum'], name='belegungsnacht_datum_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.raum} - {self.datum:%d.%m.%Y}"
+
+
 class Belegungsprotokoll(models.Model):
     """Occupancy Protocol - Belegungsprotokoll"""
     buchung = models.ForeignKey(
@@ -230,8 +374,17 @@ class Belegungsprotokoll(models.Model):
         return f"{self.leistung} - {self.buchung.buchungsnummer}"
 
     def save(self, *args, **kwargs):
+        from .summen import summe_nachfuehren
+        
         self.gesamtbetrag = self.einzelpreis * self.anzahl
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            vorher = None
+            if not self._state.adding:
+                vorher = Belegungsprotokoll.objects.select_for_update().filter(
+                    pk=self.pk
+                ).values_list('buchung_id', 'gesamtbetrag').first()
+            super().save(*args, **kwargs)
+            summe_nachfuehren(Buchung, 'zusatzkosten_summe', vorher, (self.buchung_id, self.gesamtbetrag))
 
 
 class Rechnung(models.Model):
@@ -282,18 +435,24 @@ class Rechnung(models.Model):
         verbose_name = "Rechnung"
         verbose_name_plural = "Rechnungen"
         ordering = ['-erstellt_am']
+        indexes = [
+            # Incremental accounting export, see buchhaltung.py
+            models.Index(fields=['aktualisiert_am', 'id'], name='rechnung_aktualisiert_idx'),
+        ]
 
     def __str__(self):
         return f"Rechnung {self.rechnungsnummer}"
 
     def save(self, *args, **kwargs):
-        if not self.rechnungsnummer:
-            # Generate invoice number: RE-YYYYMMDD-XXX
-            import random
-            today = timezone.now().strftime('%Y%m%d')
-            random_num = random.randint(100, 999)
-            self.rechnungsnummer = f"RE-{today}-{random_num}"
-        super().save(*args, **kwargs)
+        from .nummern import reserviere_nummern
+        from .summen import ohne_summenfeld
+        
+        with transaction.atomic():
+            if not self.rechnungsnummer:
+                # Generate invoice number: RE-YYYYMMDD-NNNN
+                self.rechnungsnummer = reserviere_nummern('RE')[0]
+            # gesamtbetrag is maintained by Rechnungsposten once the invoice exists
+            super().save(*args, **ohne_summenfeld(self, 'gesamtbetrag', kwargs))
 
     def berechne_gesamtbetrag(self):
         """Calculate total amount from booking and additional items"""
@@ -330,5 +489,14 @@ class Rechnungsposten(models.Model):
         return f"{self.beschreibung} - {self.rechnung.rechnungsnummer}"
 
     def save(self, *args, **kwargs):
+        from .summen import summe_nachfuehren
+        
         self.gesamtpreis = self.einzelpreis * self.menge
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            vorher = None
+            if not self._state.adding:
+                vorher = Rechnungsposten.objects.select_for_update().filter(
+                    pk=self.pk
+                ).values_list('rechnung_id', 'gesamtpreis').first()
+            super().save(*args, **kwargs)
+            summe_nachfuehren(Rechnung, 'gesamtbetrag', vorher, (self.rechnung_id, self.gesamtpreis))
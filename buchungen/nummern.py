@@ -0,0 +1,72 @@
+"""Booking and invoice numbers - Nummernkreise
+
+Numbers are drawn from a counter row per prefix and period (day or year,
+setting ``NUMMERNKREIS_PERIODE``) with an atomic increment. The row lock taken
+by the UPDATE serializes concurrent workers, and because the increment runs
+in the caller's transaction a rolled back booking also returns its number,
+so the sequence stays gapless. ``reserviere_nummern(praefix, n)`` hands out a
+whole block in one statement for bulk creation.
+"""
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Nummernkreis
+
+# strftime format of the period and minimum number of digits
+PERIODEN = {
+    'tag': ('%Y%m%d', 4),
+    'jahr': ('%Y', 6),
+}
+
+# Backends with UPDATE ... RETURNING (SQLite from 3.35). The feature flag
+# can_return_columns_from_insert is about INSERT only; other backends take
+# the fallback of UPDATE and SELECT
+UPDATE_RETURNING = ('postgresql', 'sqlite')
+
+
+def _periode(datum=None):
+    muster, stellen = PERIODEN[getattr(settings, 'NUMMERNKREIS_PERIODE', 'tag')]
+    return (datum or timezone.localdate()).strftime(muster), stellen
+
+
+def _erhoehe(praefix, periode, anzahl):
+    """Add ``anzahl`` to the counter and return the new value"""
+    tabelle = Nummernkreis._meta.db_table
+    for _ in range(2):
+        if connection.vendor in UPDATE_RETURNING:
+            # Increment and read back in one round trip (UPDATE ... RETURNING)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {tabelle} SET letzte_nummer = letzte_nummer + %s '
+                    f'WHERE praefix = %s AND periode = %s RETURNING letzte_nummer',
+                    [anzahl, praefix, periode]
+                )
+                zeile = cursor.fetchone()
+            if zeile:
+                return zeile[0]
+        else:
+            kreis = Nummernkreis.objects.filter(praefix=praefix, periode=periode)
+            if kreis.update(letzte_nummer=F('letzte_nummer') + anzahl):
+                return kreis.values_list('letzte_nummer', flat=True).get()
+
+        # First number of the period; a concurrent creator makes us retry the UPDATE
+        try:
+            with transaction.atomic():
+                Nummernkreis.objects.create(praefix=praefix, periode=periode, letzte_nummer=anzahl)
+            return anzahl
+        except IntegrityError:
+            continue
+    raise RuntimeError(f'Nummernkreis {praefix}-{periode} konnte nicht angelegt werden')
+
+
+def reserviere_nummern(praefix, anzahl=1, datum=None):
+    """Allocate ``anzahl`` consecutive numbers, e.g. ['BU-20260129-0001', ...]"""
+    periode, stellen = _periode(datum)
+    with transaction.atomic():
+        letzte = _erhoehe(praefix, periode, anzahl)
+    return [
+        f'{praefix}-{periode}-{nummer:0{stellen}d}'
+        for nummer in range(letzte - anzahl + 1, letzte + 1)
+    ]
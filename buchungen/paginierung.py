@@ -0,0 +1,94 @@
+"""Keyset pagination - Blättern ohne OFFSET
+
+Pages are addressed by an opaque cursor holding the sort key of the first or
+last row of the neighbouring page, so the database seeks straight into the
+matching index instead of counting past skipped rows: page N costs the same
+as page 1. The sort key must be unique, i.e. end with the primary key.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+MAX_SEITENGROESSE = 200
+
+
+class UngueltigerCursor(ValueError):
+    pass
+
+
+def _feld(model, name):
+    return model._meta.pk if name in ('id', 'pk') else model._meta.get_field(name)
+
+
+def _kodiere(werte, richtung):
+    daten = json.dumps({'w': werte, 'r': richtung}, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(daten.encode()).decode().rstrip('=')
+
+
+def _dekodiere(cursor, model, felder):
+    try:
+        daten = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        werte, richtung = daten['w'], daten['r']
+        if richtung not in ('vor', 'zurueck') or len(werte) != len(felder):
+            raise UngueltigerCursor(cursor)
+        return [
+            _feld(model, name.lstrip('-')).to_python(wert) for name, wert in zip(felder, werte)
+        ], richtung
+    except (ValueError, TypeError, KeyError, ValidationError) as fehler:
+        raise UngueltigerCursor(cursor) from fehler
+
+
+def _nach(felder, werte):
+    """Rows strictly after ``werte`` in the order given by ``felder``"""
+    bedingung = Q()
+    gleich = {}
+    for name, wert in zip(felder, werte):
+        feld = name.lstrip('-')
+        vergleich = 'lt' if name.startswith('-') else 'gt'
+        bedingung |= Q(**gleich, **{f'{feld}__{vergleich}': wert})
+        gleich[feld] = wert
+    return bedingung
+
+
+def _umgekehrt(felder):
+    return [name[1:] if name.startswith('-') else '-' + name for name in felder]
+
+
+def _schluessel(objekt, felder):
+    return [getattr(objekt, name.lstrip('-')) for name in felder]
+
+
+def keyset_seite(queryset, felder, cursor=None, seitengroesse=50):
+    """Return one page of ``queryset`` ordered by ``felder``.
+
+    The result dict holds ``objekte`` plus ``weiter``/``zurueck`` cursors
+    (None at either end). An invalid cursor yields the first page.
+    """
+    seitengroesse = max(1, min(seitengroesse, MAX_SEITENGROESSE))
+    richtung = 'vor'
+    if cursor:
+        try:
+            werte, richtung = _dekodiere(cursor, queryset.model, felder)
+        except UngueltigerCursor:
+            cursor = None
+
+    if not cursor:
+        zeilen = list(queryset.order_by(*felder)[:seitengroesse + 1])
+        mehr, davor = len(zeilen) > seitengroesse, False
+    elif richtung == 'vor':
+        zeilen = list(queryset.filter(_nach(felder, werte)).order_by(*felder)[:seitengroesse + 1])
+        mehr, davor = len(zeilen) > seitengroesse, True
+    else:
+        rueckwaerts = _umgekehrt(felder)
+        zeilen = list(queryset.filter(_nach(rueckwaerts, werte)).order_by(*rueckwaerts)[:seitengroesse + 1])
+        davor, mehr = len(zeilen) > seitengroesse, True
+        zeilen = zeilen[:seitengroesse][::-1]
+    objekte = zeilen[:seitengroesse]
+
+    return {
+        'objekte': objekte,
+        'weiter': _kodiere(_schluessel(objekte[-1], felder), 'vor') if mehr and objekte else None,
+        'zurueck': _kodiere(_schluessel(objekte[0], felder), 'zurueck') if davor and objekte else None,
+    }
@@ -0,0 +1,166 @@
+"""Invoice PDFs - Rechnungs-PDF
+
+``rechnung_daten()`` collects everything printed on an invoice into plain
+data, ``rendere_rechnung_pdf()`` turns that data into PDF bytes without
+touching the database (so it can also run in worker processes), and
+``rechnung_pdf_datei()`` keeps rendered files of finished invoices in the
+``rechnungen`` storage, keyed by a hash of the printed content. A file is
+only re-rendered when the hash changes; reportlab is imported on render only.
+"""
+import hashlib
+import json
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import InvalidStorageError, default_storage, storages
+
+# Bump when the layout below changes, so stored files are re-rendered
+LAYOUT_VERSION = 1
+
+# Invoices in these states no longer change and are kept as files
+ARCHIV_STATUS = ('fertig', 'bezahlt')
+
+
+def rechnung_daten(rechnung, posten=None):
+    """Everything printed on the invoice, as JSON-serializable data"""
+    kunde = rechnung.buchung.kunde
+    if posten is None:
+        posten = rechnung.posten.all()
+    return {
+        'layout': LAYOUT_VERSION,
+        'rechnungsnummer': rechnung.rechnungsnummer,
+        'rechnungsdatum': rechnung.rechnungsdatum.strftime('%d.%m.%Y'),
+        'faelligkeitsdatum': rechnung.faelligkeitsdatum.strftime('%d.%m.%Y'),
+        'kunde': {
+            'name': f"{kunde.vorname} {kunde.nachname}",
+            'strasse': kunde.strasse,
+            'ort': f"{kunde.plz} {kunde.ort}",
+        },
+        'posten': [
+            [p.beschreibung, p.menge, f"{p.einzelpreis:.2f}", f"{p.gesamtpreis:.2f}"]
+            for p in posten
+        ],
+        'gesamtbetrag': f"{rechnung.gesamtbetrag:.2f}",
+    }
+
+
+def inhalts_hash(daten):
+    return hashlib.sha256(json.dumps(daten, sort_keys=True).encode()).hexdigest()
+
+
+def dateiname(daten):
+    return f"Rechnung_{daten['rechnungsnummer']}.pdf"
+
+
+def rendere_rechnung_pdf(daten):
+    """Render the invoice layout from rechnung_daten() output to PDF bytes"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.units import cm
+    from io import BytesIO
+
+    # Create PDF
+    buffer = BytesIO()
+    p = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+
+    # Header
+    p.setFont("Helvetica-Bold", 16)
+    p.drawString(2*cm, height - 2*cm, "Passat Buchungssystem")
+
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(2*cm, height - 3*cm, "RECHNUNG")
+
+    # Invoice details
+    p.setFont("Helvetica", 10)
+    y_position = height - 4*cm
+    p.drawString(2*cm, y_position, f"Rechnungsnummer: {daten['rechnungsnummer']}")
+    y_position -= 0.5*cm
+    p.drawString(2*cm, y_position, f"Rechnungsdatum: {daten['rechnungsdatum']}")
+    y_position -= 0.5*cm
+    p.drawString(2*cm, y_position, f"Fälligkeitsdatum: {daten['faelligkeitsdatum']}")
+
+    # Customer details
+    kunde = daten['kunde']
+    y_position -= 1.5*cm
+    p.setFont("Helvetica-Bold", 11)
+    p.drawString(2*cm, y_position, "Kunde:")
+    y_position -= 0.5*cm
+    p.setFont("Helvetica", 10)
+    p.drawString(2*cm, y_position, kunde['name'])
+    y_position -= 0.5*cm
+    p.drawString(2*cm, y_position, kunde['strasse'])
+    y_position -= 0.5*cm
+    p.drawString(2*cm, y_position, kunde['ort'])
+
+    # Invoice items
+    y_position -= 1.5*cm
+    p.setFont("Helvetica-Bold", 11)
+    p.drawString(2*cm, y_position, "Rechnungsposten:")
+    y_position -= 0.7*cm
+
+    p.setFont("Helvetica-Bold", 9)
+    p.drawString(2*cm, y_position, "Beschreibung")
+    p.drawString(10*cm, y_position, "Menge")
+    p.drawString(12*cm, y_position, "Einzelpreis")
+    p.drawString(15*cm, y_position, "Gesamtpreis")
+    y_position -= 0.5*cm
+
+    p.setFont("Helvetica", 9)
+    for beschreibung, menge, einzelpreis, gesamtpreis in daten['posten']:
+        p.drawString(2*cm, y_position, beschreibung[:40])
+        p.drawString(10*cm, y_position, str(menge))
+        p.drawString(12*cm, y_position, f"€ {einzelpreis}")
+        p.drawString(15*cm, y_position, f"€ {gesamtpreis}")
+        y_position -= 0.5*cm
+
+    # Total
+    y_position -= 0.5*cm
+    p.setFont("Helvetica-Bold", 11)
+    p.drawString(12*cm, y_position, "Gesamtbetrag:")
+    p.drawString(15*cm, y_position, f"€ {daten['gesamtbetrag']}")
+
+    p.showPage()
+    p.save()
+
+    return buffer.getvalue()
+
+
+def pdf_storage():
+    """The 'rechnungen' storage from settings.STORAGES, else the default storage"""
+    try:
+        return storages['rechnungen']
+    except InvalidStorageError:
+        return default_storage
+
+
+def speicherpfad(rechnung_pk, hash_wert):
+    return f'rechnungen/{rechnung_pk}/{hash_wert}.pdf'
+
+
+def speichere_pdf(rechnung_pk, hash_wert, inhalt):
+    """Store a rendered PDF and drop files of older versions of the invoice"""
+    storage = pdf_storage()
+    pfad = speicherpfad(rechnung_pk, hash_wert)
+    gespeichert = storage.save(pfad, ContentFile(inhalt))
+    if gespeichert != pfad:
+        # A concurrent request stored the same content first
+        storage.delete(gespeichert)
+    verzeichnis = f'rechnungen/{rechnung_pk}'
+    for alt in storage.listdir(verzeichnis)[1]:
+        if alt != f'{hash_wert}.pdf':
+            storage.delete(f'{verzeichnis}/{alt}')
+    return pfad
+
+
+def rechnung_pdf_datei(rechnung, daten, hash_wert):
+    """Open the stored PDF of a finished invoice, rendering it on first use.
+
+    Returns an open file, or None for invoices that are still drafts.
+    """
+    if rechnung.status not in ARCHIV_STATUS:
+        return None
+    storage = pdf_storage()
+    pfad = speicherpfad(rechnung.pk, hash_wert)
+    if not storage.exists(pfad):
+        speichere_pdf(rechnung.pk, hash_wert, rendere_rechnung_pdf(daten))
+    return storage.open(pfad, 'rb')
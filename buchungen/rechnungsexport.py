@@ -0,0 +1,109 @@
+"""Invoice export - alle Rechnungs-PDFs eines Zeitraums als ZIP
+
+``zip_stream()`` yields the ZIP archive chunk by chunk while the PDFs are
+still being rendered: invoices are read with a database iterator, missing
+PDFs are rendered in a process pool and at most ``FENSTER`` PDFs per process
+are in flight, so memory stays bounded however many invoices are exported.
+PDFs already in the store are reused, newly rendered finished invoices are
+stored for later downloads.
+"""
+import multiprocessing
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from . import pdf
+from .models import Rechnung
+
+# Pending PDFs per worker process
+FENSTER = 4
+
+
+class _Puffer:
+    """Write-only file object collecting what zipfile writes between chunks"""
+
+    def __init__(self):
+        self.teile = []
+
+    def write(self, daten):
+        self.teile.append(bytes(daten))
+        return len(daten)
+
+    def flush(self):
+        pass
+
+    def abholen(self):
+        daten = b''.join(self.teile)
+        self.teile = []
+        return daten
+
+
+def rechnungen_auswahl(von=None, bis=None, status=None):
+    """Invoices with ``rechnungsdatum`` between ``von`` and ``bis`` (inclusive)"""
+    rechnungen = Rechnung.objects.all()
+    if von:
+        rechnungen = rechnungen.filter(rechnungsdatum__gte=von)
+    if bis:
+        rechnungen = rechnungen.filter(rechnungsdatum__lte=bis)
+    if status:
+        rechnungen = rechnungen.filter(status__in=status)
+    return rechnungen
+
+
+def _pool(prozesse):
+    # Workers only render; they must not inherit the parent's database
+    # connections, so they are not plain forks of the current process
+    methoden = multiprocessing.get_all_start_methods()
+    kontext = multiprocessing.get_context('forkserver' if 'forkserver' in methoden else 'spawn')
+    return ProcessPoolExecutor(max_workers=prozesse, mp_context=kontext)
+
+
+def rechnungs_pdfs(rechnungen, prozesse=None):
+    """Yield (dateiname, pdf_bytes) for ``rechnungen`` in queryset order"""
+    prozesse = prozesse or os.cpu_count() or 1
+    rechnungen = rechnungen.select_related('buchung__kunde').prefetch_related('posten').order_by('rechnungsdatum', 'pk')
+    storage = pdf.pdf_storage()
+    pool = _pool(prozesse) if prozesse > 1 else None
+    offen = deque()
+
+    def fertig(eintrag):
+        rechnung, daten, hash_wert, ergebnis = eintrag
+        if ergebnis is None:
+            with storage.open(pdf.speicherpfad(rechnung.pk, hash_wert), 'rb') as datei:
+                inhalt = datei.read()
+        else:
+            inhalt = ergebnis.result() if pool else ergebnis
+            if rechnung.status in pdf.ARCHIV_STATUS:
+                pdf.speichere_pdf(rechnung.pk, hash_wert, inhalt)
+        return pdf.dateiname(daten), inhalt
+
+    try:
+        for rechnung in rechnungen.iterator(chunk_size=200):
+            daten = pdf.rechnung_daten(rechnung)
+            hash_wert = pdf.inhalts_hash(daten)
+            if rechnung.status in pdf.ARCHIV_STATUS and storage.exists(pdf.speicherpfad(rechnung.pk, hash_wert)):
+                ergebnis = None
+            elif pool:
+                ergebnis = pool.submit(pdf.rendere_rechnung_pdf, daten)
+            else:
+                ergebnis = pdf.rendere_rechnung_pdf(daten)
+            offen.append((rechnung, daten, hash_wert, ergebnis))
+            if len(offen) >= prozesse * FENSTER:
+                yield fertig(offen.popleft())
+        while offen:
+            yield fertig(offen.popleft())
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+
+
+def zip_stream(rechnungen, prozesse=None):
+    """Yield the bytes of a ZIP archive holding one PDF per invoice"""
+    puffer = _Puffer()
+    # PDFs are compressed already, storing them keeps the main process cheap
+    with zipfile.ZipFile(puffer, 'w', zipfile.ZIP_STORED) as archiv:
+        for name, inhalt in rechnungs_pdfs(rechnungen, prozesse):
+            archiv.writestr(name, inhalt)
+            yield puffer.abholen()
+    yield puffer.abholen()
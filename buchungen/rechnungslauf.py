@@ -0,0 +1,123 @@
+"""Invoice creation - Rechnungserstellung und Rechnungslauf
+
+Line items are built in memory from the booking and its prefetched
+Belegungsprotokoll rows; the total is the sum of the items, so no invoice has
+to be saved twice or re-read. ``rechnungslauf()`` invoices all confirmed,
+finished bookings without an invoice in chunks, one transaction per chunk.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import kennzahlen, metriken
+from .models import Buchung, Rechnung, Rechnungsposten
+from .nummern import reserviere_nummern
+
+ZAHLUNGSZIEL_TAGE = 14
+
+
+def rechnungsposten_fuer(buchung, protokolle):
+    """Unsaved line items for a booking and their total"""
+    posten = []
+    if buchung.raum and buchung.anzahl_naechte:
+        preis = buchung.raum.raumtyp.preis_pro_nacht
+        posten.append(Rechnungsposten(
+            beschreibung=f"Raum {buchung.raum.nummer} - {buchung.anzahl_naechte} Nächte",
+            menge=buchung.anzahl_naechte,
+            einzelpreis=preis,
+            gesamtpreis=preis * buchung.anzahl_naechte
+        ))
+    for protokoll in protokolle:
+        posten.append(Rechnungsposten(
+            beschreibung=protokoll.leistung,
+            menge=protokoll.anzahl,
+            einzelpreis=protokoll.einzelpreis,
+            gesamtpreis=protokoll.einzelpreis * protokoll.anzahl
+        ))
+    return posten, sum((p.gesamtpreis for p in posten), Decimal('0'))
+
+
+def speichere_rechnung(rechnung, posten, summe):
+    """Save an invoice with its line items in one transaction"""
+    with transaction.atomic():
+        rechnung.gesamtbetrag = summe
+        rechnung.save()
+        for eintrag in posten:
+            eintrag.rechnung = rechnung
+        Rechnungsposten.objects.bulk_create(posten)
+    return rechnung
+
+
+def offene_buchungen(stichtag=None, buchungen=None):
+    """Confirmed bookings that ended by ``stichtag`` and have no invoice yet.
+
+    ``buchungen`` narrows the candidates, e.g. to an admin selection.
+    """
+    stichtag = stichtag or timezone.localdate()
+    if buchungen is None:
+        buchungen = Buchung.objects.all()
+    return buchungen.filter(
+        ~Exists(Rechnung.objects.filter(buchung=OuterRef('pk'))),
+        status='bestaetigt',
+        abreise_datum__lte=stichtag
+    )
+
+
+def rechnungslauf(buchungen=None, stichtag=None, status='entwurf', benutzer=None,
+                  chunk_size=500, probelauf=False):
+    """Invoice the open bookings (see offene_buchungen()) among ``buchungen``.
+
+    Returns one (buchungsnummer, kunde, betrag, rechnungsnummer) tuple per
+    booking; ``rechnungsnummer`` is None in a dry run.
+    """
+    ids = list(offene_buchungen(stichtag, buchungen).order_by('pk').values_list('pk', flat=True))
+    heute = timezone.localdate()
+    ergebnis = []
+
+    for start in range(0, len(ids), chunk_size):
+        with transaction.atomic():
+            chunk = list(
+                offene_buchungen(stichtag).filter(
+                    pk__in=ids[start:start + chunk_size]
+                ).select_related('kunde', 'raum__raumtyp')
+                .prefetch_related('belegungsprotokoll_set')
+                .order_by('pk')
+            )
+            rechnungen = []
+            alle_posten = []
+            for buchung in chunk:
+                posten, summe = rechnungsposten_fuer(buchung, buchung.belegungsprotokoll_set.all())
+                rechnungen.append((buchung, Rechnung(
+                    buchung=buchung,
+                    rechnungsdatum=heute,
+                    faelligkeitsdatum=heute + timedelta(days=ZAHLUNGSZIEL_TAGE),
+                    status=status,
+                    gesamtbetrag=summe,
+                    erstellt_von=benutzer
+                ), posten))
+            if probelauf or not rechnungen:
+                ergebnis.extend(
+                    (b.buchungsnummer, str(b.kunde), r.gesamtbetrag, None) for b, r, _ in rechnungen
+                )
+                continue
+
+            nummern = reserviere_nummern('RE', len(rechnungen))
+            for nummer, (_, rechnung, _) in zip(nummern, rechnungen):
+                rechnung.rechnungsnummer = nummer
+            Rechnung.objects.bulk_create([r for _, r, _ in rechnungen])
+            for _, rechnung, posten in rechnungen:
+                for eintrag in posten:
+                    eintrag.rechnung = rechnung
+                alle_posten.extend(posten)
+            Rechnungsposten.objects.bulk_create(alle_posten, batch_size=1000)
+            ergebnis.extend(
+                (b.buchungsnummer, str(b.kunde), r.gesamtbetrag, r.rechnungsnummer) for b, r, _ in rechnungen
+            )
+
+    if not probelauf and ergebnis:
+        kennzahlen.invalidieren()
+        metriken.erstellt('rechnung', len(ergebnis))
+    return ergebnis
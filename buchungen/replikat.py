@@ -0,0 +1,161 @@
+"""Read replica - Lesezugriffe auf das Replikat umleiten
+
+With a ``replica`` alias in DATABASES, ``ReplikatRouter`` sends the reads
+of views marked with ``@nur_lesen`` (calendar, dashboard, lists, reports)
+and of the report commands (``with lesen():``) to the replica. Everything
+else reads from the primary, and all writes go to the primary.
+
+The state of a request lives in a ContextVar set by
+``ReplikatMiddleware``. It holds a dict, so reads and writes made on the
+async ORM's worker thread update the same state. Staff must always see
+their own changes although the replica lags behind: once a request has
+written to the primary, its session keeps reading from the primary for
+the rest of the session, and so do the remaining reads of that request.
+Writes are recognized by an ``execute_wrapper`` on the primary's
+connections (see ``signals.py``), not by ``db_for_write()``, which Django
+also asks when it only validates a form.
+
+Results that are cached for everybody must not come from the lagging
+replica; such code reads from the primary inside ``with primaer():``.
+
+Only models of this app are routed. Sessions, users and permissions are
+always read from the primary, otherwise a fresh login might not be found
+on the replica yet.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+REPLIKAT = 'replica'
+
+# Session key of requests pinned to the primary
+SITZUNG_PRIMAER = 'replikat_primaer'
+
+# Statements that write, when they touch a table of this app
+SCHREIBEND = {'INSERT', 'UPDATE', 'DELETE'}
+
+_zustand = ContextVar('replikat_zustand', default=None)
+
+
+def _neuer_zustand(primaer=False):
+    return {'lesen': False, 'primaer': primaer, 'geschrieben': False}
+
+
+def nur_lesen(view):
+    """Mark a view whose reads may be served by the replica"""
+    view.nur_lesen = True
+    return view
+
+
+@contextmanager
+def lesen():
+    """Read from the replica inside the block, e.g. in a report command"""
+    zustand = _neuer_zustand()
+    zustand['lesen'] = True
+    token = _zustand.set(zustand)
+    try:
+        yield
+    finally:
+        _zustand.reset(token)
+
+
+@contextmanager
+def primaer():
+    """Read from the primary inside the block, e.g. for results that get cached"""
+    zustand = _zustand.get()
+    if zustand is None or zustand['primaer']:
+        yield
+        return
+    # Same dict, so writes inside the block still pin the session
+    zustand['primaer'] = True
+    try:
+        yield
+    finally:
+        zustand['primaer'] = False
+
+
+def _schreiben_erkennen(execute, sql, params, many, context):
+    zustand = _zustand.get()
+    if (zustand is not None and not zustand['geschrieben']
+            and sql.lstrip()[:6].upper() in SCHREIBEND and 'buchungen_' in sql):
+        zustand['geschrieben'] = True
+    return execute(sql, params, many, context)
+
+
+def wrapper_installieren(verbindung):
+    """Called for every new connection, see signals.schreiben_erkennen()"""
+    if (REPLIKAT in settings.DATABASES and verbindung.alias != REPLIKAT
+            and _schreiben_erkennen not in verbindung.execute_wrappers):
+        verbindung.execute_wrappers.append(_schreiben_erkennen)
+
+
+class ReplikatRouter:
+    def _gerouted(self, model):
+        return model._meta.app_label == 'buchungen'
+
+    def db_for_read(self, model, **hints):
+        zustand = _zustand.get()
+        if (zustand and zustand['lesen'] and not zustand['primaer'] and not zustand['geschrieben']
+                and self._gerouted(model)):
+            return REPLIKAT
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # The replica is migrated by replication
+        return db != REPLIKAT
+
+
+class ReplikatMiddleware:
+    """Route the reads of ``@nur_lesen`` views to the replica, pin sessions that wrote"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if REPLIKAT not in settings.DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        zustand = _neuer_zustand()
+        token = _zustand.set(zustand)
+        try:
+            response = self.get_response(request)
+        finally:
+            _zustand.reset(token)
+        self.anheften(request, zustand)
+        return response
+
+    async def __acall__(self, request):
+        zustand = _neuer_zustand()
+        token = _zustand.set(zustand)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _zustand.reset(token)
+        self.anheften(request, zustand)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # After SessionMiddleware, so the session can be read here
+        zustand = _zustand.get()
+        if zustand is not None and getattr(view_func, 'nur_lesen', False):
+            zustand['primaer'] = request.session.get(SITZUNG_PRIMAER, False)
+            zustand['lesen'] = True
+
+    def anheften(self, request, zustand):
+        if zustand['geschrieben'] and hasattr(request, 'session'):
+            request.session[SITZUNG_PRIMAER] = True
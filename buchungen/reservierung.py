@@ -0,0 +1,55 @@
+"""Atomic reservation - Reservierung ohne Wettlauf
+
+``reserviere()`` checks availability and saves a booking in one transaction
+while the room is locked, so two concurrent bookings of the same room are
+serialized instead of both passing the check:
+
+* PostgreSQL locks the room row (``SELECT ... FOR NO KEY UPDATE``); the
+  exclusion constraint ``buchung_keine_ueberschneidung`` backs this up for
+  writers that bypass this path.
+* SQLite has no row locks; its transactions start with ``BEGIN IMMEDIATE``
+  (``transaction_mode`` in settings), which takes the database write lock
+  before the check is read.
+* On every backend the unique (raum, datum) constraint on Belegungsnacht is
+  the last line of defence and turns a lost race into ``RaumBelegt``.
+"""
+from django.db import IntegrityError, transaction
+
+from .belegung import blockiert
+from .models import Raum
+from .verfuegbarkeit import ist_verfuegbar
+
+
+class RaumBelegt(Exception):
+    """The room is taken for (part of) the requested range"""
+
+    def __init__(self, buchung):
+        self.buchung = buchung
+        super().__init__(f'Der Raum {buchung.raum.nummer} ist für den gewählten Zeitraum nicht verfügbar.')
+
+
+def sperre_raum(raum_id):
+    """Lock the room row until the end of the transaction (no-op without row locks)"""
+    list(Raum.objects.select_for_update(no_key=True).filter(pk=raum_id).values_list('pk', flat=True))
+
+
+def reserviere(buchung):
+    """Save ``buchung`` if its room is free, else raise RaumBelegt"""
+    neu, nummer = buchung._state.adding, buchung.buchungsnummer
+    try:
+        with transaction.atomic():
+            if blockiert(buchung):
+                sperre_raum(buchung.raum_id)
+                if not ist_verfuegbar(buchung.raum_id, buchung.anreise_datum, buchung.abreise_datum,
+                                      ausser_buchung=buchung.pk):
+                    raise RaumBelegt(buchung)
+            buchung.save()
+    except IntegrityError as fehler:
+        # Unique night or exclusion constraint: a concurrent writer got there first.
+        # Everything was rolled back, so is the instance
+        if neu:
+            buchung.pk = None
+            buchung._state.adding = True
+        buchung.buchungsnummer = nummer
+        raise RaumBelegt(buchung) from fehler
+    return buchung
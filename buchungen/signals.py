@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import datenbank, kennzahlen, metriken, middleware, replikat, suche
+from .models import Belegungsprotokoll, Buchung, Kunde, Raum, Rechnung, Rechnungsposten
+from .summen import summe_nachfuehren
+
+
+@receiver(post_save, sender=Kunde)
+@receiver(post_delete, sender=Kunde)
+@receiver(post_save, sender=Buchung)
+@receiver(post_delete, sender=Buchung)
+@receiver(post_save, sender=Raum)
+@receiver(post_delete, sender=Raum)
+@receiver(post_save, sender=Rechnung)
+@receiver(post_delete, sender=Rechnung)
+def kennzahlen_invalidieren(sender, **kwargs):
+    """Drop cached dashboard figures once the change is committed"""
+    # Invalidating before the commit would let a concurrent request cache the old state
+    transaction.on_commit(kennzahlen.invalidieren)
+
+
+@receiver(post_save, sender=Kunde)
+def suchindex_aktualisieren(sender, instance, **kwargs):
+    suche.backend().indexiere([instance])
+
+
+@receiver(post_delete, sender=Kunde)
+def suchindex_entfernen(sender, instance, **kwargs):
+    suche.backend().entferne([instance.pk])
+
+
+# Deletes go through signals so that queryset and cascade deletes are covered too
+@receiver(post_delete, sender=Belegungsprotokoll)
+def zusatzkosten_abziehen(sender, instance, **kwargs):
+    summe_nachfuehren(Buchung, 'zusatzkosten_summe', (instance.buchung_id, instance.gesamtbetrag), None)
+
+
+@receiver(post_delete, sender=Rechnungsposten)
+def rechnungsbetrag_abziehen(sender, instance, **kwargs):
+    summe_nachfuehren(Rechnung, 'gesamtbetrag', (instance.rechnung_id, instance.gesamtpreis), None)
+
+
+@receiver(post_save, sender=Buchung)
+@receiver(post_save, sender=Rechnung)
+def erstellt_zaehlen(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: metriken.erstellt(sender.__name__.lower()))
+
+
+@receiver(connection_created)
+def sqlite_einrichten(sender, connection, **kwargs):
+    datenbank.pragmas_setzen(connection)
+
+
+@receiver(connection_created)
+def verbindung_zaehlen(sender, connection, **kwargs):
+    metriken.DB_VERBINDUNGEN.labels(connection.alias, connection.vendor).inc()
+
+
+@receiver(connection_created)
+def sql_messen(sender, connection, **kwargs):
+    if getattr(settings, 'SQL_INSTRUMENTIERUNG', False) or getattr(settings, 'METRIKEN', False):
+        middleware.sql_wrapper_installieren(connection)
+
+
+@receiver(connection_created)
+def schreiben_erkennen(sender, connection, **kwargs):
+    replikat.wrapper_installieren(connection)
@@ -0,0 +1,248 @@
+"""Customer search - Kundensuche
+
+Ranked, index-backed search over name, e-mail and phone number of ``Kunde``.
+The backend is chosen by database vendor and can be overridden with the
+``KUNDENSUCHE_BACKEND`` setting (dotted path to a backend class):
+
+- SQLite: FTS5 table ``buchungen_kunde_suche`` with prefix indexes, kept in
+  sync by the signals in ``signals.py``, ranked with bm25().
+- PostgreSQL: pg_trgm GIN index on a generated column holding the
+  normalized search text, ranked by word similarity; phone numbers by
+  digit prefix.
+- anything else: the old ``icontains`` filter, without ranking.
+
+Names are normalized (ä -> ae, ß -> ss, accents stripped) and phone numbers
+reduced to digits, so "Müller", "Mueller" and "+49 170" / "0170" match.
+"""
+import re
+import unicodedata
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Kunde
+
+FTS_TABELLE = 'buchungen_kunde_suche'
+
+UMLAUTE = str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'})
+
+# A query made of these characters only is treated as a phone number
+TELEFON_REGEX = re.compile(r'^[\d\s+/()-]+$')
+
+
+def _ohne_akzente(text):
+    return ''.join(
+        zeichen for zeichen in unicodedata.normalize('NFKD', text)
+        if not unicodedata.combining(zeichen)
+    )
+
+
+def normalisiere_text(text):
+    """Lowercase, transliterate umlauts and strip accents"""
+    return _ohne_akzente((text or '').lower().translate(UMLAUTE))
+
+
+def text_varianten(text):
+    """Transliterated and plain-unaccented form, e.g. 'mueller muller'"""
+    varianten = [normalisiere_text(text), _ohne_akzente((text or '').lower())]
+    return ' '.join(dict.fromkeys(varianten))
+
+
+def normalisiere_telefon(nummer):
+    """Digits of a phone number in international and national form"""
+    ziffern = re.sub(r'\D', '', nummer or '')
+    if ziffern.startswith('00'):
+        ziffern = ziffern[2:]
+    varianten = [ziffern]
+    if ziffern.startswith('49'):
+        varianten.append('0' + ziffern[2:])
+    elif ziffern.startswith('0'):
+        varianten.append('49' + ziffern[1:])
+    return [v for v in varianten if v]
+
+
+def ist_telefonnummer(begriff):
+    return bool(TELEFON_REGEX.match(begriff)) and sum(z.isdigit() for z in begriff) >= 3
+
+
+class EinfacheSuche:
+    """Fallback without index: icontains over all search fields"""
+
+    def suche(self, begriff, limit):
+        kunden = Kunde.objects.filter(
+            Q(vorname__icontains=begriff) |
+            Q(nachname__icontains=begriff) |
+            Q(email__icontains=begriff) |
+            Q(telefonnummer__icontains=begriff)
+        )
+        return list(kunden.values_list('pk', flat=True)[:limit])
+
+    def indexiere(self, kunden):
+        pass
+
+    def entferne(self, kunde_ids):
+        pass
+
+    def neu_aufbauen(self):
+        pass
+
+
+class SQLiteFTSSuche(EinfacheSuche):
+    """SQLite FTS5 index with bm25 ranking and prefix matching"""
+
+    # Name matches outrank e-mail matches, which outrank phone matches
+    GEWICHTE = (10.0, 3.0, 1.0)
+
+    @staticmethod
+    def zeile(kunde_id, vorname, nachname, email, telefonnummer):
+        return (
+            kunde_id,
+            text_varianten(f'{vorname} {nachname}'),
+            normalisiere_text(email),
+            ' '.join(normalisiere_telefon(telefonnummer)),
+        )
+
+    def match_ausdruck(self, begriff):
+        if ist_telefonnummer(begriff):
+            varianten = normalisiere_telefon(begriff)
+            return 'telefon : (' + ' OR '.join(f'"{v}"*' for v in varianten) + ')'
+        tokens = re.findall(r'\w+', normalisiere_text(begriff))
+        return ' AND '.join(f'"{token}"*' for token in tokens)
+
+    def suche(self, begriff, limit):
+        ausdruck = self.match_ausdruck(begriff)
+        if not ausdruck:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABELLE} WHERE {FTS_TABELLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABELLE}, %s, %s, %s) LIMIT %s',
+                [ausdruck, *self.GEWICHTE, limit]
+            )
+            return [zeile[0] for zeile in cursor.fetchall()]
+
+    def indexiere(self, kunden):
+        zeilen = [
+            self.zeile(k.pk, k.vorname, k.nachname, k.email, k.telefonnummer)
+            for k in kunden
+        ]
+        self.schreibe(connection, zeilen)
+
+    @staticmethod
+    def schreibe(verbindung, zeilen):
+        if not zeilen:
+            return
+        with verbindung.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABELLE} WHERE rowid = %s', [(z[0],) for z in zeilen])
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABELLE} (rowid, name, email, telefon) VALUES (%s, %s, %s, %s)',
+                zeilen
+            )
+
+    def entferne(self, kunde_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABELLE} WHERE rowid = %s', [(pk,) for pk in kunde_ids])
+
+    def neu_aufbauen(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABELLE}')
+        kunden = Kunde.objects.values_list(
+            'pk', 'vorname', 'nachname', 'email', 'telefonnummer'
+        ).iterator(chunk_size=5000)
+        batch = []
+        for werte in kunden:
+            batch.append(self.zeile(*werte))
+            if len(batch) >= 5000:
+                self.schreibe(connection, batch)
+                batch = []
+        self.schreibe(connection, batch)
+
+
+class PostgresTrigrammSuche(EinfacheSuche):
+    """pg_trgm word similarity over a GIN-indexed generated search column"""
+
+    # Stored generated column of buchungen_kunde, see migration 0010
+    SPALTE = 'suchtext'
+
+    # Names transliterated (ä -> ae) and unaccented like text_varianten(),
+    # e-mail, phone digits
+    NAMEN = "lower(vorname || ' ' || nachname)"
+    AUSDRUCK = (
+        f"replace(replace(replace(replace({NAMEN}, 'ä', 'ae'), 'ö', 'oe'), 'ü', 'ue'), 'ß', 'ss') || ' ' || "
+        f"translate({NAMEN}, 'äöüàáâãåçèéêëìíîïñòóôõøùúûýÿ', 'aouaaaaaceeeeiiiinooooouuuyy') || ' ' || "
+        "lower(email) || ' ' || regexp_replace(telefonnummer, '[^0-9]', '', 'g')"
+    )
+
+    # Phone digits without a leading 00, like normalisiere_telefon(), so the
+    # international and national variants of a query match either way a
+    # number was entered. Prefix-indexed by migration 0014
+    TELEFON = "regexp_replace(regexp_replace(telefonnummer, '[^0-9]', '', 'g'), '^00', '')"
+
+    def suche(self, begriff, limit):
+        with connection.cursor() as cursor:
+            if ist_telefonnummer(begriff):
+                # Digit prefixes, like SQLiteFTSSuche: similarity ranks nearly
+                # every number alike, and short digit strings match most rows
+                varianten = normalisiere_telefon(begriff)
+                bedingung = ' OR '.join([f'{self.TELEFON} LIKE %s'] * len(varianten))
+                cursor.execute(
+                    f'SELECT id FROM buchungen_kunde WHERE {bedingung} ORDER BY nachname, vorname, id LIMIT %s',
+                    [*(variante + '%' for variante in varianten), limit]
+                )
+            else:
+                varianten = list(dict.fromkeys([begriff.lower(), normalisiere_text(begriff)]))
+                bedingung = ' OR '.join([f'%s <%% {self.SPALTE}'] * len(varianten))
+                rang = 'GREATEST(' + ', '.join([f'word_similarity(%s, {self.SPALTE})'] * len(varianten)) + ')'
+                cursor.execute(
+                    f'SELECT id FROM buchungen_kunde WHERE {bedingung} '
+                    f'ORDER BY {rang} DESC, nachname, vorname LIMIT %s',
+                    [*varianten, *varianten, limit]
+                )
+            return [zeile[0] for zeile in cursor.fetchall()]
+
+
+BACKENDS = {
+    'sqlite': SQLiteFTSSuche,
+    'postgresql': PostgresTrigrammSuche,
+}
+
+_backend = None
+
+
+def backend():
+    """Search backend for the configured database"""
+    global _backend
+    if _backend is None:
+        pfad = getattr(settings, 'KUNDENSUCHE_BACKEND', None)
+        klasse = import_string(pfad) if pfad else BACKENDS.get(connection.vendor, EinfacheSuche)
+        _backend = klasse()
+    return _backend
+
+
+def suche_kunden(begriff, limit=50):
+    """Customers matching ``begriff``, best match first"""
+    begriff = (begriff or '').strip()
+    if not begriff:
+        return []
+    ids = backend().suche(begriff, limit)
+    kunden = Kunde.objects.in_bulk(ids)
+    return [kunden[pk] for pk in ids if pk in kunden]
+
+
+async def asuche_kunden(begriff, limit=50):
+    """Async variant of suche_kunden() for the ASGI autocomplete endpoint"""
+    begriff = (begriff or '').strip()
+    if not begriff:
+        return []
+    # The backends run raw SQL, which has no async API
+    ids = await sync_to_async(backend().suche)(begriff, limit)
+    kunden = await Kunde.objects.ain_bulk(ids)
+    return [kunden[pk] for pk in ids if pk in kunden]
+
+
+def indexiere_kunden(kunden):
+    """Add or refresh index entries, for bulk writers that bypass signals"""
+    backend().indexiere(kunden)
@@ -0,0 +1,95 @@
+"""Maintained totals - mitgeführte Summen
+
+``Buchung.zusatzkosten_summe`` (sum of its Belegungsprotokoll rows) and
+``Rechnung.gesamtbetrag`` (sum of its Rechnungsposten) are stored columns.
+Saving or deleting a line item applies only the difference to the parent
+row with an ``F()`` update, so totals are plain column reads and never
+re-summed on the hot path. The update also sets the parent's
+``aktualisiert_am``, which the incremental accounting export relies on.
+``drift()`` finds parents whose stored total no longer matches their
+items, ``reparieren()`` rewrites them in one statement. Neither sends
+``post_save``, so both drop the cached dashboard figures themselves once
+the transaction commits.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import kennzahlen
+
+# parent model name -> (total field, item model name, item foreign key, item amount field)
+SUMMEN = {
+    'Buchung': ('zusatzkosten_summe', 'Belegungsprotokoll', 'buchung', 'gesamtbetrag'),
+    'Rechnung': ('gesamtbetrag', 'Rechnungsposten', 'rechnung', 'gesamtpreis'),
+}
+
+
+def summe_nachfuehren(model, feld, vorher, nachher):
+    """Apply the change of a line item to the stored total of its parent.
+
+    ``vorher`` and ``nachher`` are (parent_pk, betrag) before and after the
+    change, None for a created or deleted item.
+    """
+    deltas = defaultdict(Decimal)
+    if vorher and vorher[0]:
+        deltas[vorher[0]] -= vorher[1] or 0
+    if nachher and nachher[0]:
+        deltas[nachher[0]] += nachher[1] or 0
+    geaendert = 0
+    for pk, delta in deltas.items():
+        if delta:
+            geaendert += model.objects.filter(pk=pk).update(
+                **{feld: F(feld) + delta, 'aktualisiert_am': timezone.now()}
+            )
+    if geaendert:
+        transaction.on_commit(kennzahlen.invalidieren)
+
+
+def ohne_summenfeld(instanz, feld, kwargs):
+    """Leave the maintained total out of plain saves of existing rows.
+
+    A stale in-memory instance would otherwise overwrite deltas applied since
+    it was loaded.
+    """
+    if instanz._state.adding or kwargs.get('update_fields') is not None or kwargs.get('force_insert'):
+        return kwargs
+    kwargs['update_fields'] = [
+        f.name for f in instanz._meta.concrete_fields if not f.primary_key and f.name != feld
+    ]
+    return kwargs
+
+
+def _soll(model):
+    from django.apps import apps
+
+    feld, posten_name, fremdschluessel, betrag = SUMMEN[model.__name__]
+    posten = apps.get_model('buchungen', posten_name)
+    summe = posten.objects.filter(
+        **{fremdschluessel: OuterRef('pk')}
+    ).order_by().values(fremdschluessel).annotate(summe=Sum(betrag)).values('summe')
+    return feld, Coalesce(
+        Subquery(summe), Value(Decimal('0')), output_field=DecimalField(max_digits=10, decimal_places=2)
+    )
+
+
+def drift(model):
+    """Rows of ``model`` whose stored total differs from the sum of their items"""
+    feld, soll = _soll(model)
+    # Half a cent of tolerance: SQLite sums decimals as floats
+    return model.objects.annotate(soll=soll, abweichung=F(feld) - F('soll')).filter(
+        Q(abweichung__gt=Decimal('0.005')) | Q(abweichung__lt=Decimal('-0.005'))
+    )
+
+
+def reparieren(model, pks=None):
+    """Recompute the stored total of ``model`` rows (all, or ``pks``) in one UPDATE"""
+    feld, soll = _soll(model)
+    zeilen = model.objects.all() if pks is None else model.objects.filter(pk__in=pks)
+    anzahl = zeilen.update(**{feld: soll, 'aktualisiert_am': timezone.now()})
+    if anzahl:
+        transaction.on_commit(kennzahlen.invalidieren)
+    return anzahl
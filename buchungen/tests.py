@@ -1,3 +1,1241 @@
-from django.test import TestCase
+import csv
+import importlib
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+import zipfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from itertools import count
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.utils import load_backend
+from django.http import HttpResponse, QueryDict
+from django.template import engines
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+from prometheus_client import REGISTRY
+
+from . import auswertung, buchhaltung, datenbank, exporte, kalender, kennzahlen, pdf, replikat, reservierung, views
+from .belegung import belegte_naechte, ist_belegt
+from .forms import BuchungForm
+from .management.commands.buchungen_importieren import Command as ImportBefehl, finde_konflikte
+from .middleware import SQLInstrumentierungMiddleware
+from .models import (
+    Belegungsnacht, Belegungsprotokoll, Buchung, ExportWasserzeichen, Kunde, Raum, Raumtyp, Rechnung,
+    Rechnungsposten,
+)
+from .nummern import reserviere_nummern
+from .paginierung import keyset_seite
+from .rechnungsexport import rechnungen_auswahl, zip_stream
+from .rechnungslauf import rechnungslauf
+from .reservierung import RaumBelegt, reserviere
+from .suche import suche_kunden
+from .summen import drift, reparieren
+from .verfuegbarkeit import freie_zeitfenster, konflikte, luecken, verfuegbare_raeume
+
+START = date(2030, 3, 1)
+
+
+def tag(n):
+    """Day ``n`` relative to START"""
+    return START + timedelta(days=n)
+
+
+def neuer_kunde(nachname='Muster', vorname='Max', email=None, telefonnummer='+491701234567'):
+    return Kunde.objects.create(
+        vorname=vorname,
+        nachname=nachname,
+        email=email or f'{vorname}.{nachname}@example.com'.lower(),
+        telefonnummer=telefonnummer,
+        strasse='Hafenstraße 1',
+        plz='18055',
+        ort='Rostock',
+        datenschutz_akzeptiert=True,
+    )
+
+
+def neuer_raum(nummer, preis='100.00'):
+    raumtyp = Raumtyp.objects.create(name=f'Typ {nummer}', preis_pro_nacht=Decimal(preis))
+    return Raum.objects.create(nummer=nummer, name=f'Raum {nummer}', raumtyp=raumtyp, kapazitaet=2)
+
+
+def neue_buchung(kunde, raum, anreise, naechte, status='bestaetigt'):
+    return Buchung.objects.create(
+        kunde=kunde,
+        raum=raum,
+        anreise_datum=anreise,
+        abreise_datum=anreise + timedelta(days=naechte),
+        anlass='Test',
+        art_der_buchung='Test',
+        status=status,
+    )
+
+
+class VerfuegbarkeitTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.kunde = neuer_kunde()
+        cls.a, cls.b, cls.c = neuer_raum('A1'), neuer_raum('B1'), neuer_raum('C1')
+        cls.buchung = neue_buchung(cls.kunde, cls.a, tag(0), 3)
+        neue_buchung(cls.kunde, cls.b, tag(2), 2, status='storniert')
+        Raum.objects.filter(pk=cls.c.pk).update(ist_aktiv=False)
+
+    def test_halboffene_zeitraeume(self):
+        self.assertEqual(list(konflikte(tag(2), tag(4))), [self.buchung])
+        self.assertFalse(konflikte(tag(3), tag(5)).exists())
+        self.assertFalse(konflikte(tag(-2), tag(0)).exists())
+        self.assertFalse(konflikte(tag(0), tag(3), ausser_buchung=self.buchung.pk).exists())
+
+    def test_verfuegbare_raeume_in_einer_abfrage(self):
+        with self.assertNumQueries(1):
+            raeume = [(raum.nummer, raum.raumtyp.name) for raum in verfuegbare_raeume(tag(1), tag(2))]
+        # A1 is booked, the cancelled booking does not block B1, C1 is inactive
+        self.assertEqual(raeume, [('B1', 'Typ B1')])
+        self.assertEqual(
+            {raum.nummer for raum in verfuegbare_raeume(tag(1), tag(2), raeume=Raum.objects.all())},
+            {'B1', 'C1'}
+        )
+
+    def test_raum_und_formular_nutzen_dasselbe_praedikat(self):
+        self.assertFalse(self.a.ist_verfuegbar(tag(2), tag(5)))
+        self.assertTrue(self.a.ist_verfuegbar(tag(3), tag(5)))
+        daten = {
+            'kunde': self.kunde.pk, 'raum': self.a.pk, 'anreise_datum': tag(1), 'abreise_datum': tag(4),
+            'checkin_zeit': '14:00', 'checkout_zeit': '11:00', 'anlass': 'Test', 'art_der_buchung': 'Test',
+            'status': 'bestaetigt', 'anzahl_teilnehmer': 1,
+        }
+        # The edited booking does not conflict with itself, a new one does
+        self.assertTrue(BuchungForm(daten, instance=self.buchung).is_valid())
+        self.assertFalse(BuchungForm(daten).is_valid())
+
+
+class KalenderTests(TestCase):
+    def test_raster_mit_fester_anzahl_abfragen(self):
+        kunde = neuer_kunde()
+        raeume = [neuer_raum(f'{i}01') for i in range(1, 6)]
+        for i, raum in enumerate(raeume):
+            neue_buchung(kunde, raum, tag(i - 2), 3)
+        storniert = neue_buchung(kunde, raeume[0], tag(3), 2, status='storniert')
+        # Rooms and bookings, independent of the number of rooms and days
+        with self.assertNumQueries(2):
+            raster = kalender.baue_kalender(tag(0), tag(6), heute=tag(1))
+            zellen = {
+                zeile['raum'].nummer: [[b.kunde.nachname for b in zelle['buchungen']] for zelle in zeile['zellen']]
+                for zeile in raster['zeilen']
+            }
+        self.assertEqual(len(raster['tage']), 7)
+        self.assertEqual(zellen['101'], [['Muster']] + [[]] * 6)
+        self.assertEqual(zellen['301'], [['Muster']] * 3 + [[]] * 4)
+        self.assertEqual(zellen['501'], [[]] * 2 + [['Muster']] * 3 + [[]] * 2)
+        self.assertNotIn(storniert, [b for zeile in raster['zeilen'] for z in zeile['zellen'] for b in z['buchungen']])
+        self.assertTrue(raster['zeilen'][0]['zellen'][1]['ist_heute'])
+
+    def test_zeitraum_aus_request(self):
+        mittwoch = date(2030, 3, 6)
+        self.assertEqual(
+            kalender.zeitraum_aus_request({}, mittwoch), ('woche', date(2030, 3, 4), date(2030, 3, 10))
+        )
+        self.assertEqual(
+            kalender.zeitraum_aus_request({'ansicht': 'monat', 'datum': '2030-02-14'}, mittwoch),
+            ('monat', date(2030, 2, 1), date(2030, 2, 28))
+        )
+        # Incomplete or overlong ranges
+        self.assertEqual(kalender.zeitraum_aus_request({'ansicht': 'zeitraum'}, mittwoch)[0], 'woche')
+        ansicht, start, ende = kalender.zeitraum_aus_request(
+            {'ansicht': 'zeitraum', 'datum': '2030-01-01', 'ende': '2030-12-31'}, mittwoch
+        )
+        self.assertEqual((ende - start).days + 1, kalender.MAX_TAGE)
+
+
+class BelegungTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.kunde = neuer_kunde()
+        cls.raum = neuer_raum('101')
+
+    def naechte(self, buchung):
+        return list(Belegungsnacht.objects.filter(buchung=buchung).values_list('raum__nummer', 'datum'))
+
+    def test_speichern_haelt_naechte_aktuell(self):
+        buchung = neue_buchung(self.kunde, self.raum, tag(0), 2)
+        self.assertEqual(self.naechte(buchung), [('101', tag(0)), ('101', tag(1))])
+        buchung.anreise_datum, buchung.abreise_datum = tag(1), tag(4)
+        buchung.save()
+        self.assertEqual([datum for _, datum in self.naechte(buchung)], [tag(1), tag(2), tag(3)])
+        self.assertTrue(ist_belegt(self.raum, tag(3)))
+        self.assertEqual(belegte_naechte(tag(0)), 0)
+
+        buchung.status = 'storniert'
+        buchung.save()
+        self.assertEqual(self.naechte(buchung), [])
+        buchung.status = 'optimierung'
+        buchung.save()
+        self.assertEqual(len(self.naechte(buchung)), 3)
+        buchung.delete()
+        self.assertFalse(Belegungsnacht.objects.exists())
+
+    def test_doppelbuchung_scheitert_am_constraint(self):
+        neue_buchung(self.kunde, self.raum, tag(0), 3)
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                neue_buchung(self.kunde, self.raum, tag(2), 2)
+        # The failed save left neither the booking nor its nights behind
+        self.assertEqual(Buchung.objects.count(), 1)
+        self.assertEqual(Belegungsnacht.objects.count(), 3)
+
+    @unittest.skipIf(connection.vendor == 'postgresql', 'the exclusion constraint rejects overlapping bookings')
+    def test_neuaufbau_meldet_ueberschneidungen(self):
+        # Bulk inserts bypass save(), as historic data did
+        Buchung.objects.bulk_create([
+            Buchung(kunde=self.kunde, raum=self.raum, anreise_datum=tag(0), abreise_datum=tag(3),
+                    anlass='Test', art_der_buchung='Test', status='bestaetigt', buchungsnummer='ALT-1'),
+            Buchung(kunde=self.kunde, raum=self.raum, anreise_datum=tag(2), abreise_datum=tag(5),
+                    anlass='Test', art_der_buchung='Test', status='bestaetigt', buchungsnummer='ALT-2'),
+        ])
+        ausgabe = StringIO()
+        call_command('belegung_aufbauen', stdout=ausgabe)
+        # The earlier booking keeps the shared night
+        self.assertEqual(Belegungsnacht.objects.filter(buchung__buchungsnummer='ALT-1').count(), 3)
+        self.assertEqual(
+            list(Belegungsnacht.objects.filter(buchung__buchungsnummer='ALT-2').values_list('datum', flat=True)),
+            [tag(3), tag(4)]
+        )
+        self.assertIn('1 Buchungen überschneiden sich mit früheren Buchungen: ALT-2', ausgabe.getvalue())
+
+
+class KennzahlenTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_treffer_ohne_abfragen(self):
+        neuer_raum('101')
+        erste = kennzahlen.dashboard_kennzahlen()
+        with self.assertNumQueries(0):
+            self.assertEqual(kennzahlen.dashboard_kennzahlen(), erste)
+        self.assertEqual(kennzahlen.statistik(), {'treffer': 1, 'fehlschlaege': 1})
+
+    def test_aenderung_verwirft_cache_nach_commit(self):
+        raum = neuer_raum('101')
+        self.assertEqual(kennzahlen.dashboard_kennzahlen()['total_buchungen'], 0)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            neue_buchung(neuer_kunde(), raum, timezone.localdate(), 2)
+            # Still cached until the transaction commits
+            self.assertEqual(kennzahlen.dashboard_kennzahlen()['total_buchungen'], 0)
+        self.assertTrue(callbacks)
+        werte = kennzahlen.dashboard_kennzahlen()
+        self.assertEqual((werte['total_buchungen'], werte['aktuelle_buchungen']), (1, 1))
+        self.assertEqual(werte['auslastung'], 100)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            raum.ist_aktiv = False
+            raum.save()
+        self.assertEqual(kennzahlen.dashboard_kennzahlen()['verfuegbare_raeume'], 0)
+
+    def test_invalidierung_erreicht_andere_prozesse(self):
+        kennzahlen.dashboard_kennzahlen()
+        # Another worker process drops the figures, as signals.py does there
+        skript = 'import django; django.setup(); from buchungen import kennzahlen; kennzahlen.invalidieren()'
+        subprocess.run([sys.executable, '-c', skript], cwd=settings.BASE_DIR, check=True)
+        self.assertIsNone(cache.get(kennzahlen._cache_key(timezone.localdate())))
+
+
+class SucheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mueller = neuer_kunde('Müller', 'Jürgen', telefonnummer='+491701234567')
+        cls.mueller2 = neuer_kunde('Mueller', 'Anna', telefonnummer='030123456789')
+        cls.sommer = neuer_kunde('Sommer', 'Ole', email='ole@example.com', telefonnummer='+4940111111')
+        cls.albers = neuer_kunde('Albers', 'Ute', email='sommer@example.com', telefonnummer='+4940222222')
+        cls.sommerfeld = neuer_kunde('Sommerfeld', 'Jan', email='jan@example.com', telefonnummer='+4940333333')
+
+    def treffer(self, begriff, limit=50):
+        return [kunde.pk for kunde in suche_kunden(begriff, limit)]
+
+    def test_umlaute_und_akzente(self):
+        for begriff in ('müller', 'Mueller', 'MUE'):
+            self.assertEqual(set(self.treffer(begriff)), {self.mueller.pk, self.mueller2.pk}, begriff)
+        self.assertIn(self.mueller.pk, self.treffer('muller'))
+        self.assertEqual(self.treffer('jürgen müller'), [self.mueller.pk])
+
+    def test_telefon_national_und_international(self):
+        self.assertEqual(self.treffer('0170 123'), [self.mueller.pk])
+        self.assertEqual(self.treffer('+49 170 1234'), [self.mueller.pk])
+        self.assertEqual(self.treffer('+49 30 1234'), [self.mueller2.pk])
+        self.assertEqual(self.treffer('0049 30 12'), [self.mueller2.pk])
+        # Stored with 00 instead of +, on PostgreSQL matched by the phone digit expression
+        kranz = neuer_kunde('Kranz', 'Eva', telefonnummer='0049 40 5551234')
+        for begriff in ('040 555', '+49 40 555', '0049 40 555'):
+            self.assertEqual(self.treffer(begriff), [kranz.pk], begriff)
+
+    def test_leer_und_limit(self):
+        self.assertEqual(self.treffer('  '), [])
+        self.assertEqual(len(self.treffer('sommer', limit=1)), 1)
+
+    def test_index_folgt_aenderungen(self):
+        self.sommer.nachname = 'Winter'
+        self.sommer.save()
+        self.assertNotIn(self.sommer.pk, self.treffer('sommer'))
+        self.assertEqual(self.treffer('winter'), [self.sommer.pk])
+        self.sommer.delete()
+        self.assertEqual(self.treffer('winter'), [])
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'bm25 column weights of the FTS5 index')
+    def test_name_vor_email(self):
+        treffer = self.treffer('sommer')
+        self.assertLess(treffer.index(self.sommer.pk), treffer.index(self.albers.pk))
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'pg_trgm word similarity')
+    def test_genauer_treffer_vor_teiltreffer(self):
+        self.assertEqual(self.treffer('sommerfeld', limit=1), [self.sommerfeld.pk])
+        treffer = self.treffer('sommer')
+        self.assertLess(treffer.index(self.sommer.pk), treffer.index(self.sommerfeld.pk))
+
+
+class KeysetTests(TestCase):
+    FELDER = ['nachname', 'vorname', 'id']
+
+    @classmethod
+    def setUpTestData(cls):
+        # Duplicate names, so the primary key has to break ties
+        for nachname in ['Bauer', 'Albers', 'Bauer', 'Cordes', 'Albers', 'Dahl', 'Ernst']:
+            neuer_kunde(nachname=nachname, vorname='Eva')
+        cls.erwartet = list(Kunde.objects.order_by(*cls.FELDER).values_list('pk', flat=True))
+
+    def seite(self, cursor=None):
+        return keyset_seite(Kunde.objects.all(), self.FELDER, cursor, seitengroesse=3)
+
+    def test_vorwaerts_ohne_luecken_und_doppelte(self):
+        gesehen = []
+        seite = self.seite()
+        self.assertIsNone(seite['zurueck'])
+        while True:
+            gesehen += [kunde.pk for kunde in seite['objekte']]
+            if not seite['weiter']:
+                break
+            seite = self.seite(seite['weiter'])
+        self.assertEqual(gesehen, self.erwartet)
+
+    def test_zurueck(self):
+        zweite = self.seite(self.seite()['weiter'])
+        self.assertEqual([kunde.pk for kunde in zweite['objekte']], self.erwartet[3:6])
+        erste = self.seite(zweite['zurueck'])
+        self.assertEqual([kunde.pk for kunde in erste['objekte']], self.erwartet[:3])
+        self.assertIsNone(erste['zurueck'])
+        self.assertIsNotNone(erste['weiter'])
+
+    def test_ungueltiger_cursor_liefert_erste_seite(self):
+        for cursor in ['kaputt', 'eyJ3IjpbMV0sInIiOiJ2b3IifQ']:
+            self.assertEqual([kunde.pk for kunde in self.seite(cursor)['objekte']], self.erwartet[:3])
+
+
+class NummernkreisTests(TestCase):
+    def test_fortlaufende_nummern(self):
+        self.assertEqual(
+            reserviere_nummern('BU', 3, datum=tag(0)),
+            ['BU-20300301-0001', 'BU-20300301-0002', 'BU-20300301-0003']
+        )
+        self.assertEqual(reserviere_nummern('BU', datum=tag(0)), ['BU-20300301-0004'])
+
+    def test_eigener_kreis_je_praefix_und_periode(self):
+        reserviere_nummern('BU', 5, datum=tag(0))
+        self.assertEqual(reserviere_nummern('RE', datum=tag(0)), ['RE-20300301-0001'])
+        self.assertEqual(reserviere_nummern('BU', datum=tag(1)), ['BU-20300302-0001'])
+
+    @override_settings(NUMMERNKREIS_PERIODE='jahr')
+    def test_jahresperiode(self):
+        self.assertEqual(reserviere_nummern('RE', datum=tag(0)), ['RE-2030-000001'])
+
+    def test_rollback_gibt_nummer_zurueck(self):
+        reserviere_nummern('BU', datum=tag(0))
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                reserviere_nummern('BU', datum=tag(0))
+                raise RuntimeError
+        self.assertEqual(reserviere_nummern('BU', datum=tag(0)), ['BU-20300301-0002'])
+
+    def test_ohne_update_returning(self):
+        reserviere_nummern('BU', datum=tag(0))
+        with mock.patch.object(connection, 'vendor', 'mysql'):
+            self.assertEqual(reserviere_nummern('BU', 2, datum=tag(0)), ['BU-20300301-0002', 'BU-20300301-0003'])
+            self.assertEqual(reserviere_nummern('RE', datum=tag(0)), ['RE-20300301-0001'])
+
+
+class ImportTests(TestCase):
+    def test_ueberschneidung_im_batch_frueheste_anreise_gewinnt(self):
+        kandidaten = [(tag(10), tag(12), 0), (tag(5), tag(11), 1), (tag(12), tag(13), 2)]
+        self.assertEqual(finde_konflikte(kandidaten, []), {0})
+
+    def test_gleiche_anreise_fruehere_zeile_gewinnt(self):
+        self.assertEqual(finde_konflikte([(tag(1), tag(5), 0), (tag(1), tag(2), 1)], []), {1})
+
+    def test_bestehende_buchungen(self):
+        kandidaten = [(tag(10), tag(12), 0), (tag(5), tag(11), 1), (tag(12), tag(13), 2), (tag(0), tag(2), 3)]
+        bestehende = [(tag(1), tag(6)), (tag(13), tag(20))]
+        self.assertEqual(finde_konflikte(kandidaten, bestehende), {1, 3})
+
+    def importieren(self, zeilen, *optionen):
+        verzeichnis = tempfile.TemporaryDirectory()
+        self.addCleanup(verzeichnis.cleanup)
+        pfad = Path(verzeichnis.name) / 'buchungen.csv'
+        with open(pfad, 'w', newline='', encoding='utf-8') as datei:
+            schreiber = csv.DictWriter(datei, ['email', 'vorname', 'nachname', 'raum', 'anreise_datum', 'abreise_datum'])
+            schreiber.writeheader()
+            for email, anreise, abreise in zeilen:
+                schreiber.writerow({
+                    'email': email, 'vorname': 'Ida', 'nachname': 'Import', 'raum': '101',
+                    'anreise_datum': anreise, 'abreise_datum': abreise,
+                })
+        call_command('buchungen_importieren', str(pfad), *optionen, stdout=StringIO())
+        fehler_pfad = Path(f'{pfad}.abgelehnt.jsonl')
+        if not fehler_pfad.exists():
+            return []
+        return [json.loads(zeile) for zeile in fehler_pfad.read_text(encoding='utf-8').splitlines()]
+
+    def test_import_lehnt_konflikte_ab(self):
+        raum = neuer_raum('101')
+        neue_buchung(neuer_kunde(), raum, tag(0), 3)
+        abgelehnt = self.importieren([
+            ('a@example.com', tag(2), tag(4)),
+            ('b@example.com', tag(4), tag(6)),
+            ('a@example.com', tag(5), tag(7)),
+        ])
+        self.assertEqual([(f['zeile'], f['grund']) for f in abgelehnt], [
+            (2, 'Raum im Zeitraum bereits belegt'), (4, 'Raum im Zeitraum bereits belegt'),
+        ])
+        importiert = Buchung.objects.get(anreise_datum=tag(4))
+        self.assertEqual(importiert.kunde.email, 'b@example.com')
+        self.assertEqual(Belegungsnacht.objects.filter(buchung=importiert).count(), 2)
+
+    def test_gleichzeitige_buchung_bricht_import_nicht_ab(self):
+        # A booking committed after the sweep: the insert hits the constraint
+        raum = neuer_raum('101')
+        neue_buchung(neuer_kunde(), raum, tag(0), 3)
+        with mock.patch.object(ImportBefehl, 'ohne_konflikte', lambda self, gueltig, fehler: gueltig):
+            abgelehnt = self.importieren([
+                ('a@example.com', tag(2), tag(4)),
+                ('b@example.com', tag(5), tag(7)),
+            ])
+        self.assertEqual([f['zeile'] for f in abgelehnt], [2])
+        self.assertTrue(Buchung.objects.filter(anreise_datum=tag(5), kunde__email='b@example.com').exists())
+        self.assertFalse(Kunde.objects.filter(email='a@example.com').exists())
+
+    def test_ungueltige_zeilen(self):
+        neuer_raum('101')
+        abgelehnt = self.importieren([
+            ('', tag(0), tag(1)),
+            ('a@example.com', '01.03.2030', tag(1)),
+            ('a@example.com', tag(1), tag(1)),
+            ('a@example.com', tag(1), tag(2)),
+        ])
+        self.assertEqual([(f['zeile'], f['grund']) for f in abgelehnt], [
+            (2, 'Pflichtfelder fehlen: email'),
+            (3, 'Ungültiges Datum (erwartet JJJJ-MM-TT)'),
+            (4, 'Das Abreisedatum muss nach dem Anreisedatum liegen'),
+        ])
+        self.assertEqual(Buchung.objects.get().kunde.email, 'a@example.com')
+
+    def test_probelauf_schreibt_nichts(self):
+        neuer_raum('101')
+        self.assertEqual(self.importieren([('a@example.com', tag(0), tag(2))], '--probelauf'), [])
+        self.assertFalse(Buchung.objects.exists())
+        self.assertFalse(Kunde.objects.exists())
+
+
+class RechnungslaufTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        kunde = neuer_kunde()
+        raum = neuer_raum('101')
+        heute = timezone.localdate()
+        cls.offen = neue_buchung(kunde, raum, heute - timedelta(days=30), 2)
+        Belegungsprotokoll.objects.create(
+            buchung=cls.offen, leistung='Frühstück', datum=heute - timedelta(days=29), anzahl=2,
+            einzelpreis=Decimal('7.50')
+        )
+        neue_buchung(kunde, raum, heute - timedelta(days=20), 2, status='optimierung')
+        neue_buchung(kunde, raum, heute - timedelta(days=10), 2, status='storniert')
+        neue_buchung(kunde, raum, heute + timedelta(days=10), 2)
+
+    def test_nur_offene_buchungen(self):
+        self.assertEqual(
+            [(nummer, betrag) for nummer, _, betrag, _ in rechnungslauf(probelauf=True)],
+            [(self.offen.buchungsnummer, Decimal('215.00'))]
+        )
+        self.assertFalse(Rechnung.objects.exists())
+
+        ergebnis = rechnungslauf()
+        rechnung = Rechnung.objects.get()
+        self.assertEqual(ergebnis[0][3], rechnung.rechnungsnummer)
+        self.assertEqual(rechnung.gesamtbetrag, Decimal('215.00'))
+        self.assertEqual(
+            sorted(rechnung.posten.values_list('beschreibung', 'menge', 'gesamtpreis')),
+            [('Frühstück', 2, Decimal('15.00')), ('Raum 101 - 2 Nächte', 2, Decimal('200.00'))]
+        )
+        # Already invoiced
+        self.assertEqual(rechnungslauf(), [])
+
+    def test_auswahl_nur_offene_buchungen(self):
+        ergebnis = rechnungslauf(buchungen=Buchung.objects.all())
+        self.assertEqual([zeile[0] for zeile in ergebnis], [self.offen.buchungsnummer])
+        self.assertEqual(rechnungslauf(buchungen=Buchung.objects.all()), [])
+
+    def test_admin_meldet_uebersprungene(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'geheim'))
+        antwort = self.client.post('/admin/buchungen/buchung/', {
+            'action': 'rechnungen_erstellen',
+            '_selected_action': list(Buchung.objects.values_list('pk', flat=True)),
+        }, follow=True)
+        meldungen = [str(meldung) for meldung in antwort.context['messages']]
+        self.assertEqual(Rechnung.objects.get().buchung, self.offen)
+        self.assertIn('1 Rechnungen über 215.00 € erstellt.', meldungen)
+        self.assertTrue(any(meldung.startswith('3 Buchungen übersprungen') for meldung in meldungen))
+
+
+class PdfTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        buchung = neue_buchung(neuer_kunde(), neuer_raum('101'), tag(0), 2)
+        cls.rechnung = Rechnung.objects.create(buchung=buchung, faelligkeitsdatum=tag(14), status='fertig')
+        Rechnungsposten.objects.create(rechnung=cls.rechnung, beschreibung='Raum', menge=2, einzelpreis=Decimal('100'))
+        cls.rechnung.refresh_from_db()
+
+    def setUp(self):
+        verzeichnis = tempfile.TemporaryDirectory()
+        self.addCleanup(verzeichnis.cleanup)
+        einstellungen = override_settings(STORAGES={**settings.STORAGES, 'rechnungen': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+            'OPTIONS': {'location': verzeichnis.name},
+        }})
+        einstellungen.enable()
+        self.addCleanup(einstellungen.disable)
+        self.rendern = mock.patch.object(pdf, 'rendere_rechnung_pdf', wraps=pdf.rendere_rechnung_pdf).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def datei(self, rechnung):
+        daten = pdf.rechnung_daten(rechnung)
+        hash_wert = pdf.inhalts_hash(daten)
+        datei = pdf.rechnung_pdf_datei(rechnung, daten, hash_wert)
+        if datei is None:
+            return None
+        with datei:
+            return hash_wert, datei.read()
+
+    def test_gerendert_nur_bei_neuem_inhalt(self):
+        hash_wert, inhalt = self.datei(self.rechnung)
+        self.assertTrue(inhalt.startswith(b'%PDF'))
+        self.assertEqual(self.datei(self.rechnung), (hash_wert, inhalt))
+        self.assertEqual(self.rendern.call_count, 1)
+
+        self.rechnung.faelligkeitsdatum = tag(21)
+        neuer_hash, _ = self.datei(self.rechnung)
+        self.assertNotEqual(neuer_hash, hash_wert)
+        self.assertEqual(self.rendern.call_count, 2)
+        # Only the current file is kept
+        self.assertEqual(pdf.pdf_storage().listdir(f'rechnungen/{self.rechnung.pk}')[1], [f'{neuer_hash}.pdf'])
+
+    def test_entwurf_wird_nicht_gespeichert(self):
+        self.rechnung.status = 'entwurf'
+        self.assertIsNone(self.datei(self.rechnung))
+
+    def test_etag(self):
+        self.client.force_login(User.objects.create_user('empfang', password='geheim'))
+        url = reverse('rechnung_pdf', args=[self.rechnung.pk])
+        antwort = self.client.get(url)
+        self.assertEqual(antwort['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(antwort.streaming_content).startswith(b'%PDF'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=antwort['ETag']).status_code, 304)
+        self.assertEqual(self.rendern.call_count, 1)
+
+    def test_zip_stream(self):
+        entwurf = Rechnung.objects.create(
+            buchung=self.rechnung.buchung, faelligkeitsdatum=tag(14), rechnungsdatum=tag(1)
+        )
+        Rechnungsposten.objects.create(rechnung=entwurf, beschreibung='Extra', menge=1, einzelpreis=Decimal('5'))
+        self.datei(self.rechnung)
+
+        teile = list(zip_stream(rechnungen_auswahl(), prozesse=1))
+        # One chunk per PDF as soon as it is ready, then the central directory
+        self.assertEqual(len(teile), 3)
+        with zipfile.ZipFile(BytesIO(b''.join(teile))) as archiv:
+            self.assertEqual(sorted(archiv.namelist()), sorted([
+                f'Rechnung_{self.rechnung.rechnungsnummer}.pdf', f'Rechnung_{entwurf.rechnungsnummer}.pdf',
+            ]))
+            self.assertTrue(all(archiv.read(name).startswith(b'%PDF') for name in archiv.namelist()))
+        # The stored PDF was reused, only the draft was rendered (and not stored)
+        self.assertEqual(self.rendern.call_count, 2)
+        self.assertFalse(pdf.pdf_storage().exists(f'rechnungen/{entwurf.pk}'))
+        self.assertEqual(list(rechnungen_auswahl(von=tag(1), bis=tag(1))), [entwurf])
+
+
+class GesamtpreisTests(TestCase):
+    def test_datenbank_und_python_rechnen_gleich(self):
+        kunde = neuer_kunde()
+        mit_zusatz = neue_buchung(kunde, neuer_raum('101', preis='80.00'), tag(0), 3)
+        for anzahl, preis in ((2, '7.50'), (1, '12.25')):
+            Belegungsprotokoll.objects.create(
+                buchung=mit_zusatz, leistung='Frühstück', datum=tag(0), anzahl=anzahl, einzelpreis=Decimal(preis)
+            )
+        ohne_zusatz = neue_buchung(kunde, neuer_raum('102', preis='55.50'), tag(0), 2)
+
+        with self.assertNumQueries(1):
+            preise = {
+                buchung.pk: buchung.get_gesamtpreis()
+                for buchung in Buchung.objects.with_gesamtpreis()
+            }
+        self.assertEqual(preise, {mit_zusatz.pk: Decimal('267.25'), ohne_zusatz.pk: Decimal('111.00')})
+        # Without the annotation the instance computes the same in Python
+        self.assertEqual(Buchung.objects.get(pk=mit_zusatz.pk).get_gesamtpreis(), Decimal('267.25'))
+
+
+class SummenTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.kunde = neuer_kunde()
+        raum = neuer_raum('101')
+        cls.buchung = neue_buchung(cls.kunde, raum, tag(0), 2)
+        cls.andere = neue_buchung(cls.kunde, raum, tag(5), 2)
+
+    def protokoll(self, buchung, anzahl, einzelpreis):
+        return Belegungsprotokoll.objects.create(
+            buchung=buchung, leistung='Frühstück', datum=tag(0), anzahl=anzahl, einzelpreis=Decimal(einzelpreis)
+        )
+
+    def summe(self, buchung):
+        return Buchung.objects.values_list('zusatzkosten_summe', flat=True).get(pk=buchung.pk)
+
+    def test_deltas(self):
+        eintrag = self.protokoll(self.buchung, 2, '12.50')
+        self.protokoll(self.buchung, 1, '5.00')
+        self.assertEqual(self.summe(self.buchung), Decimal('30.00'))
+        eintrag.anzahl = 4
+        eintrag.save()
+        self.assertEqual(self.summe(self.buchung), Decimal('55.00'))
+        eintrag.buchung = self.andere
+        eintrag.save()
+        self.assertEqual(self.summe(self.buchung), Decimal('5.00'))
+        self.assertEqual(self.summe(self.andere), Decimal('50.00'))
+        eintrag.delete()
+        self.assertEqual(self.summe(self.andere), Decimal('0.00'))
+
+    def test_veraltete_instanz_ueberschreibt_summe_nicht(self):
+        veraltet = Buchung.objects.get(pk=self.buchung.pk)
+        self.protokoll(self.buchung, 1, '20.00')
+        veraltet.notizen = 'geändert'
+        veraltet.save()
+        self.assertEqual(self.summe(self.buchung), Decimal('20.00'))
+
+    def test_rechnungsbetrag(self):
+        rechnung = Rechnung.objects.create(buchung=self.buchung, faelligkeitsdatum=tag(14))
+        posten = Rechnungsposten.objects.create(rechnung=rechnung, beschreibung='Raum', menge=2, einzelpreis=Decimal('100'))
+        Rechnungsposten.objects.create(rechnung=rechnung, beschreibung='Extra', menge=1, einzelpreis=Decimal('9.90'))
+        posten.delete()
+        rechnung.refresh_from_db()
+        self.assertEqual(rechnung.gesamtbetrag, Decimal('9.90'))
+
+    def test_drift_und_reparatur(self):
+        self.protokoll(self.buchung, 1, '20.00')
+        self.assertFalse(drift(Buchung).exists())
+        Buchung.objects.filter(pk=self.buchung.pk).update(zusatzkosten_summe=Decimal('99.00'))
+        Buchung.objects.filter(pk=self.andere.pk).update(zusatzkosten_summe=Decimal('1.00'))
+        self.assertEqual(set(drift(Buchung).values_list('pk', flat=True)), {self.buchung.pk, self.andere.pk})
+        self.assertEqual(reparieren(Buchung, [self.buchung.pk]), 1)
+        self.assertEqual(list(drift(Buchung).values_list('pk', flat=True)), [self.andere.pk])
+        reparieren(Buchung)
+        self.assertFalse(drift(Buchung).exists())
+        self.assertEqual(self.summe(self.buchung), Decimal('20.00'))
+        self.assertEqual(self.summe(self.andere), Decimal('0.00'))
+
+    def test_kennzahlen_nach_summenaenderung_verworfen(self):
+        rechnung = Rechnung.objects.create(buchung=self.buchung, faelligkeitsdatum=tag(14), status='fertig')
+        cache.clear()
+        self.assertEqual(kennzahlen.dashboard_kennzahlen()['umsatz'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Rechnungsposten.objects.create(rechnung=rechnung, beschreibung='Raum', menge=1, einzelpreis=Decimal('80'))
+        self.assertEqual(kennzahlen.dashboard_kennzahlen()['umsatz'], Decimal('80'))
+        Rechnung.objects.filter(pk=rechnung.pk).update(gesamtbetrag=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            reparieren(Rechnung)
+        self.assertEqual(kennzahlen.dashboard_kennzahlen()['umsatz'], Decimal('80'))
+
+
+class ReservierungTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.kunde = neuer_kunde()
+        cls.raum = neuer_raum('101')
+        cls.bestehend = neue_buchung(cls.kunde, cls.raum, tag(0), 3)
+
+    def buchung(self, anreise, naechte, status='bestaetigt'):
+        return Buchung(
+            kunde=self.kunde, raum=self.raum, anreise_datum=anreise, abreise_datum=anreise + timedelta(days=naechte),
+            anlass='Test', art_der_buchung='Test', status=status
+        )
+
+    def test_freier_raum(self):
+        buchung = reserviere(self.buchung(tag(3), 2))
+        self.assertIsNotNone(buchung.pk)
+        self.assertEqual(Belegungsnacht.objects.filter(buchung=buchung).count(), 2)
+        # Editing a booking does not conflict with itself
+        buchung.abreise_datum = tag(6)
+        reserviere(buchung)
+        # Cancelled bookings do not block
+        reserviere(self.buchung(tag(1), 1, status='storniert'))
+
+    def test_belegter_raum(self):
+        with self.assertRaises(RaumBelegt) as fehler:
+            reserviere(self.buchung(tag(2), 2))
+        self.assertIn('Raum 101', str(fehler.exception))
+        self.assertEqual(Buchung.objects.count(), 1)
+
+    def test_verlorenes_rennen(self):
+        # The check passed, but a concurrent writer took the night before the insert
+        buchung = self.buchung(tag(2), 2)
+        with mock.patch.object(reservierung, 'ist_verfuegbar', return_value=True):
+            with self.assertRaises(RaumBelegt):
+                reserviere(buchung)
+        self.assertIsNone(buchung.pk)
+        self.assertEqual(Buchung.objects.count(), 1)
+        # The instance can be saved once the range is free
+        buchung.anreise_datum, buchung.abreise_datum = tag(3), tag(4)
+        self.assertIsNotNone(reserviere(buchung).pk)
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'exclusion constraint of migration 0008')
+    def test_migration_listet_ueberschneidungen(self):
+        migration = importlib.import_module('buchungen.migrations.0008_buchung_keine_ueberschneidung')
+        with connection.cursor() as cursor:
+            # Deferred foreign key checks of the fixtures would block the ALTER TABLE
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            cursor.execute('ALTER TABLE buchungen_buchung DROP CONSTRAINT buchung_keine_ueberschneidung')
+        # Saved without occupancy nights, like bookings from before 0003
+        alt = self.buchung(tag(2), 2)
+        alt.buchungsnummer = 'ALT-1'
+        Buchung.objects.bulk_create([alt])
+        with connection.schema_editor() as schema_editor:
+            with self.assertRaises(CommandError) as fehler:
+                migration.constraint_anlegen(None, schema_editor)
+        self.assertIn(
+            f'Raum 101: {self.bestehend.buchungsnummer} (2030-03-01 bis 2030-03-04) '
+            'und ALT-1 (2030-03-03 bis 2030-03-05)', str(fehler.exception)
+        )
+        Buchung.objects.filter(buchungsnummer='ALT-1').update(status='storniert')
+        with connection.schema_editor() as schema_editor:
+            migration.constraint_anlegen(None, schema_editor)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Buchung.objects.filter(buchungsnummer='ALT-1').update(status='bestaetigt')
+
+
+@override_settings(SQL_INSTRUMENTIERUNG=True, SQL_ABFRAGE_BUDGET=3, SQL_WIEDERHOLUNGEN=2)
+class InstrumentierungTests(TestCase):
+    def antwort(self, ansicht):
+        middleware = SQLInstrumentierungMiddleware(ansicht)
+        # Every clock reading advances one second
+        with mock.patch('time.perf_counter', side_effect=count()):
+            return middleware(RequestFactory().get('/liste/'))
+
+    def test_server_timing(self):
+        kunde = neuer_kunde()
+
+        def ansicht(request):
+            Kunde.objects.get(pk=kunde.pk)
+            inhalt = engines.all()[0].from_string('{% for i in werte %}{{ i }}{% endfor %}').render({'werte': [1, 2]})
+            return HttpResponse(inhalt)
+
+        with self.assertNoLogs('buchungen.performance'):
+            response = self.antwort(ansicht)
+        self.assertEqual(response.content, b'12')
+        sql, tpl, view, total = response['Server-Timing'].split(', ')
+        self.assertEqual(sql, 'sql;dur=1000.0;desc="1 Abfragen"')
+        self.assertEqual(tpl, 'tpl;dur=1000.0;desc="Templates"')
+        self.assertTrue(view.startswith('view;dur=') and total.startswith('total;dur='))
+
+    def test_budget_und_wiederholungen(self):
+        kunde = neuer_kunde()
+
+        def ansicht(request):
+            for _ in range(4):
+                Kunde.objects.get(pk=kunde.pk)
+            return HttpResponse()
+
+        with self.assertLogs('buchungen.performance', 'WARNING') as protokoll:
+            self.antwort(ansicht)
+        self.assertIn('GET /liste/: 4 Abfragen (Budget 3)', protokoll.output[0])
+        self.assertIn('dieselbe Abfrage 4-mal (N+1?)', protokoll.output[1])
+
+    @override_settings(SQL_INSTRUMENTIERUNG=False)
+    def test_abgeschaltet(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            SQLInstrumentierungMiddleware(lambda request: HttpResponse())
+
+
+class MetrikenTests(TestCase):
+    def wert(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_anfragen_je_url_name(self):
+        self.client.force_login(User.objects.create_user('empfang', password='geheim'))
+        vorher = self.wert('passat_http_anfragen_total', view='dashboard', methode='GET', status='200')
+        self.client.get('/')
+        self.assertEqual(self.wert('passat_http_anfragen_total', view='dashboard', methode='GET', status='200'), vorher + 1)
+        self.assertGreater(self.wert('passat_db_abfragen_total', view='dashboard'), 0)
+
+        with self.settings(DEBUG=True):
+            antwort = self.client.get('/metrics')
+        self.assertEqual(antwort.status_code, 200)
+        self.assertIn(b'passat_http_anfrage_dauer_sekunden_bucket{le="0.005",view="dashboard"}', antwort.content)
+
+    def test_erstellte_buchungen(self):
+        vorher = self.wert('passat_erstellt_total', art='buchung')
+        with self.captureOnCommitCallbacks(execute=True):
+            neue_buchung(neuer_kunde(), neuer_raum('101'), tag(0), 1)
+        self.assertEqual(self.wert('passat_erstellt_total', art='buchung'), vorher + 1)
+
+    @override_settings(METRIKEN_TOKEN='geheim')
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer falsch').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer geheim').status_code, 200)
+
+    @override_settings(METRIKEN_TOKEN='')
+    def test_ohne_token_nur_bei_debug(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+class AjaxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.benutzer = User.objects.create_user('empfang', password='geheim')
+        cls.kunde = neuer_kunde('Müller', 'Jürgen')
+        raum = neuer_raum('101')
+        neuer_raum('102')
+        neue_buchung(cls.kunde, raum, tag(0), 3)
+
+    def test_kunde_suche(self):
+        self.client.force_login(self.benutzer)
+        antwort = self.client.get('/ajax/kunde-suche/', {'q': 'muel'})
+        self.assertEqual(antwort.json(), {'results': [
+            {'id': self.kunde.pk, 'name': 'Jürgen Müller', 'email': 'jürgen.müller@example.com'},
+        ]})
+        antwort = self.client.get('/ajax/kunde-suche/')
+        self.assertEqual(antwort.json(), {'results': []})
+
+    def test_raum_suche_und_verfuegbarkeit(self):
+        self.client.force_login(self.benutzer)
+        antwort = self.client.get('/ajax/raum-suche/', {'q': '10'})
+        self.assertEqual([raum['nummer'] for raum in antwort.json()['results']], ['101', '102'])
+        antwort = self.client.get('/ajax/raum-verfuegbarkeit/', {
+            'start_datum': tag(1).isoformat(), 'end_datum': tag(2).isoformat(),
+        })
+        self.assertEqual([raum['nummer'] for raum in antwort.json()['verfuegbare_raeume']], ['102'])
+        antwort = self.client.get('/ajax/raum-verfuegbarkeit/')
+        self.assertEqual(antwort.status_code, 400)
+
+    def test_anmeldung_erforderlich(self):
+        antwort = self.client.get('/ajax/kunde-suche/', {'q': 'muel'})
+        self.assertEqual(antwort.status_code, 302)
+
+    def test_unter_wsgi_synchron(self):
+        # ASYNC_AJAX is off by default and only switched on by asgi.py
+        for pfad in ('/ajax/kunde-suche/', '/ajax/raum-suche/', '/ajax/raum-verfuegbarkeit/'):
+            self.assertFalse(iscoroutinefunction(resolve(pfad).func), pfad)
+
+    async def abruf(self, view, **parameter):
+        request = AsyncRequestFactory().get('/', parameter)
+
+        async def auser():
+            return self.benutzer
+        request.auser = auser
+        return json.loads((await view(request)).content)
+
+    async def test_asynchrone_varianten(self):
+        self.assertEqual(await self.abruf(views.akunde_suche_ajax, q='muel'), {'results': [
+            {'id': self.kunde.pk, 'name': 'Jürgen Müller', 'email': 'jürgen.müller@example.com'},
+        ]})
+        antwort = await self.abruf(views.araum_suche_ajax, q='10')
+        self.assertEqual([raum['nummer'] for raum in antwort['results']], ['101', '102'])
+        antwort = await self.abruf(
+            views.araum_verfuegbarkeit, start_datum=tag(1).isoformat(), end_datum=tag(2).isoformat()
+        )
+        self.assertEqual([raum['nummer'] for raum in antwort['verfuegbare_raeume']], ['102'])
+
+
+class ZeitfensterTests(TestCase):
+    def test_luecken(self):
+        belegungen = [(tag(3), tag(5)), (tag(8), tag(9))]
+        self.assertEqual(list(luecken(belegungen, tag(1), tag(12), 2)), [
+            (tag(1), tag(3)), (tag(5), tag(8)), (tag(9), tag(12)),
+        ])
+        self.assertEqual(list(luecken(belegungen, tag(1), tag(12), 3)), [(tag(5), tag(8)), (tag(9), tag(12))])
+
+    def test_luecken_verschachtelt_und_ueber_den_rand(self):
+        belegungen = [(tag(-2), tag(4)), (tag(1), tag(3)), (tag(6), tag(20))]
+        self.assertEqual(list(luecken(belegungen, tag(0), tag(10), 2)), [(tag(4), tag(6))])
+        self.assertEqual(list(luecken([], tag(0), tag(10), 11)), [])
+
+    def test_freie_zeitfenster(self):
+        kunde = neuer_kunde()
+        a, b, c = neuer_raum('A1'), neuer_raum('B1'), neuer_raum('C1')
+        neue_buchung(kunde, a, tag(0), 3)
+        neue_buchung(kunde, b, tag(1), 4)
+        # Arrived before the range and still running on its first night
+        neue_buchung(kunde, c, tag(-5), 7)
+        # Does not block
+        neue_buchung(kunde, c, tag(2), 5, status='storniert')
+        fenster = [
+            (f['raum'].nummer, f['anreise'], f['abreise'], f['frei_bis'])
+            for f in freie_zeitfenster(2, tag(0), tag(10))
+        ]
+        self.assertEqual(fenster, [
+            ('C1', tag(2), tag(4), tag(10)),
+            ('A1', tag(3), tag(5), tag(10)),
+            ('B1', tag(5), tag(7), tag(10)),
+        ])
+        self.assertEqual(len(freie_zeitfenster(2, tag(0), tag(10), anzahl=1)), 1)
+
+    def test_laufende_buchung_ohne_belegungsnaechte(self):
+        raum = neuer_raum('D1')
+        # Bulk inserts bypass save() and leave no Belegungsnacht rows
+        Buchung.objects.bulk_create([
+            Buchung(kunde=neuer_kunde(), raum=raum, anreise_datum=tag(-3), abreise_datum=tag(4),
+                    anlass='Test', art_der_buchung='Test', status='bestaetigt', buchungsnummer='ALT-1'),
+        ])
+        self.assertFalse(Belegungsnacht.objects.exists())
+        fenster = freie_zeitfenster(2, tag(0), tag(10))
+        self.assertEqual([(f['anreise'], f['frei_bis']) for f in fenster], [(tag(4), tag(10))])
+
+
+class AuswertungTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        kunde = neuer_kunde()
+        a, b, inaktiv = neuer_raum('101', '100.00'), neuer_raum('102', '60.00'), neuer_raum('103')
+        Raum.objects.filter(pk=inaktiv.pk).update(ist_aktiv=False)
+        for raum, anreise, naechte, status in [
+            (a, date(2030, 2, 27), 3, 'bestaetigt'),   # 1 night in March
+            (a, date(2030, 3, 30), 4, 'bestaetigt'),   # 2 in March, 2 in April
+            (a, date(2030, 4, 29), 4, 'bestaetigt'),   # 2 in April
+            (b, date(2030, 4, 10), 5, 'bestaetigt'),
+            (b, date(2030, 3, 5), 3, 'storniert'),
+            (b, date(2030, 3, 10), 2, 'optimierung'),
+            (inaktiv, date(2030, 3, 1), 10, 'bestaetigt'),
+        ]:
+            neue_buchung(kunde, raum, anreise, naechte, status)
+
+    def test_raumtyp_und_monat(self):
+        with self.assertNumQueries(2):
+            zeilen = auswertung.kennzahlen(date(2030, 3, 1), date(2030, 5, 1))
+        self.assertEqual([tuple(zeile[spalte] for spalte in auswertung.SPALTEN) for zeile in zeilen], [
+            ('Typ 101', '2030-03', 31, 3, 300.0, 9.7, 100.0, 9.68),
+            ('Typ 101', '2030-04', 30, 4, 400.0, 13.3, 100.0, 13.33),
+            ('Typ 102', '2030-03', 31, 0, 0.0, 0.0, 0.0, 0.0),
+            ('Typ 102', '2030-04', 30, 5, 300.0, 16.7, 60.0, 10.0),
+        ])
+
+    def test_gesamt_und_jahr(self):
+        self.assertEqual(auswertung.kennzahlen(date(2030, 3, 1), date(2030, 5, 1), 'gesamt', 'jahr'), [{
+            'gruppe': 'Gesamt', 'periode': '2030', 'verfuegbar': 122, 'verkauft': 12, 'umsatz': 1000.0,
+            'auslastung': 9.8, 'adr': 83.33, 'revpar': 8.2,
+        }])
+
+    def test_leerer_zeitraum(self):
+        self.assertEqual(auswertung.kennzahlen(date(2030, 3, 1), date(2030, 3, 1)), [])
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        kunde = neuer_kunde('Jürgens', 'Anna')
+        raum = neuer_raum('101', '80.00')
+        cls.buchung = neue_buchung(kunde, raum, tag(0), 2)
+        neue_buchung(kunde, raum, tag(5), 1, 'storniert')
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('empfang', password='geheim'))
+
+    def csv_zeilen(self, antwort):
+        text = b''.join(antwort.streaming_content).decode()
+        self.assertTrue(text.startswith('\ufeff'))
+        return list(csv.reader(StringIO(text[1:])))
+
+    def test_csv_mit_filter(self):
+        antwort = self.client.get(reverse('buchung_export'), {'status': 'bestaetigt'})
+        self.assertEqual(antwort['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('.csv"', antwort['Content-Disposition'])
+        kopf, *zeilen = self.csv_zeilen(antwort)
+        self.assertEqual(kopf, exporte.ueberschriften('buchungen'))
+        self.assertEqual(len(zeilen), 1)
+        self.assertEqual(zeilen[0][:-1], [
+            self.buchung.buchungsnummer, 'bestaetigt', 'Anna', 'Jürgens', '101', '2030-03-01', '2030-03-03',
+            '2', '1', 'Test', 'Test', '0.00',
+        ])
+        self.assertEqual(Decimal(zeilen[0][-1]), Decimal('160'))
+
+    def test_csv_teile_je_chunk(self):
+        with mock.patch.object(exporte, 'CHUNK_GROESSE', 1):
+            teile = list(exporte.csv_teile('buchungen', QueryDict()))
+        # Header and first row, second row, empty rest
+        self.assertEqual(len(teile), 3)
+        self.assertEqual(teile[-1], b'')
+
+    def test_xlsx_weitere_blaetter(self):
+        datei = BytesIO()
+        with mock.patch.object(exporte, 'XLSX_ZEILEN', 1):
+            self.assertEqual(exporte.xlsx_schreiben('buchungen', QueryDict(), datei), 2)
+        with zipfile.ZipFile(datei) as archiv:
+            mappe = archiv.read('xl/workbook.xml').decode()
+            self.assertIn('name="Buchungen"', mappe)
+            self.assertIn('name="Buchungen 2"', mappe)
+            blaetter = [archiv.read(f'xl/worksheets/sheet{nummer}.xml').decode() for nummer in (1, 2)]
+        self.assertEqual(sorted('storniert' in blatt for blatt in blaetter), [False, True])
+        self.assertTrue(all('<row r="2"' in blatt and '<row r="3"' not in blatt for blatt in blaetter))
+
+    def test_xlsx_leerer_export(self):
+        antwort = self.client.get(reverse('kunde_export'), {'format': 'xlsx', 'search': 'niemand'})
+        self.assertEqual(antwort['Content-Type'], exporte.FORMATE['xlsx'])
+        with zipfile.ZipFile(BytesIO(b''.join(antwort.streaming_content))) as archiv:
+            blatt = archiv.read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('Kundennummer', blatt)
+        self.assertNotIn('<row r="2"', blatt)
+
+    def test_xlsx_text_bleibt_text(self):
+        Kunde.objects.update(ort='=HYPERLINK("http://example.com")')
+        datei = BytesIO()
+        exporte.xlsx_schreiben('kunden', QueryDict(), datei)
+        with zipfile.ZipFile(datei) as archiv:
+            blatt = archiv.read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('=HYPERLINK', blatt)
+        self.assertNotIn('<f>', blatt)
+
+    def test_csv_text_bleibt_text(self):
+        Kunde.objects.update(vorname='@SUMME(A1)', nachname='-2+3', strasse='\tDurchgang', ort='=HYPERLINK("x")')
+        kopf, zeile = self.csv_zeilen(self.client.get(reverse('kunde_export')))
+        spalten = dict(zip(kopf, zeile))
+        self.assertEqual(
+            [spalten[name] for name in ('Vorname', 'Nachname', 'Telefon', 'Straße', 'PLZ', 'Ort')],
+            ["'@SUMME(A1)", "'-2+3", "'+491701234567", "'\tDurchgang", '18055', '\'=HYPERLINK("x")'],
+        )
+
+
+class BuchhaltungTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        buchung = neue_buchung(neuer_kunde(), neuer_raum('101'), tag(0), 2)
+        cls.rechnung = Rechnung.objects.create(buchung=buchung, faelligkeitsdatum=tag(14), status='fertig')
+        for beschreibung in ('Raum 101 - 2 Nächte', 'Frühstück'):
+            Rechnungsposten.objects.create(
+                rechnung=cls.rechnung, beschreibung=beschreibung, menge=1, einzelpreis=Decimal('50.00')
+            )
+        # Drafts are not exported
+        entwurf = Rechnung.objects.create(buchung=buchung, faelligkeitsdatum=tag(14))
+        Rechnungsposten.objects.create(rechnung=entwurf, beschreibung='Entwurf', menge=1, einzelpreis=Decimal('1.00'))
+
+    def setUp(self):
+        verzeichnis = tempfile.TemporaryDirectory()
+        self.addCleanup(verzeichnis.cleanup)
+        self.verzeichnis = Path(verzeichnis.name)
+
+    def exportieren(self):
+        return buchhaltung.exportieren(self.verzeichnis, verzoegerung=0)
+
+    def zeilen(self, pfad):
+        return pfad.read_text(encoding='cp1252').splitlines()[2:]
+
+    def buchungen(self, pfad):
+        """(amount, debit/credit, text) per line"""
+        return [(felder[0], felder[1], felder[13]) for felder in csv.reader(self.zeilen(pfad), delimiter=';')]
+
+    def test_inkrementell(self):
+        pfad, anzahl = self.exportieren()
+        self.assertEqual((pfad.name, anzahl), ('EXTF_Rechnungen_000001.csv', 2))
+        self.assertTrue(all(self.rechnung.rechnungsnummer in zeile for zeile in self.zeilen(pfad)))
+        self.assertIsNone(self.exportieren())
+
+        posten = self.rechnung.posten.get(beschreibung='Frühstück')
+        posten.menge = 2
+        posten.save()
+        pfad, anzahl = self.exportieren()
+        self.assertEqual((pfad.name, anzahl), ('EXTF_Rechnungen_000002.csv', 4))
+        # The exported lines are reversed, then the invoice is booked anew
+        self.assertEqual(self.buchungen(pfad), [
+            ('50,00', 'H', 'Storno Raum 101 - 2 Nächte'), ('50,00', 'H', 'Storno Frühstück'),
+            ('50,00', 'S', 'Raum 101 - 2 Nächte'), ('100,00', 'S', 'Frühstück'),
+        ])
+        self.assertEqual(sorted(p.name for p in self.verzeichnis.glob('*.csv')), [
+            'EXTF_Rechnungen_000001.csv', 'EXTF_Rechnungen_000002.csv',
+        ])
+
+    def test_bezahlt_wird_nicht_erneut_exportiert(self):
+        self.exportieren()
+        self.rechnung.status = 'bezahlt'
+        self.rechnung.save()
+        self.assertIsNone(self.exportieren())
+        self.assertEqual([p.name for p in self.verzeichnis.glob('*.csv')], ['EXTF_Rechnungen_000001.csv'])
+
+    def test_zurueck_zum_entwurf_wird_storniert(self):
+        self.exportieren()
+        self.rechnung.status = 'entwurf'
+        self.rechnung.save()
+        pfad, anzahl = self.exportieren()
+        self.assertEqual(self.buchungen(pfad), [
+            ('50,00', 'H', 'Storno Raum 101 - 2 Nächte'), ('50,00', 'H', 'Storno Frühstück'),
+        ])
+        self.rechnung.status = 'fertig'
+        self.rechnung.save()
+        pfad, anzahl = self.exportieren()
+        self.assertEqual((pfad.name, anzahl), ('EXTF_Rechnungen_000003.csv', 2))
+
+    def test_abbruch_nach_umbenennen(self):
+        with mock.patch.object(buchhaltung, '_abschliessen', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.exportieren()
+        pfad, anzahl = self.exportieren()
+        # The complete file is delivered once, only the watermark moves
+        self.assertEqual((pfad.name, anzahl), ('EXTF_Rechnungen_000001.csv', None))
+        self.assertIsNone(self.exportieren())
+        self.assertEqual(ExportWasserzeichen.objects.get().laeufe, 1)
+
+    def test_abbruch_beim_schreiben(self):
+        with mock.patch.object(buchhaltung.os, 'replace', side_effect=OSError):
+            with self.assertRaises(OSError):
+                self.exportieren()
+        self.assertEqual([p.name for p in self.verzeichnis.glob('*.csv')], [])
+        pfad, anzahl = self.exportieren()
+        self.assertEqual((pfad.name, anzahl), ('EXTF_Rechnungen_000001.csv', 2))
+        self.assertFalse(pfad.with_name(pfad.name + '.tmp').exists())
+
+    def test_zweiter_lauf_wartet(self):
+        with mock.patch.object(buchhaltung, 'naechster_lauf', return_value=None) as naechster_lauf:
+            lauf = threading.Thread(target=self.exportieren)
+            with buchhaltung._sperre(self.verzeichnis):
+                lauf.start()
+                lauf.join(0.2)
+                self.assertTrue(lauf.is_alive())
+                naechster_lauf.assert_not_called()
+            lauf.join(5)
+        naechster_lauf.assert_called_once()
+
+
+@override_settings(SQLITE_PRAGMAS={'journal_mode': 'wal', 'synchronous': 'normal', 'cache_size': -32000})
+class DatenbankTests(TestCase):
+    def sqlite_verbindung(self):
+        """A new connection to a SQLite file, independent of the test database"""
+        verzeichnis = tempfile.TemporaryDirectory()
+        self.addCleanup(verzeichnis.cleanup)
+        einstellungen = connections.configure_settings({'default': {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': f'{verzeichnis.name}/db.sqlite3',
+        }})['default']
+        verbindung = load_backend(einstellungen['ENGINE']).DatabaseWrapper(einstellungen, 'pragmas')
+        self.addCleanup(verbindung.close)
+        return verbindung
+
+    def test_pragmas_bei_neuer_verbindung(self):
+        verbindung = self.sqlite_verbindung()
+        verbindung.ensure_connection()
+        self.assertEqual(datenbank.pragmas_lesen(verbindung, ['journal_mode', 'synchronous', 'cache_size']), {
+            'journal_mode': 'wal', 'synchronous': 1, 'cache_size': -32000,
+        })
+
+    def test_ohne_einstellung_sqlite_standard(self):
+        verbindung = self.sqlite_verbindung()
+        with override_settings():
+            del settings.SQLITE_PRAGMAS
+            verbindung.ensure_connection()
+        self.assertEqual(datenbank.pragmas_lesen(verbindung, ['journal_mode'])['journal_mode'], 'delete')
+
+    def test_andere_datenbanken_unveraendert(self):
+        verbindung = mock.Mock(vendor='postgresql')
+        datenbank.pragmas_setzen(verbindung)
+        verbindung.connection.execute.assert_not_called()
+
+
+def _schreibend(sql):
+    replikat._schreiben_erkennen(lambda *args: None, sql, None, False, {})
+
+
+class ReplikatTests(TestCase):
+    def setUp(self):
+        self.router = replikat.ReplikatRouter()
+
+    def test_lesen(self):
+        self.assertEqual(self.router.db_for_read(Kunde), 'default')
+        with replikat.lesen():
+            self.assertEqual(self.router.db_for_read(Kunde), replikat.REPLIKAT)
+            # Users and sessions always come from the primary
+            self.assertEqual(self.router.db_for_read(User), 'default')
+            with replikat.primaer():
+                self.assertEqual(self.router.db_for_read(Kunde), 'default')
+            self.assertEqual(self.router.db_for_read(Kunde), replikat.REPLIKAT)
+        self.assertEqual(self.router.db_for_write(Kunde), 'default')
+        self.assertFalse(self.router.allow_migrate(replikat.REPLIKAT, 'buchungen'))
+
+    def test_eigene_aenderungen_lesen(self):
+        with replikat.lesen():
+            _schreibend('SELECT 1 FROM buchungen_kunde')
+            _schreibend('UPDATE django_session SET expire_date = NULL')
+            self.assertEqual(self.router.db_for_read(Kunde), replikat.REPLIKAT)
+            _schreibend('INSERT INTO buchungen_kunde (vorname) VALUES (%s)')
+            self.assertEqual(self.router.db_for_read(Kunde), 'default')
+
+    def test_sitzung_wird_angeheftet(self):
+        def liste(request):
+            return None
+        liste = replikat.nur_lesen(liste)
+        gelesen = []
+
+        def ansicht(request, schreiben):
+            middleware.process_view(request, liste, (), {})
+            gelesen.append(self.router.db_for_read(Kunde))
+            if schreiben:
+                _schreibend('UPDATE buchungen_buchung SET status = %s')
+                gelesen.append(self.router.db_for_read(Kunde))
+            return 'antwort'
+
+        with mock.patch.dict(settings.DATABASES, {replikat.REPLIKAT: settings.DATABASES['default']}):
+            middleware = replikat.ReplikatMiddleware(lambda request: ansicht(request, request.schreiben))
+        sitzung = SessionStore()
+        for schreiben in (False, True, False):
+            request = RequestFactory().get('/')
+            request.session, request.schreiben = sitzung, schreiben
+            self.assertEqual(middleware(request), 'antwort')
+        self.assertEqual(gelesen, [replikat.REPLIKAT, replikat.REPLIKAT, 'default', 'default'])
+        self.assertTrue(sitzung[replikat.SITZUNG_PRIMAER])
+
+        # Another session still reads from the replica
+        request = RequestFactory().get('/')
+        request.session, request.schreiben = SessionStore(), False
+        middleware(request)
+        self.assertEqual(gelesen[-1], replikat.REPLIKAT)
+
+
+class AdminUeberschneidungTests(TestCase):
+    def test_ueberschneidung_ist_formularfehler(self):
+        kunde = neuer_kunde()
+        raum = neuer_raum('101')
+        neue_buchung(kunde, raum, tag(0), 3)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'geheim'))
+        antwort = self.client.post('/admin/buchungen/buchung/add/', {
+            'kunde': kunde.pk, 'raum': raum.pk,
+            'anreise_datum': tag(2).isoformat(), 'abreise_datum': tag(4).isoformat(),
+            'checkin_zeit': '14:00', 'checkout_zeit': '11:00',
+            'anlass': 'Test', 'art_der_buchung': 'Test', 'status': 'bestaetigt', 'anzahl_teilnehmer': 1,
+            'belegungsprotokoll_set-TOTAL_FORMS': 0, 'belegungsprotokoll_set-INITIAL_FORMS': 0,
+        })
+        self.assertEqual(antwort.status_code, 200)
+        self.assertContains(antwort, 'ist für den gewählten Zeitraum nicht verfügbar')
+        self.assertEqual(Buchung.objects.count(), 1)
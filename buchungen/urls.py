@@ -1,32 +1,52 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+
+def ajax(view, async_view):
+    """The async variant under ASGI (ASYNC_AJAX), the sync view under WSGI,
+    where an async view would pay for async_to_sync on every request"""
+    return async_view if settings.ASYNC_AJAX else view
+
+
 urlpatterns = [
     # Dashboard
     path('', views.dashboard, name='dashboard'),
     
     # Customer URLs
     path('kunden/', views.kunde_liste, name='kunde_liste'),
+    path('kunden/export/', views.kunde_export, name='kunde_export'),
     path('kunden/neu/', views.kunde_anlegen, name='kunde_anlegen'),
     path('kunden/<int:pk>/', views.kunde_detail, name='kunde_detail'),
     path('kunden/<int:pk>/bearbeiten/', views.kunde_bearbeiten, name='kunde_bearbeiten'),
     
     # Booking URLs
     path('buchungen/', views.buchung_liste, name='buchung_liste'),
+    path('buchungen/export/', views.buchung_export, name='buchung_export'),
     path('buchungen/neu/', views.buchung_erstellen, name='buchung_erstellen'),
     path('buchungen/<int:pk>/', views.buchung_detail, name='buchung_detail'),
     path('buchungen/<int:pk>/bearbeiten/', views.buchung_bearbeiten, name='buchung_bearbeiten'),
     
     # Calendar
     path('kalender/', views.kalender_uebersicht, name='kalender_uebersicht'),
+    path('zeitfenster/', views.freie_zeitfenster, name='freie_zeitfenster'),
+    
+    # Reports
+    path('auswertung/', views.auswertung_uebersicht, name='auswertung_uebersicht'),
+    path('auswertung/csv/', views.auswertung_csv, name='auswertung_csv'),
     
     # Invoice URLs
     path('buchungen/<int:buchung_pk>/rechnung/neu/', views.rechnung_erstellen, name='rechnung_erstellen'),
+    path('rechnungen/export/', views.rechnung_export, name='rechnung_export'),
     path('rechnungen/<int:pk>/', views.rechnung_detail, name='rechnung_detail'),
     path('rechnungen/<int:pk>/pdf/', views.rechnung_pdf, name='rechnung_pdf'),
     
     # AJAX URLs
-    path('ajax/raum-verfuegbarkeit/', views.raum_verfuegbarkeit, name='raum_verfuegbarkeit'),
-    path('ajax/kunde-suche/', views.kunde_suche_ajax, name='kunde_suche_ajax'),
-    path('ajax/raum-suche/', views.raum_suche_ajax, name='raum_suche_ajax'),
+    path('ajax/raum-verfuegbarkeit/', ajax(views.raum_verfuegbarkeit, views.araum_verfuegbarkeit), name='raum_verfuegbarkeit'),
+    path('ajax/kunde-suche/', ajax(views.kunde_suche_ajax, views.akunde_suche_ajax), name='kunde_suche_ajax'),
+    path('ajax/raum-suche/', ajax(views.raum_suche_ajax, views.araum_suche_ajax), name='raum_suche_ajax'),
+    path('ajax/freie-zeitfenster/', views.freie_zeitfenster_json, name='freie_zeitfenster_json'),
+    path('ajax/auswertung/', views.auswertung_json, name='auswertung_json'),
+    path('ajax/kunden/', views.kunde_liste_json, name='kunde_liste_json'),
+    path('ajax/buchungen/', views.buchung_liste_json, name='buchung_liste_json'),
 ]
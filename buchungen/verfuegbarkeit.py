@@ -0,0 +1,102 @@
+"""Room availability engine - Raumverfügbarkeit
+
+Answers "which rooms are free in [start, end)" for any number of rooms with a
+single query. The overlap predicate is evaluated by the database as a
+correlated NOT EXISTS, which is covered by the composite index
+``buchung_verfuegbarkeit_idx`` on (raum, status, anreise_datum, abreise_datum).
+
+``freie_zeitfenster()`` answers the reverse question, "when is the next time
+a room is free for n nights": it loads the blocking bookings of all candidate
+rooms in one query and sweeps each room's sorted bookings for gaps.
+"""
+import heapq
+from datetime import timedelta
+from itertools import groupby, islice
+
+from django.db.models import Exists, OuterRef
+
+from .models import Buchung, Raum
+
+# Bookings in these states block a room
+BLOCKIERENDE_STATUS = ['optimierung', 'bestaetigt']
+
+
+def konflikte(start_datum, end_datum, ausser_buchung=None):
+    """Bookings that overlap the half-open range [start_datum, end_datum)"""
+    buchungen = Buchung.objects.filter(
+        status__in=BLOCKIERENDE_STATUS,
+        abreise_datum__gt=start_datum,
+        anreise_datum__lt=end_datum
+    )
+    if ausser_buchung is not None:
+        buchungen = buchungen.exclude(pk=ausser_buchung)
+    return buchungen
+
+
+def verfuegbare_raeume(start_datum, end_datum, raeume=None, ausser_buchung=None):
+    """Rooms without a conflicting booking, with Raumtyp joined in.
+
+    ``raeume`` narrows the candidate set (defaults to all active rooms),
+    ``ausser_buchung`` ignores one booking, e.g. the one being edited.
+    """
+    if raeume is None:
+        raeume = Raum.objects.filter(ist_aktiv=True)
+    belegt = konflikte(start_datum, end_datum, ausser_buchung).filter(raum=OuterRef('pk'))
+    return raeume.select_related('raumtyp').filter(~Exists(belegt))
+
+
+def ist_verfuegbar(raum, start_datum, end_datum, ausser_buchung=None):
+    """Check a single room - same predicate as verfuegbare_raeume()"""
+    return not konflikte(start_datum, end_datum, ausser_buchung).filter(raum=raum).exists()
+
+
+def luecken(belegungen, von, bis, naechte):
+    """Gaps of at least ``naechte`` nights in [von, bis) between sorted (anreise, abreise) pairs"""
+    frei_ab = von
+    for anreise, abreise in belegungen:
+        if (min(anreise, bis) - frei_ab).days >= naechte:
+            yield frei_ab, min(anreise, bis)
+        frei_ab = max(frei_ab, abreise)
+        if frei_ab >= bis:
+            return
+    if (bis - frei_ab).days >= naechte:
+        yield frei_ab, bis
+
+
+def freie_zeitfenster(naechte, von, bis, raumtyp=None, min_kapazitaet=None, anzahl=10):
+    """The first ``anzahl`` stays of ``naechte`` nights within [von, bis), earliest first.
+
+    One window per gap and room: the earliest possible arrival, with
+    ``frei_bis`` as the end of the gap, so later arrivals are visible too.
+    """
+    raeume = Raum.objects.filter(ist_aktiv=True).select_related('raumtyp')
+    if raumtyp is not None:
+        raeume = raeume.filter(raumtyp=raumtyp)
+    if min_kapazitaet:
+        raeume = raeume.filter(kapazitaet__gte=min_kapazitaet)
+    raeume = {raum.pk: raum for raum in raeume}
+    if not raeume:
+        return []
+
+    # Blocking bookings of the candidate rooms within [von, bis), in one query.
+    # Same predicate as konflikte(), so bookings without Belegungsnacht rows
+    # (bulk inserts, data from before migration 0003) block as well; the
+    # buchung_verfuegbarkeit_idx range per room covers it.
+    zeilen = konflikte(von, bis).filter(raum__in=list(raeume)).order_by(
+        'raum_id', 'anreise_datum'
+    ).values_list('raum_id', 'anreise_datum', 'abreise_datum')
+    belegungen = {
+        raum_id: [(anreise, abreise) for _, anreise, abreise in gruppe]
+        for raum_id, gruppe in groupby(zeilen, key=lambda zeile: zeile[0])
+    }
+
+    def fenster(raum):
+        for start, ende in luecken(belegungen.get(raum.pk, ()), von, bis, naechte):
+            yield start, raum.nummer, raum, ende
+
+    # Each room's gaps are already in date order, merge them lazily
+    ergebnis = heapq.merge(*(fenster(raum) for raum in raeume.values()))
+    return [
+        {'raum': raum, 'anreise': start, 'abreise': start + timedelta(days=naechte), 'frei_bis': ende}
+        for start, _, raum, ende in islice(ergebnis, anzahl)
+    ]
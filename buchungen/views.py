@@ -2,48 +2,93 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Q
-from django.http import JsonResponse, HttpResponse
+from django.http import FileResponse, HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
 from django.utils import timezone
 from datetime import datetime, timedelta
-from .models import Kunde, Raum, Raumtyp, Buchung, Rechnung, Rechnungsposten, Belegungsprotokoll
-from .forms import KundeForm, BuchungForm, RechnungForm
+from io import BytesIO, StringIO
+from .models import Kunde, Raum, Raumtyp, Buchung, Rechnung, Belegungsprotokoll
+from .forms import AuswertungForm, KundeForm, BuchungForm, RechnungForm, ZeitfensterForm
+from .replikat import nur_lesen
+from . import auswertung, exporte, kalender, kennzahlen, listen, paginierung, pdf, rechnungslauf, reservierung, suche, verfuegbarkeit
+import csv
 import json
 
 
+@nur_lesen
 @login_required
 def dashboard(request):
     """Dashboard view - Main entry point"""
-    heute = timezone.now().date()
-    
-    context = {
-        'total_kunden': Kunde.objects.count(),
-        'total_buchungen': Buchung.objects.count(),
-        'aktuelle_buchungen': Buchung.objects.filter(
-            anreise_datum__lte=heute,
-            abreise_datum__gte=heute,
-            status='bestaetigt'
-        ).count(),
-        'verfuegbare_raeume': Raum.objects.filter(ist_aktiv=True).count(),
-    }
-    return render(request, 'buchungen/dashboard.html', context)
+    return render(request, 'buchungen/dashboard.html', kennzahlen.dashboard_kennzahlen())
+
+
+def _seiten_links(request, seite):
+    """Query strings for the neighbouring pages, keeping all filters"""
+    links = {}
+    for richtung in ('weiter', 'zurueck'):
+        if seite[richtung]:
+            params = request.GET.copy()
+            params['cursor'] = seite[richtung]
+            links[richtung] = params.urlencode()
+    return links
+
+
+def _export_parameter(request):
+    """Query string for the export links: the list filters without paging"""
+    params = request.GET.copy()
+    for name in ('cursor', 'seitengroesse'):
+        params.pop(name, None)
+    return params.urlencode()
 
 
+def _kunden_seite(request):
+    """Ranked search results, or one keyset page of all customers"""
+    search_query = request.GET.get('search', '')
+    if search_query:
+        return suche.suche_kunden(search_query, limit=100), {'weiter': None, 'zurueck': None}
+    seite = paginierung.keyset_seite(
+        Kunde.objects.all(),
+        listen.KUNDE_SORTIERUNG,
+        request.GET.get('cursor'),
+        listen.seitengroesse(request.GET)
+    )
+    return seite['objekte'], seite
+
+
+@nur_lesen
 @login_required
 def kunde_liste(request):
     """Customer list view - Kundenübersicht"""
-    kunden = Kunde.objects.all()
-    
-    # Search functionality
-    search_query = request.GET.get('search', '')
-    if search_query:
-        kunden = kunden.filter(
-            Q(vorname__icontains=search_query) |
-            Q(nachname__icontains=search_query) |
-            Q(email__icontains=search_query) |
-            Q(telefonnummer__icontains=search_query)
-        )
-    
-    return render(request, 'buchungen/kunde_liste.html', {'kunden': kunden, 'search_query': search_query})
+    kunden, seite = _kunden_seite(request)
+    return render(request, 'buchungen/kunde_liste.html', {
+        'kunden': kunden,
+        'search_query': request.GET.get('search', ''),
+        'seite': _seiten_links(request, seite),
+        'export': _export_parameter(request),
+    })
+
+
+@nur_lesen
+@login_required
+def kunde_liste_json(request):
+    """Customer list as JSON - same search and paging as kunde_liste"""
+    kunden, seite = _kunden_seite(request)
+    results = [{
+        'id': kunde.id,
+        'vorname': kunde.vorname,
+        'nachname': kunde.nachname,
+        'email': kunde.email,
+        'telefonnummer': kunde.telefonnummer,
+        'ort': kunde.ort,
+    } for kunde in kunden]
+    return JsonResponse({'results': results, 'weiter': seite['weiter'], 'zurueck': seite['zurueck']})
+
+
+@nur_lesen
+@login_required
+def kunde_export(request):
+    """Customer export as CSV or XLSX - same search as kunde_liste"""
+    return exporte.export_antwort(request, 'kunden', f'Kunden_{timezone.localdate():%Y%m%d}')
 
 
 @login_required
@@ -84,21 +129,61 @@ def kunde_bearbeiten(request, pk):
 def kunde_detail(request, pk):
     """Customer detail view"""
     kunde = get_object_or_404(Kunde, pk=pk)
-    buchungen = kunde.buchungen.all()
+    buchungen = kunde.buchungen.select_related('raum').with_gesamtpreis()
     return render(request, 'buchungen/kunde_detail.html', {'kunde': kunde, 'buchungen': buchungen})
 
 
+def _buchungen_seite(request):
+    """One keyset page of the filtered bookings"""
+    buchungen, filter_werte = listen.buchungen_filtern(request.GET)
+    seite = paginierung.keyset_seite(
+        buchungen.with_gesamtpreis(),
+        listen.BUCHUNG_SORTIERUNG,
+        request.GET.get('cursor'),
+        listen.seitengroesse(request.GET)
+    )
+    return seite, filter_werte
+
+
+@nur_lesen
 @login_required
 def buchung_liste(request):
     """Booking list view"""
-    buchungen = Buchung.objects.select_related('kunde', 'raum').all()
-    
-    # Filter by status
-    status = request.GET.get('status', '')
-    if status:
-        buchungen = buchungen.filter(status=status)
-    
-    return render(request, 'buchungen/buchung_liste.html', {'buchungen': buchungen})
+    seite, filter_werte = _buchungen_seite(request)
+    context = {
+        'buchungen': seite['objekte'],
+        'seite': _seiten_links(request, seite),
+        'filter': filter_werte,
+        'export': _export_parameter(request),
+        'raeume': Raum.objects.all(),
+        'status_choices': Buchung.STATUS_CHOICES,
+    }
+    return render(request, 'buchungen/buchung_liste.html', context)
+
+
+@nur_lesen
+@login_required
+def buchung_liste_json(request):
+    """Booking list as JSON - same filters and paging as buchung_liste"""
+    seite, _ = _buchungen_seite(request)
+    results = [{
+        'id': buchung.id,
+        'buchungsnummer': buchung.buchungsnummer,
+        'kunde': str(buchung.kunde),
+        'raum': buchung.raum.nummer,
+        'anreise_datum': buchung.anreise_datum.isoformat(),
+        'abreise_datum': buchung.abreise_datum.isoformat(),
+        'status': buchung.status,
+        'gesamtpreis': str(buchung.get_gesamtpreis()),
+    } for buchung in seite['objekte']]
+    return JsonResponse({'results': results, 'weiter': seite['weiter'], 'zurueck': seite['zurueck']})
+
+
+@nur_lesen
+@login_required
+def buchung_export(request):
+    """Booking export as CSV or XLSX - same filters as buchung_liste"""
+    return exporte.export_antwort(request, 'buchungen', f'Buchungen_{timezone.localdate():%Y%m%d}')
 
 
 @login_required
@@ -109,11 +194,18 @@ def buchung_erstellen(request):
         if form.is_valid():
             buchung = form.save(commit=False)
             buchung.erstellt_von = request.user
-            buchung.save()
-            messages.success(request, f'Die Buchung {buchung.buchungsnummer} wurde erfolgreich erstellt.')
-            return redirect('buchung_detail', pk=buchung.pk)
+            try:
+                reservierung.reserviere(buchung)
+            except reservierung.RaumBelegt:
+                form.add_error(None, f'Der Raum {buchung.raum.nummer} wurde soeben für diesen Zeitraum gebucht.')
+            else:
+                messages.success(request, f'Die Buchung {buchung.buchungsnummer} wurde erfolgreich erstellt.')
+                return redirect('buchung_detail', pk=buchung.pk)
     else:
-        form = BuchungForm()
+        # Prefilled from a free window, see freie_zeitfenster
+        form = BuchungForm(initial={
+            feld: request.GET[feld] for feld in ('raum', 'anreise_datum', 'abreise_datum') if feld in request.GET
+        })
     
     return render(request, 'buchungen/buchung_form.html', {'form': form, 'title': 'Neue Buchung'})
 
@@ -121,7 +213,9 @@ def buchung_erstellen(request):
 @login_required
 def buchung_detail(request, pk):
     """Booking detail view"""
-    buchung = get_object_or_404(Buchung, pk=pk)
+    buchung = get_object_or_404(
+        Buchung.objects.select_related('kunde', 'raum__raumtyp').with_gesamtpreis(), pk=pk
+    )
     belegungsprotokolle = buchung.belegungsprotokoll_set.all()
     rechnungen = buchung.rechnungen.all()
     
@@ -142,96 +236,196 @@ def buchung_bearbeiten(request, pk):
     if request.method == 'POST':
         form = BuchungForm(request.POST, instance=buchung)
         if form.is_valid():
-            form.save()
-            messages.success(request, f'Die Buchung {buchung.buchungsnummer} wurde erfolgreich aktualisiert.')
-            return redirect('buchung_detail', pk=buchung.pk)
+            try:
+                reservierung.reserviere(form.save(commit=False))
+            except reservierung.RaumBelegt:
+                form.add_error(None, f'Der Raum {buchung.raum.nummer} wurde soeben für diesen Zeitraum gebucht.')
+            else:
+                messages.success(request, f'Die Buchung {buchung.buchungsnummer} wurde erfolgreich aktualisiert.')
+                return redirect('buchung_detail', pk=buchung.pk)
     else:
         form = BuchungForm(instance=buchung)
     
     return render(request, 'buchungen/buchung_form.html', {'form': form, 'title': 'Buchung bearbeiten', 'buchung': buchung})
 
 
+@nur_lesen
 @login_required
 def kalender_uebersicht(request):
     """Calendar overview - Kalenderübersicht"""
-    # Get current week
-    heute = timezone.now().date()
-    wochenstart = heute - timedelta(days=heute.weekday())
-    wochenende = wochenstart + timedelta(days=6)
-    
-    # Get all active rooms
-    raeume = Raum.objects.filter(ist_aktiv=True)
-    
-    # Get bookings for current week
-    buchungen = Buchung.objects.filter(
-        status__in=['optimierung', 'bestaetigt'],
-        abreise_datum__gte=wochenstart,
-        anreise_datum__lte=wochenende
-    ).select_related('kunde', 'raum')
-    
-    # Create calendar data structure
-    kalenderdaten = []
-    current_date = wochenstart
-    while current_date <= wochenende:
-        tag_buchungen = []
-        for raum in raeume:
-            raum_buchungen = buchungen.filter(
-                raum=raum,
-                anreise_datum__lte=current_date,
-                abreise_datum__gt=current_date
-            )
-            tag_buchungen.append({
-                'raum': raum,
-                'buchungen': raum_buchungen
-            })
-        
-        kalenderdaten.append({
-            'datum': current_date,
-            'ist_heute': current_date == heute,
-            'raum_buchungen': tag_buchungen
-        })
-        current_date += timedelta(days=1)
+    heute = timezone.localdate()
+    ansicht, start, ende = kalender.zeitraum_aus_request(request.GET, heute)
     
     context = {
-        'kalenderdaten': kalenderdaten,
-        'wochenstart': wochenstart,
-        'wochenende': wochenende,
+        'kalender': kalender.baue_kalender(start, ende, heute),
+        'ansicht': ansicht,
+        'wochenstart': start,
+        'wochenende': ende,
+        'navigation': kalender.navigation(ansicht, start, ende),
         'heute': heute,
     }
     return render(request, 'buchungen/kalender_uebersicht.html', context)
 
 
+def _zeitraum(request):
+    """start_datum/end_datum of an availability request, or None"""
+    start_datum_str = request.GET.get('start_datum')
+    end_datum_str = request.GET.get('end_datum')
+    if request.method == 'GET' and start_datum_str and end_datum_str:
+        return (
+            datetime.strptime(start_datum_str, '%Y-%m-%d').date(),
+            datetime.strptime(end_datum_str, '%Y-%m-%d').date(),
+        )
+    return None
+
+
+def _verfuegbarer_raum(raum):
+    return {
+        'id': raum.id,
+        'nummer': raum.nummer,
+        'name': raum.name,
+        'typ': raum.raumtyp.name,
+        'preis': str(raum.raumtyp.preis_pro_nacht)
+    }
+
+
 @login_required
 def raum_verfuegbarkeit(request):
     """Check room availability - AJAX endpoint"""
-    if request.method == 'GET':
-        start_datum_str = request.GET.get('start_datum')
-        end_datum_str = request.GET.get('end_datum')
-        
-        if start_datum_str and end_datum_str:
-            start_datum = datetime.strptime(start_datum_str, '%Y-%m-%d').date()
-            end_datum = datetime.strptime(end_datum_str, '%Y-%m-%d').date()
-            
-            verfuegbare_raeume = []
-            for raum in Raum.objects.filter(ist_aktiv=True):
-                if raum.ist_verfuegbar(start_datum, end_datum):
-                    verfuegbare_raeume.append({
-                        'id': raum.id,
-                        'nummer': raum.nummer,
-                        'name': raum.name,
-                        'typ': raum.raumtyp.name,
-                        'preis': str(raum.raumtyp.preis_pro_nacht)
-                    })
-            
-            return JsonResponse({'verfuegbare_raeume': verfuegbare_raeume})
+    zeitraum = _zeitraum(request)
+    if zeitraum:
+        verfuegbare_raeume = [_verfuegbarer_raum(raum) for raum in verfuegbarkeit.verfuegbare_raeume(*zeitraum)]
+        return JsonResponse({'verfuegbare_raeume': verfuegbare_raeume})
     
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
 
+@login_required
+async def araum_verfuegbarkeit(request):
+    """Async variant of raum_verfuegbarkeit, routed under ASGI"""
+    zeitraum = _zeitraum(request)
+    if zeitraum:
+        verfuegbare_raeume = [
+            _verfuegbarer_raum(raum) async for raum in verfuegbarkeit.verfuegbare_raeume(*zeitraum)
+        ]
+        return JsonResponse({'verfuegbare_raeume': verfuegbare_raeume})
+    
+    return JsonResponse({'error': 'Invalid request'}, status=400)
+
+
+def _zeitfenster_suche(form):
+    """Run the free window search of a bound, valid ZeitfensterForm"""
+    daten = form.cleaned_data
+    von = daten['von'] or timezone.localdate()
+    return verfuegbarkeit.freie_zeitfenster(
+        daten['naechte'],
+        von,
+        von + timedelta(days=daten['horizont']),
+        raumtyp=daten['raumtyp'],
+        min_kapazitaet=daten['kapazitaet'],
+        anzahl=daten['anzahl'] or 10
+    )
+
+
+@login_required
+def freie_zeitfenster(request):
+    """Next free stays across rooms - Freie Zeitfenster"""
+    form = ZeitfensterForm(request.GET or None)
+    fenster = _zeitfenster_suche(form) if form.is_valid() else None
+    return render(request, 'buchungen/freie_zeitfenster.html', {'form': form, 'fenster': fenster})
+
+
+@login_required
+def freie_zeitfenster_json(request):
+    """Free window search as JSON - same parameters as freie_zeitfenster"""
+    form = ZeitfensterForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'error': form.errors}, status=400)
+    results = [{
+        'raum_id': eintrag['raum'].id,
+        'raum': eintrag['raum'].nummer,
+        'typ': eintrag['raum'].raumtyp.name,
+        'kapazitaet': eintrag['raum'].kapazitaet,
+        'anreise': eintrag['anreise'].isoformat(),
+        'abreise': eintrag['abreise'].isoformat(),
+        'frei_bis': eintrag['frei_bis'].isoformat(),
+    } for eintrag in _zeitfenster_suche(form)]
+    return JsonResponse({'results': results})
+
+
+def _auswertung(request):
+    """Report rows for the GET parameters; defaults to the current year by Raumtyp and month"""
+    form = AuswertungForm(request.GET)
+    daten = form.cleaned_data if form.is_valid() else {}
+    heute = timezone.localdate()
+    von = daten.get('von') or heute.replace(month=1, day=1)
+    bis = daten.get('bis') or von.replace(year=von.year + 1) - timedelta(days=1)
+    if bis < von:
+        bis = von
+    parameter = {
+        'von': von,
+        'bis': bis,
+        'gruppierung': daten.get('gruppierung') or 'raumtyp',
+        'periode': daten.get('periode') or 'monat',
+    }
+    zeilen = auswertung.kennzahlen(
+        von, bis + timedelta(days=1), parameter['gruppierung'], parameter['periode']
+    ) if form.is_valid() else []
+    return form, parameter, zeilen
+
+
+@nur_lesen
+@login_required
+def auswertung_uebersicht(request):
+    """Occupancy, ADR and RevPAR report - Auswertung"""
+    form, parameter, zeilen = _auswertung(request)
+    return render(request, 'buchungen/auswertung.html', {
+        'form': form,
+        'parameter': parameter,
+        'zeilen': zeilen,
+        'gruppe_label': auswertung.GRUPPIERUNGEN[parameter['gruppierung']],
+        'export': request.GET.urlencode(),
+    })
+
+
+@nur_lesen
+@login_required
+def auswertung_csv(request):
+    """Report as CSV download - same parameters as auswertung_uebersicht"""
+    form, parameter, zeilen = _auswertung(request)
+    if not form.is_valid():
+        return JsonResponse({'error': form.errors}, status=400)
+    puffer = StringIO()
+    writer = csv.DictWriter(puffer, fieldnames=auswertung.SPALTEN)
+    writer.writeheader()
+    writer.writerows(zeilen)
+    response = HttpResponse(puffer.getvalue(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = (
+        f'attachment; filename="Auswertung_{parameter["von"]:%Y%m%d}_{parameter["bis"]:%Y%m%d}.csv"'
+    )
+    return response
+
+
+@nur_lesen
+@login_required
+def auswertung_json(request):
+    """Report as JSON - same parameters as auswertung_uebersicht"""
+    form, parameter, zeilen = _auswertung(request)
+    if not form.is_valid():
+        return JsonResponse({'error': form.errors}, status=400)
+    return JsonResponse({
+        'von': parameter['von'].isoformat(),
+        'bis': parameter['bis'].isoformat(),
+        'gruppierung': parameter['gruppierung'],
+        'periode': parameter['periode'],
+        'results': zeilen,
+    })
+
+
 @login_required
 def rechnung_erstellen(request, buchung_pk):
     """Create invoice for booking - Rechnung erstellen"""
-    buchung = get_object_or_404(Buchung, pk=buchung_pk)
+    buchung = get_object_or_404(Buchung.objects.select_related('raum__raumtyp'), pk=buchung_pk)
     
     if request.method == 'POST':
         form = RechnungForm(request.POST)
@@ -239,29 +433,10 @@ def rechnung_erstellen(request, buchung_pk):
             rechnung = form.save(commit=False)
             rechnung.buchung = buchung
             rechnung.erstellt_von = request.user
-            rechnung.save()
-            
-            # Create invoice items from booking
-            if buchung.raum and buchung.anzahl_naechte:
-                Rechnungsposten.objects.create(
-                    rechnung=rechnung,
-                    beschreibung=f"Raum {buchung.raum.nummer} - {buchung.anzahl_naechte} Nächte",
-                    menge=buchung.anzahl_naechte,
-                    einzelpreis=buchung.raum.raumtyp.preis_pro_nacht
-                )
-            
-            # Add items from Belegungsprotokoll
-            for protokoll in buchung.belegungsprotokoll_set.all():
-                Rechnungsposten.objects.create(
-                    rechnung=rechnung,
-                    beschreibung=protokoll.leistung,
-                    menge=protokoll.anzahl,
-                    einzelpreis=protokoll.einzelpreis
-                )
             
-            # Calculate total
-            rechnung.gesamtbetrag = rechnung.berechne_gesamtbetrag()
-            rechnung.save()
+            # Invoice items from booking and Belegungsprotokoll, total computed in memory
+            posten, summe = rechnungslauf.rechnungsposten_fuer(buchung, buchung.belegungsprotokoll_set.all())
+            rechnungslauf.speichere_rechnung(rechnung, posten, summe)
             
             messages.success(request, f'Die Rechnung {rechnung.rechnungsnummer} wurde erfolgreich erstellt.')
             return redirect('rechnung_detail', pk=rechnung.pk)
@@ -287,101 +462,76 @@ def rechnung_detail(request, pk):
 
 @login_required
 def rechnung_pdf(request, pk):
-    """Generate PDF invoice"""
-    from reportlab.lib.pagesizes import A4
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.units import cm
-    from io import BytesIO
-    
-    rechnung = get_object_or_404(Rechnung, pk=pk)
-    kunde = rechnung.buchung.kunde
-    
-    # Create PDF
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-    
-    # Header
-    p.setFont("Helvetica-Bold", 16)
-    p.drawString(2*cm, height - 2*cm, "Passat Buchungssystem")
-    
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(2*cm, height - 3*cm, "RECHNUNG")
-    
-    # Invoice details
-    p.setFont("Helvetica", 10)
-    y_position = height - 4*cm
-    p.drawString(2*cm, y_position, f"Rechnungsnummer: {rechnung.rechnungsnummer}")
-    y_position -= 0.5*cm
-    p.drawString(2*cm, y_position, f"Rechnungsdatum: {rechnung.rechnungsdatum.strftime('%d.%m.%Y')}")
-    y_position -= 0.5*cm
-    p.drawString(2*cm, y_position, f"Fälligkeitsdatum: {rechnung.faelligkeitsdatum.strftime('%d.%m.%Y')}")
-    
-    # Customer details
-    y_position -= 1.5*cm
-    p.setFont("Helvetica-Bold", 11)
-    p.drawString(2*cm, y_position, "Kunde:")
-    y_position -= 0.5*cm
-    p.setFont("Helvetica", 10)
-    p.drawString(2*cm, y_position, f"{kunde.vorname} {kunde.nachname}")
-    y_position -= 0.5*cm
-    p.drawString(2*cm, y_position, kunde.strasse)
-    y_position -= 0.5*cm
-    p.drawString(2*cm, y_position, f"{kunde.plz} {kunde.ort}")
-    
-    # Invoice items
-    y_position -= 1.5*cm
-    p.setFont("Helvetica-Bold", 11)
-    p.drawString(2*cm, y_position, "Rechnungsposten:")
-    y_position -= 0.7*cm
-    
-    p.setFont("Helvetica-Bold", 9)
-    p.drawString(2*cm, y_position, "Beschreibung")
-    p.drawString(10*cm, y_position, "Menge")
-    p.drawString(12*cm, y_position, "Einzelpreis")
-    p.drawString(15*cm, y_position, "Gesamtpreis")
-    y_position -= 0.5*cm
-    
-    p.setFont("Helvetica", 9)
-    for posten in rechnung.posten.all():
-        p.drawString(2*cm, y_position, posten.beschreibung[:40])
-        p.drawString(10*cm, y_position, str(posten.menge))
-        p.drawString(12*cm, y_position, f"€ {posten.einzelpreis:.2f}")
-        p.drawString(15*cm, y_position, f"€ {posten.gesamtpreis:.2f}")
-        y_position -= 0.5*cm
-    
-    # Total
-    y_position -= 0.5*cm
-    p.setFont("Helvetica-Bold", 11)
-    p.drawString(12*cm, y_position, "Gesamtbetrag:")
-    p.drawString(15*cm, y_position, f"€ {rechnung.gesamtbetrag:.2f}")
-    
-    p.showPage()
-    p.save()
-    
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="Rechnung_{rechnung.rechnungsnummer}.pdf"'
-    
+    """Serve the invoice PDF, stored once the invoice is finished"""
+    rechnung = get_object_or_404(Rechnung.objects.select_related('buchung__kunde'), pk=pk)
+    daten = pdf.rechnung_daten(rechnung)
+    hash_wert = pdf.inhalts_hash(daten)
+    etag = f'"{hash_wert}"'
+
+    nicht_geaendert = get_conditional_response(request, etag=etag)
+    if nicht_geaendert is not None:
+        return nicht_geaendert
+
+    datei = pdf.rechnung_pdf_datei(rechnung, daten, hash_wert)
+    if datei is None:
+        datei = BytesIO(pdf.rendere_rechnung_pdf(daten))
+    response = FileResponse(
+        datei, as_attachment=True, filename=pdf.dateiname(daten), content_type='application/pdf'
+    )
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
     return response
 
 
+@nur_lesen
+@login_required
+def rechnung_export(request):
+    """Invoice export as CSV or XLSX, filtered by status and invoice date (von/bis)"""
+    return exporte.export_antwort(request, 'rechnungen', f'Rechnungen_{timezone.localdate():%Y%m%d}')
+
+
+def _kunde_treffer(kunde):
+    return {
+        'id': kunde.id,
+        'name': f"{kunde.vorname} {kunde.nachname}",
+        'email': kunde.email
+    }
+
+
+def _raum_treffer(raum):
+    return {
+        'id': raum.id,
+        'nummer': raum.nummer,
+        'name': raum.name,
+        'typ': raum.raumtyp.name
+    }
+
+
+def _raeume_zur_suche(query):
+    return Raum.objects.select_related('raumtyp').filter(
+        Q(nummer__icontains=query) |
+        Q(name__icontains=query),
+        ist_aktiv=True
+    )[:10]
+
+
 @login_required
 def kunde_suche_ajax(request):
     """AJAX endpoint for customer autocomplete"""
     query = request.GET.get('q', '')
     if query:
-        kunden = Kunde.objects.filter(
-            Q(vorname__icontains=query) |
-            Q(nachname__icontains=query)
-        )[:10]
-        
-        results = [{
-            'id': kunde.id,
-            'name': f"{kunde.vorname} {kunde.nachname}",
-            'email': kunde.email
-        } for kunde in kunden]
-        
+        results = [_kunde_treffer(kunde) for kunde in suche.suche_kunden(query, limit=10)]
+        return JsonResponse({'results': results})
+    
+    return JsonResponse({'results': []})
+
+
+@login_required
+async def akunde_suche_ajax(request):
+    """Async variant of kunde_suche_ajax, routed under ASGI"""
+    query = request.GET.get('q', '')
+    if query:
+        results = [_kunde_treffer(kunde) for kunde in await suche.asuche_kunden(query, limit=10)]
         return JsonResponse({'results': results})
     
     return JsonResponse({'results': []})
@@ -392,19 +542,18 @@ def raum_suche_ajax(request):
     """AJAX endpoint for room autocomplete"""
     query = request.GET.get('q', '')
     if query:
-        raeume = Raum.objects.filter(
-            Q(nummer__icontains=query) |
-            Q(name__icontains=query),
-            ist_aktiv=True
-        )[:10]
-        
-        results = [{
-            'id': raum.id,
-            'nummer': raum.nummer,
-            'name': raum.name,
-            'typ': raum.raumtyp.name
-        } for raum in raeume]
-        
+        results = [_raum_treffer(raum) for raum in _raeume_zur_suche(query)]
+        return JsonResponse({'results': results})
+    
+    return JsonResponse({'results': []})
+
+
+@login_required
+async def araum_suche_ajax(request):
+    """Async variant of raum_suche_ajax, routed under ASGI"""
+    query = request.GET.get('q', '')
+    if query:
+        results = [_raum_treffer(raum) async for raum in _raeume_zur_suche(query)]
         return JsonResponse({'results': results})
     
     return JsonResponse({'results': []})
@@ -0,0 +1,23 @@
+"""Template backend with render timing - Vorlagen
+
+``MessendeDjangoTemplates`` is Django's template backend, except that its
+templates report their render time to ``SQLInstrumentierungMiddleware``
+(the ``tpl`` entry of the ``Server-Timing`` header). Included and extended
+templates render inside the outer one and are not counted separately.
+"""
+from django.template.backends.django import DjangoTemplates, Template
+
+from .middleware import template_zeit_messen
+
+
+class MessendesTemplate(Template):
+    def render(self, context=None, request=None):
+        return template_zeit_messen(super().render, context, request)
+
+
+class MessendeDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return MessendesTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return MessendesTemplate(super().get_template(template_name).template, self)
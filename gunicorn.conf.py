@@ -0,0 +1,25 @@
+"""gunicorn settings: gunicorn -c gunicorn.conf.py passat_buchungssystem.wsgi
+
+or, for the async AJAX views, as ASGI:
+gunicorn -c gunicorn.conf.py -k uvicorn_worker.UvicornWorker passat_buchungssystem.asgi:application
+
+Prometheus multiprocess mode: every worker writes its metrics to files in
+PROMETHEUS_MULTIPROC_DIR, /metrics aggregates them. The directory is
+emptied when the master starts and files of exited workers are merged.
+"""
+import multiprocessing
+import os
+import shutil
+
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+
+def on_starting(server):
+    verzeichnis = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/passat-metriken')
+    shutil.rmtree(verzeichnis, ignore_errors=True)
+    os.makedirs(verzeichnis)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
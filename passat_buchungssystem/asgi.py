@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'passat_buchungssystem.settings')
+# Async variants of the AJAX views, see ASYNC_AJAX in settings.py
+os.environ.setdefault('ASYNC_AJAX', '1')
 
 application = get_asgi_application()
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -41,11 +44,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so that they measure the whole request
+    'buchungen.middleware.MetrikenMiddleware',
+    'buchungen.middleware.SQLInstrumentierungMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # After the session, to pin sessions that wrote to the primary
+    'buchungen.replikat.ReplikatMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -54,7 +62,8 @@ ROOT_URLCONF = 'passat_buchungssystem.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that reports render time to SQLInstrumentierungMiddleware
+        'BACKEND': 'buchungen.vorlagen.MessendeDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -69,16 +78,109 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'passat_buchungssystem.wsgi.application'
 
+# Route the AJAX endpoints to their async views; asgi.py switches this on.
+# Under WSGI the sync views skip the async_to_sync round trip per request
+ASYNC_AJAX = os.environ.get('ASYNC_AJAX', '0') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
-
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+#
+# SQLite by default. DB_ENGINE=postgresql switches to PostgreSQL, configured
+# by DB_NAME, DB_USER, DB_PASSWORD, DB_HOST and DB_PORT. Connections come
+# from a psycopg pool per process (DB_POOL_MIN/DB_POOL_MAX; keep workers x
+# DB_POOL_MAX below max_connections), or with DB_POOL=0 are kept open for
+# DB_CONN_MAX_AGE seconds, e.g. behind PgBouncer.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'passat'),
+            'USER': os.environ.get('DB_USER', 'passat'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+        }
+    }
+    if os.environ.get('DB_POOL', '1') == '1':
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.environ.get('DB_POOL_MIN', 2)),
+                'max_size': int(os.environ.get('DB_POOL_MAX', 10)),
+                'timeout': 10,
+            },
+        }
+    else:
+        DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+        DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # Take the write lock at BEGIN, so a transaction that reads before
+                # writing (availability check, then insert) cannot be overtaken
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+        }
+    }
+    # Applied to every new connection (see buchungen/datenbank.py). In WAL mode
+    # readers do not block the writer; synchronous=NORMAL is safe with WAL and
+    # may only lose the last commits on power failure, never corrupt the file
+    SQLITE_PRAGMAS = {
+        'busy_timeout': 20000,
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'cache_size': -32000,
+        'mmap_size': 268435456,
+        'temp_store': 'memory',
+    }
+else:
+    raise ImproperlyConfigured(f"DB_ENGINE must be 'sqlite' or 'postgresql', not {DB_ENGINE!r}")
+
+# Optional read replica for calendar, dashboard, lists and reports (see
+# buchungen/replikat.py): DB_REPLICA_HOST/DB_REPLICA_PORT for PostgreSQL,
+# DB_REPLICA_NAME for another database name or SQLite file. Without them
+# everything runs on 'default'.
+if os.environ.get('DB_REPLICA_HOST') or os.environ.get('DB_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'OPTIONS': dict(DATABASES['default'].get('OPTIONS', {})),
+        'NAME': os.environ.get('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    if DB_ENGINE == 'postgresql':
+        DATABASES['replica']['HOST'] = os.environ.get('DB_REPLICA_HOST', DATABASES['default']['HOST'])
+        DATABASES['replica']['PORT'] = os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT'])
+    DATABASE_ROUTERS = ['buchungen.replikat.ReplikatRouter']
+
+
+# Cache
+# Shared by all worker processes (gunicorn.conf.py starts several), so that
+# the invalidation of the dashboard figures reaches every worker: Redis if
+# CACHE_REDIS_URL is set (needs the redis package), otherwise files in
+# CACHE_VERZEICHNIS. A per-process LocMemCache would keep serving figures
+# that another worker has invalidated.
+
+if os.environ.get('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['CACHE_REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_VERZEICHNIS', BASE_DIR / 'cache'),
+        }
     }
-}
 
 
 # Password validation
@@ -122,6 +224,62 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Rendered invoice PDFs are kept outside MEDIA_ROOT so they are never served
+# without the login check; any Django storage backend can be configured here
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    'rechnungen': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': BASE_DIR / 'archiv'},
+    },
+}
+
+# Booking and invoice numbers restart every 'tag' (BU-YYYYMMDD-NNNN)
+# or every 'jahr' (BU-YYYY-NNNNNN)
+NUMMERNKREIS_PERIODE = 'tag'
+
+# Incremental accounting export (buchhaltung_exportieren): DATEV-style
+# batch files for the bookkeeping import. Invoice lines are booked from the
+# debtor account against the revenue account. Invoices changed less than
+# BUCHHALTUNG_VERZOEGERUNG seconds ago wait for the next run, so the export
+# never overtakes a transaction that has not committed yet
+BUCHHALTUNG_VERZEICHNIS = BASE_DIR / 'buchhaltung'
+BUCHHALTUNG_BERATER = os.environ.get('BUCHHALTUNG_BERATER', '')
+BUCHHALTUNG_MANDANT = os.environ.get('BUCHHALTUNG_MANDANT', '')
+BUCHHALTUNG_DEBITORENKONTO = '10000'
+BUCHHALTUNG_ERLOESKONTO = '8400'
+BUCHHALTUNG_VERZOEGERUNG = 300
+
+# Per-request SQL and timing figures as Server-Timing header, with warnings on
+# the 'buchungen.performance' logger above the query budget or when one
+# statement repeats more than SQL_WIEDERHOLUNGEN times (N+1)
+SQL_INSTRUMENTIERUNG = os.environ.get('SQL_INSTRUMENTIERUNG', '1' if DEBUG else '0') == '1'
+SQL_ABFRAGE_BUDGET = 50
+SQL_WIEDERHOLUNGEN = 10
+
+# Prometheus metrics at /metrics; scrapers must send 'Authorization: Bearer
+# <token>'. Without METRIKEN_TOKEN the endpoint answers 403 unless DEBUG is on.
+# Multiple worker processes need
+# PROMETHEUS_MULTIPROC_DIR (see gunicorn.conf.py)
+METRIKEN = True
+METRIKEN_TOKEN = os.environ.get('METRIKEN_TOKEN', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'buchungen': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
 # Login URL
 LOGIN_URL = '/admin/login/'
 LOGIN_REDIRECT_URL = '/'
@@ -16,8 +16,10 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from buchungen import metriken
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metriken.metrics, name='metrics'),
     path('', include('buchungen.urls')),
 ]
@@ -0,0 +1,55 @@
+#!/bin/bash
+# Passat Buchungssystem - Migrationen, Tests und Benchmark gegen PostgreSQL
+#
+# Ohne DB_HOST wird eine lokale PostgreSQL-Instanz in einem temporären
+# Verzeichnis gestartet (initdb/pg_ctl aus PG_BIN oder dem PATH, nicht als root)
+# und am Ende wieder beendet. Mit DB_HOST wird der angegebene Server genutzt.
+# Weitere Argumente gehen an benchmark_views, z.B. --speichern.
+
+export DB_ENGINE=postgresql
+export DB_NAME=${DB_NAME:-passat}
+export DB_USER=${DB_USER:-postgres}
+export DB_PORT=${DB_PORT:-5433}
+
+fehler() {
+    echo "❌ $1"
+    exit 1
+}
+
+if [ -z "$DB_HOST" ]; then
+    PG_BIN=${PG_BIN:-$(dirname "$(command -v pg_ctl || command -v initdb || echo /usr/lib/postgresql/bin/pg_ctl)")}
+    [ -x "$PG_BIN/initdb" ] || fehler "initdb nicht gefunden, PG_BIN setzen oder DB_HOST angeben"
+    PG_DATEN=$(mktemp -d)
+    trap '"$PG_BIN/pg_ctl" -D "$PG_DATEN" stop -m fast > /dev/null; rm -rf "$PG_DATEN"' EXIT
+
+    echo "🐘 Starte lokale PostgreSQL-Instanz ($("$PG_BIN/postgres" --version))..."
+    "$PG_BIN/initdb" -D "$PG_DATEN" -U "$DB_USER" -A trust --no-sync > /dev/null || fehler "initdb fehlgeschlagen"
+    "$PG_BIN/pg_ctl" -D "$PG_DATEN" -l "$PG_DATEN/log" -w \
+        -o "-p $DB_PORT -k $PG_DATEN -c listen_addresses=127.0.0.1 -c fsync=off" start > /dev/null \
+        || fehler "PostgreSQL startet nicht, siehe $PG_DATEN/log"
+    "$PG_BIN/createdb" -h 127.0.0.1 -p "$DB_PORT" -U "$DB_USER" "$DB_NAME" || fehler "createdb fehlgeschlagen"
+    export DB_HOST=127.0.0.1
+fi
+echo "✓ Datenbank $DB_NAME auf $DB_HOST:$DB_PORT"
+echo ""
+
+echo "🗄️  Migrationen..."
+python3 manage.py migrate --no-input || fehler "migrate fehlgeschlagen"
+python3 manage.py makemigrations --check --dry-run > /dev/null || fehler "Modelle ohne Migration"
+# Every migration must also run backwards
+python3 manage.py migrate buchungen zero --no-input > /dev/null || fehler "Migrationen lassen sich nicht zurücknehmen"
+python3 manage.py migrate --no-input > /dev/null || fehler "erneutes migrate fehlgeschlagen"
+python3 manage.py check > /dev/null || fehler "check fehlgeschlagen"
+echo "✓ Migrationen vorwärts und rückwärts"
+echo ""
+
+echo "🧪 Tests..."
+python3 manage.py test --no-input || fehler "Tests fehlgeschlagen"
+echo ""
+
+echo "⏱️  Benchmark..."
+python3 manage.py load_sample_data > /dev/null || fehler "Beispieldaten fehlgeschlagen"
+python3 manage.py testdaten_generieren --raeume 20 --kunden 2000 --jahre 1 > /dev/null || fehler "Testdaten fehlgeschlagen"
+python3 manage.py benchmark_views "$@" || fehler "Benchmark fehlgeschlagen"
+echo ""
+echo "✅ PostgreSQL-Prüfung erfolgreich"